@@ -1,8 +1,11 @@
 """
 Пакет содержит API для работы с проектами и расписаниями задач.
 """
-from pjplan.wbs import Task, WBS
-from pjplan.calendar import IWorkCalendar, WeeklyCalendar, DirectCalendar, FixedCalendar, DEFAULT_CALENDAR
+from pjplan.wbs import Task, WBS, WBSBuilder
+from pjplan.task import TaskQuery, TaskRollup, TaskChange
+from pjplan.frame import TaskFrame
+from pjplan.calendar import IWorkCalendar, WeeklyCalendar, DirectCalendar, FixedCalendar, CompiledCalendar, \
+    DEFAULT_CALENDAR
 from pjplan.resource import IResource, Resource, DEFAULT_RESOURCE
 from pjplan.schedule import ForwardScheduler, BackwardScheduler
 from pjplan.io import TaskRaw
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Dict, Any, Iterable, Optional
+from typing import List, Dict, Iterable, Optional, Set
 
 from pjplan.task import Task, _ImmutableTaskList
 
@@ -10,12 +10,12 @@ def _find_clusters(tasks: List['Task']) -> List[List['Task']]:
     clusters = []
 
     for t in tasks:
-        if t.id in visited:
+        if t in visited:
             continue
 
         all_deps = t.all_successors(id_in_=task_ids) + t.all_predecessors(id_in_=task_ids) + [t]
         for d in all_deps:
-            visited.add(d.id)
+            visited.add(d)
 
         clusters.append(all_deps)
 
@@ -42,8 +42,9 @@ class CriticalPathCalculator:
 
     def __init__(self, tasks: Iterable[Task], end_date: Optional[datetime]):
         self.__nodes: List[_PNode] = []
-        self.__links: Dict[Any, _PLink] = {}
-        self.__tasks: Dict[Any, Task] = {}
+        # Tasks are hashed by identity, not by user ids
+        self.__links: Dict[Task, _PLink] = {}
+        self.__inserted: Set[Task] = set()
         self.__end_date = end_date
 
         for t in tasks:
@@ -53,24 +54,28 @@ class CriticalPathCalculator:
             else:
                 self.__insert_task(t)
 
-    def __insert_task(self, task: Task):
-        if len(task.children) > 0:
-            return
+    def __can_insert(self, task: Task) -> bool:
+        return len(task.children) == 0 and task not in self.__inserted
 
-        if task.id in self.__tasks:
+    def __insert_task(self, task: Task):
+        if not self.__can_insert(task):
             return
 
-        self.__tasks[task.id] = task
-
-        p_ids = []
-        for p in task.predecessors:
-            p_ids.append(p.id)
-            self.__insert_task(p)
-
-        estimate = task.estimate if task.estimate is not None else 0
-        spent = task.spent if task.spent is not None else 0
-
-        self.__add_work(task.id, max(estimate - spent, 0), p_ids)
+        # Predecessors are inserted before task, depth-first
+        self.__inserted.add(task)
+        stack = [(task, iter(task.predecessors))]
+        while stack:
+            t, predecessors = stack[-1]
+            for p in predecessors:
+                if self.__can_insert(p):
+                    self.__inserted.add(p)
+                    stack.append((p, iter(p.predecessors)))
+                    break
+            else:
+                stack.pop()
+                estimate = t.estimate if t.estimate is not None else 0
+                spent = t.spent if t.spent is not None else 0
+                self.__add_work(t, max(estimate - spent, 0), t.predecessors)
 
     def __new_node(self) -> _PNode:
         res = _PNode()
@@ -84,34 +89,54 @@ class CriticalPathCalculator:
         end.backward_links.append(link)
         return link
 
-    def __add_work(self, id: Any, units: float, predecessors: List[Any]):
+    def __add_work(self, task: Task, units: float, predecessors: Iterable[Task]):
         start = self.__new_node()
         end = self.__new_node()
         link = self.__connect(start, end, units)
 
-        self.__links[id] = link
+        self.__links[task] = link
 
         for p in predecessors:
             link = self.__links[p]
             self.__connect(link.end, start, 0)
 
-    def __forward(self, node: _PNode):
-        if node.start_units is None:
+    @staticmethod
+    def __forward(node: _PNode):
+        # Nodes are calculated after all their backward nodes
+        stack = [node]
+        while stack:
+            node = stack[-1]
+            if node.start_units is not None:
+                stack.pop()
+                continue
+            pending = [link.start for link in node.backward_links if link.start.start_units is None]
+            if pending:
+                stack.extend(reversed(pending))
+                continue
+
             max_start = 0
             for link in node.backward_links:
-                if link.start.start_units is None:
-                    self.__forward(link.start)
                 max_start = max(max_start, link.start.start_units + link.units)
 
             node.start_units = max_start
+            stack.pop()
 
-    def __backward(self, node: _PNode):
+    @staticmethod
+    def __backward(node: _PNode):
+        # Nodes are calculated after all their forward nodes
+        stack = [node]
+        while stack:
+            node = stack[-1]
+            if node.end_units is not None:
+                stack.pop()
+                continue
+            pending = [link.end for link in node.forward_links if link.end.end_units is None]
+            if pending:
+                stack.extend(reversed(pending))
+                continue
 
-        if node.end_units is None:
             min_end = None
             for link in node.forward_links:
-                if link.end.end_units is None:
-                    self.__backward(link.end)
                 if min_end is None:
                     min_end = link.end.end_units - link.units
                 else:
@@ -121,6 +146,7 @@ class CriticalPathCalculator:
                 min_end = node.start_units
 
             node.end_units = min_end
+            stack.pop()
 
     def calc(self) -> _ImmutableTaskList:
 
@@ -147,7 +173,7 @@ class CriticalPathCalculator:
             # print(k, f"{v.start.start_units} - {v.start.end_units}", f"{v.end.start_units} - {v.end.end_units}")
             r = v.end.end_units - v.start.start_units - v.units
             if r == 0:
-                res.append(self.__tasks[k])
+                res.append(k)
 
         if self.__end_date is None:
             return _ImmutableTaskList(res)
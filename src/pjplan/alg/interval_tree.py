@@ -0,0 +1,105 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Generic, Iterable, List, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class IntervalTree(Generic[T]):
+    """
+    Static centered interval tree over closed intervals [start, end].
+    Finds intervals overlapping query range in O(log n + k), k - number of found intervals
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[Any, Any, T]]):
+        """
+        :param intervals: (start, end, value) triples, start <= end
+        :raises TypeError: if bounds are not comparable
+        """
+        items = sorted(intervals, key=lambda iv: iv[0])
+        self.__starts = [iv[0] for iv in items]
+        self.__ends = [iv[1] for iv in items]
+        self.__values = [iv[2] for iv in items]
+
+        # Nodes are stored in parallel lists: center, interval indexes ordered by start asc and by end desc,
+        # left and right child node (-1 if none)
+        self.__centers = []
+        self.__by_start: List[List[int]] = []
+        self.__by_end: List[List[int]] = []
+        self.__left: List[int] = []
+        self.__right: List[int] = []
+
+        if items:
+            self.__build(list(range(len(items))))
+
+    def __new_node(self) -> int:
+        self.__centers.append(None)
+        self.__by_start.append([])
+        self.__by_end.append([])
+        self.__left.append(-1)
+        self.__right.append(-1)
+        return len(self.__centers) - 1
+
+    def __build(self, indexes: List[int]):
+        starts, ends = self.__starts, self.__ends
+        root = self.__new_node()
+        stack = [(root, indexes)]
+        while stack:
+            node, indexes = stack.pop()
+            # Indexes are ordered by start, so median start splits intervals to halves
+            center = starts[indexes[len(indexes) // 2]]
+            left, right, here = [], [], []
+            for i in indexes:
+                if ends[i] < center:
+                    left.append(i)
+                elif starts[i] > center:
+                    right.append(i)
+                else:
+                    here.append(i)
+
+            self.__centers[node] = center
+            self.__by_start[node] = here
+            self.__by_end[node] = sorted(here, key=lambda i: ends[i], reverse=True)
+            if left:
+                self.__left[node] = self.__new_node()
+                stack.append((self.__left[node], left))
+            if right:
+                self.__right[node] = self.__new_node()
+                stack.append((self.__right[node], right))
+
+    def __len__(self) -> int:
+        return len(self.__values)
+
+    def __stab_before(self, x: Any, res: List[int]):
+        """Collects intervals with start < x <= end"""
+        starts, ends = self.__starts, self.__ends
+        node = 0
+        while node >= 0:
+            center = self.__centers[node]
+            if x > center:
+                for i in self.__by_end[node]:
+                    if ends[i] < x:
+                        break
+                    res.append(i)
+                node = self.__right[node]
+            else:
+                for i in self.__by_start[node]:
+                    if starts[i] >= x:
+                        break
+                    res.append(i)
+                node = self.__left[node] if x < center else -1
+
+    def overlap(self, start: Any, end: Any) -> List[T]:
+        """
+        Values of intervals overlapping [start, end]: interval.start <= end and interval.end >= start
+        :param start: range start
+        :param end: range end, end >= start
+        :return: values in order of intervals start
+        """
+        if not self.__values:
+            return []
+
+        res = []
+        self.__stab_before(start, res)
+        res.sort()
+        res.extend(range(bisect_left(self.__starts, start), bisect_right(self.__starts, end)))
+        return [self.__values[i] for i in res]
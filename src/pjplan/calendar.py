@@ -1,16 +1,153 @@
+import bisect
+import operator
 from abc import ABC, abstractmethod
-from datetime import datetime
-from typing import List, Dict, Optional, Union, Iterable, Callable
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Union, Iterable, Callable, Tuple
 
 from pjplan.utils import GREEN, GREY, TextTable
 
 _WEEK_DAY_NAMES = ['MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT', 'SUN']
 
 
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Compiled calendars and unit ranges require numpy. Install it with 'pip install numpy'")
+    return numpy
+
+
+def _has_numpy() -> bool:
+    try:
+        _numpy()
+    except RuntimeError:
+        return False
+    return True
+
+
 def _day_start(d: datetime) -> datetime:
     return datetime(d.year, d.month, d.day, 0, 0, 0, 0)
 
 
+def _is_day_start(d: Optional[datetime]) -> bool:
+    """True for None and midnight"""
+    return d is None or (d.hour == 0 and d.minute == 0 and d.second == 0 and d.microsecond == 0)
+
+
+def _range_days(start: datetime, end: datetime) -> Tuple[datetime, int]:
+    """First day and number of days from start to end, both days included"""
+    start = _day_start(start)
+    end = _day_start(end)
+    if start > end:
+        raise RuntimeError("Start after end")
+    return start, (end - start).days + 1
+
+
+def _days_slice(first: datetime, days: int, start: Optional[datetime], end: Optional[datetime]) -> Tuple[int, int]:
+    """
+    Indexes [i, j) of days first + k, which are not before start and not after end
+    :param first: first day
+    :param days: number of days
+    :param start: start of interval or None
+    :param end: end of interval or None
+    """
+    i, j = 0, days
+    if start is not None:
+        q, r = divmod(start - first, timedelta(days=1))
+        i = min(max(q + (1 if r else 0), 0), days)
+    if end is not None:
+        j = max(min(divmod(end - first, timedelta(days=1))[0] + 1, days), i)
+    return i, j
+
+
+def _combine_ranges(calendars: Iterable['IWorkCalendar'], start: datetime, end: datetime, op, clamp: bool = False,
+                    days=None):
+    """
+    Combines units of calendars from left to right with op like combinators do: days without units (NaN)
+    are skipped, days without units in all calendars stay NaN
+    :param clamp: units < 0 become NaN after every calendar but the first one, see _WorkCalendarSubChain
+    :param days: days to evaluate, see IWorkCalendar._get_available_units_range
+    """
+    np = _numpy()
+    res = None
+    for c in calendars:
+        units = c._get_available_units_range(start, end, days)
+        if res is None:
+            res = np.array(units, dtype=float)
+            continue
+        has_units = ~np.isnan(units)
+        both = has_units & ~np.isnan(res)
+        res[both] = op(res[both], units[both])
+        only = has_units & ~both
+        res[only] = units[only]
+        if clamp:
+            res[res < 0] = np.nan
+    if res is None:
+        return np.full(_range_days(start, end)[1], np.nan)
+    return res
+
+
+def _divide(a, b):
+    """Divides units of days, which have units in both calendars. Raises for them like get_available_units"""
+    if (b == 0).any():
+        raise ZeroDivisionError("division by zero")
+    return a / b
+
+
+def _first_positive(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    """Units of disjunction of two calendars"""
+    if a is not None and a > 0:
+        return a
+    if b is not None and b > 0:
+        return b
+    return None
+
+
+def _optimize_all(calendars: Iterable['IWorkCalendar']) -> List['IWorkCalendar']:
+    """Optimized calendars without calendars, which never have units. Combinators skip such calendars"""
+    # noinspection PyProtectedMember
+    return [c for c in (c._optimize() for c in calendars) if not c._always_none()]
+
+
+# noinspection PyProtectedMember
+def _fold_leading(calendars: List['IWorkCalendar'], op, clamp: bool = False) -> List['IWorkCalendar']:
+    """
+    Replaces two first calendars with one calendar, while both are FixedCalendars without interval
+    or both are DirectCalendars. Units of the new calendar are computed like combinator does it for the day,
+    so combinator results don't change
+    :param calendars: calendars of combinator
+    :param op: operator of combinator
+    :param clamp: units < 0 are None after the second calendar, like in WorkCalendarSub
+    :return: calendars
+    """
+    calendars = list(calendars)
+    while len(calendars) > 1:
+        a, b = calendars[0], calendars[1]
+        try:
+            if type(a) is FixedCalendar and type(b) is FixedCalendar \
+                    and a._constant() is not None and b._constant() is not None:
+                units = op(a._constant(), b._constant())
+                if units < 0:
+                    break
+                folded = FixedCalendar(units)
+            elif type(a) is DirectCalendar and type(b) is DirectCalendar:
+                def fold(x, y):
+                    if x is None or y is None:
+                        units = y if x is None else x
+                    else:
+                        units = op(x, y)
+                    return None if clamp and units is not None and units < 0 else units
+
+                folded = DirectCalendar._merge(a, b, fold)
+            else:
+                break
+        except ZeroDivisionError:
+            # Combinator raises this error on every call or for some days
+            break
+        calendars[0:2] = [folded]
+    return calendars
+
+
 def _repr_units(hours) -> str:
     return f"{hours:.1f}"
 
@@ -51,11 +188,26 @@ def _repr_direct_calendar(calendar: 'IWorkCalendar', dates: Iterable[datetime]):
     table.new_cell('DATE', GREEN)
     table.new_cell('UNITS', GREEN)
 
+    dates = list(dates)
+    # Units of all dates in one call
+    first, values = None, None
+    if dates and _has_numpy() and all(_is_day_start(d) for d in dates):
+        np = _numpy()
+        first = min(dates)
+        days = np.zeros((max(dates) - first).days + 1, dtype=bool)
+        days[[(d - first).days for d in dates]] = True
+        # noinspection PyProtectedMember
+        values = calendar._get_available_units_range(first, max(dates), days).tolist()
+
     for d in dates:
         table.new_row()
         table.new_cell(d.strftime('%Y-%m-%d'))
 
-        units = calendar.get_available_units(d)
+        if values is not None:
+            units = values[(d - first).days]
+            units = None if units != units else units
+        else:
+            units = calendar.get_available_units(d)
         val = _repr_units(units)
         table.new_cell(val, GREY if units == 0 else None)
 
@@ -109,6 +261,9 @@ def _repr_interval(start: Optional[datetime], end: Optional[datetime]):
 class IWorkCalendar(ABC):
     """Work calendar interface"""
 
+    # Incremented on any change of calendar units, so compiled calendars of resources become stale
+    version = 0
+
     @abstractmethod
     def get_available_units(self, date: datetime) -> Optional[float]:
         """
@@ -118,8 +273,79 @@ class IWorkCalendar(ABC):
         """
         pass
 
-    def apply(self, func: Callable[[float], float]) -> 'IWorkCalendar':
-        return FuncCalendar(self, func)
+    def get_available_units_range(self, start: datetime, end: datetime):
+        """
+        Returns numbers of work hours for every day from start to end at the beginning of the day.
+        Requires numpy
+        :param start: first day
+        :param end: last day
+        :return: float array, NaN for days without work hours (None)
+        """
+        np = _numpy()
+        first, days = _range_days(start, end)
+        return np.array([self.get_available_units(first + timedelta(days=i)) for i in range(days)], dtype=float)
+
+    def _get_available_units_range(self, start: datetime, end: datetime, days=None):
+        """
+        Units of days from start to end like get_available_units_range, but only days marked in days are
+        evaluated, other days are NaN. Combinators evaluate calendars for the days get_available_units
+        evaluates them for, so days, which would raise errors (i.e. division by zero), are not evaluated
+        :param start: first day
+        :param end: last day
+        :param days: bool array with item for every day from start to end, None for all days
+        :return: float array
+        """
+        if days is None:
+            return self.get_available_units_range(start, end)
+        np = _numpy()
+        if type(self).get_available_units_range is IWorkCalendar.get_available_units_range:
+            # Units are evaluated day by day anyway, so other days are skipped
+            first = _day_start(start)
+            res = [None] * len(days)
+            for i in np.flatnonzero(days).tolist():
+                res[i] = self.get_available_units(first + timedelta(days=i))
+            return np.array(res, dtype=float)
+        res = self.get_available_units_range(start, end)
+        res[~days] = np.nan
+        return res
+
+    def apply(self, func: Callable[[float], float], vectorized: bool = False) -> 'IWorkCalendar':
+        return FuncCalendar(self, func, vectorized)
+
+    def compile(self, start: datetime, end: datetime) -> 'CompiledCalendar':
+        """
+        Evaluates calendar once for every day from start to end, see CompiledCalendar
+        :param start: first day
+        :param end: last day
+        :return: compiled calendar
+        """
+        return CompiledCalendar(self, start, end)
+
+    def optimize(self) -> 'IWorkCalendar':
+        """
+        Returns calendar with exactly the same units, which is cheaper to evaluate: chains of operators are
+        flattened, FixedCalendar constants and DirectCalendars are folded, calendars, which can't change the result,
+        are removed. Optimized calendar may copy units of DirectCalendars, so later set_units calls
+        are not reflected in it
+        :return: optimized calendar
+        """
+        return self._optimize()
+
+    def _optimize(self) -> 'IWorkCalendar':
+        """Optimized calendar, see optimize"""
+        return self
+
+    def _never_positive(self) -> bool:
+        """True if units are None or <= 0 for any date"""
+        return self._always_none()
+
+    def _always_none(self) -> bool:
+        """True if units are None for any date"""
+        return False
+
+    def _is_daily(self) -> bool:
+        """True if units depend on day only, not on time of day. Compiled calendar serves any time of such days"""
+        return False
 
     @staticmethod
     def __prepare_calendar(other):
@@ -154,6 +380,9 @@ class WorkCalendarDisjunction(IWorkCalendar):
     ):
         self.__calendars = calendars if calendars is not None else []
 
+    def _is_daily(self) -> bool:
+        return all(c._is_daily() for c in self.__calendars)
+
     def get_available_units(self, date: datetime) -> Optional[float]:
         for c in self.__calendars:
             units = c.get_available_units(date)
@@ -161,6 +390,44 @@ class WorkCalendarDisjunction(IWorkCalendar):
                 return units
         return None
 
+    def get_available_units_range(self, start: datetime, end: datetime):
+        return self._get_available_units_range(start, end)
+
+    def _get_available_units_range(self, start: datetime, end: datetime, days=None):
+        np = _numpy()
+        res = np.full(_range_days(start, end)[1], np.nan)
+        # Days without units > 0 yet. Like in get_available_units, next calendar is evaluated for them only
+        left = days
+        for c in self.__calendars:
+            if left is not None and not left.any():
+                break
+            units = c._get_available_units_range(start, end, left)
+            found = units > 0
+            if left is not None:
+                found &= left
+            res[found] = units[found]
+            left = ~found if left is None else left & ~found
+        return res
+
+    # noinspection PyProtectedMember
+    def _optimize(self) -> IWorkCalendar:
+        # Only units > 0 are taken, so nested disjunctions at any position are flattened
+        # and calendars without such units are removed
+        calendars = []
+        for c in (c._optimize() for c in self.__calendars):
+            for c in (c.__calendars if type(c) is WorkCalendarDisjunction else [c]):
+                if c._never_positive():
+                    continue
+                if calendars and type(c) is DirectCalendar and type(calendars[-1]) is DirectCalendar:
+                    calendars[-1] = DirectCalendar._merge(calendars[-1], c, _first_positive)
+                else:
+                    calendars.append(c)
+        return WorkCalendarDisjunction(calendars)
+
+    def _always_none(self) -> bool:
+        # noinspection PyProtectedMember
+        return all(c._never_positive() for c in self.__calendars)
+
     def __repr__(self):
         return _repr_calendar_op(self.__calendars, '|')
 
@@ -173,6 +440,9 @@ class WorkCalendarSum(IWorkCalendar):
     ):
         self.__calendars = calendars if calendars is not None else []
 
+    def _is_daily(self) -> bool:
+        return all(c._is_daily() for c in self.__calendars)
+
     def get_available_units(self, date: datetime) -> Optional[float]:
         units = None
         for c in self.__calendars:
@@ -185,6 +455,20 @@ class WorkCalendarSum(IWorkCalendar):
                 units += c_units
         return units
 
+    def get_available_units_range(self, start: datetime, end: datetime):
+        return self._get_available_units_range(start, end)
+
+    def _get_available_units_range(self, start: datetime, end: datetime, days=None):
+        return _combine_ranges(self.__calendars, start, end, operator.add, days=days)
+
+    def _optimize(self) -> IWorkCalendar:
+        calendars = _optimize_all(self.__calendars)
+        # Units are added from left to right, so only the first calendar is flattened
+        if calendars and type(calendars[0]) is WorkCalendarSum:
+            calendars[0:1] = calendars[0].__calendars
+        calendars = _fold_leading(calendars, operator.add)
+        return calendars[0] if len(calendars) == 1 else WorkCalendarSum(calendars)
+
     def __repr__(self):
         return _repr_standard_calendars(self, self.__calendars, '+')
 
@@ -197,6 +481,9 @@ class WorkCalendarSub(IWorkCalendar):
     ):
         self.__calendars = calendars if calendars is not None else []
 
+    def _is_daily(self) -> bool:
+        return all(c._is_daily() for c in self.__calendars)
+
     def get_available_units(self, date: datetime) -> Optional[float]:
         units = None
         for c in self.__calendars:
@@ -211,10 +498,67 @@ class WorkCalendarSub(IWorkCalendar):
             return None
         return units
 
+    def get_available_units_range(self, start: datetime, end: datetime):
+        return self._get_available_units_range(start, end)
+
+    def _get_available_units_range(self, start: datetime, end: datetime, days=None):
+        res = _combine_ranges(self.__calendars, start, end, operator.sub, days=days)
+        res[res < 0] = _numpy().nan
+        return res
+
+    # noinspection PyProtectedMember
+    def _optimize(self) -> IWorkCalendar:
+        calendars = [c._optimize() for c in self.__calendars]
+        # Difference of two calendars is clamped after the second one, like _WorkCalendarSubChain
+        chain = len(calendars) <= 2
+        first = calendars[0] if calendars else None
+        if chain and isinstance(first, WorkCalendarSub) \
+                and (type(first) is _WorkCalendarSubChain or len(first.__calendars) == 2):
+            calendars[0:1] = first.__calendars
+        if chain:
+            # Units before the third calendar are already clamped
+            calendars = calendars[:2] + [c for c in calendars[2:] if not c._always_none()]
+        else:
+            calendars = [c for c in calendars if not c._always_none()]
+        calendars = _fold_leading(calendars, operator.sub, chain)
+
+        if len(calendars) == 1 and type(calendars[0]) is FixedCalendar:
+            return calendars[0]
+        if chain and len(calendars) > 2:
+            return _WorkCalendarSubChain(calendars)
+        return WorkCalendarSub(calendars)
+
     def __repr__(self):
         return _repr_standard_calendars(self, self.__calendars, '-')
 
 
+class _WorkCalendarSubChain(WorkCalendarSub):
+    """
+    Flattened chain of subtractions ((c1 - c2) - c3) - ... Like in nested WorkCalendarSubs, units < 0 are None
+    after every calendar but the first one. Made by WorkCalendarSub optimization of at least three calendars
+    """
+
+    def __init__(self, calendars: List[IWorkCalendar]):
+        super().__init__(calendars)
+        self.__calendars = calendars
+
+    def get_available_units(self, date: datetime) -> Optional[float]:
+        units = None
+        for i, c in enumerate(self.__calendars):
+            c_units = c.get_available_units(date)
+            if c_units is not None:
+                units = c_units if units is None else units - c_units
+            if i > 0 and units is not None and units < 0:
+                units = None
+        return units
+
+    def _get_available_units_range(self, start: datetime, end: datetime, days=None):
+        return _combine_ranges(self.__calendars, start, end, operator.sub, True, days)
+
+    def _optimize(self) -> IWorkCalendar:
+        return self
+
+
 class WorkCalendarsMul(IWorkCalendar):
 
     def __init__(
@@ -223,6 +567,9 @@ class WorkCalendarsMul(IWorkCalendar):
     ):
         self.__calendars = calendars if calendars is not None else []
 
+    def _is_daily(self) -> bool:
+        return all(c._is_daily() for c in self.__calendars)
+
     def get_available_units(self, date: datetime) -> Optional[float]:
         units = None
         for c in self.__calendars:
@@ -235,6 +582,20 @@ class WorkCalendarsMul(IWorkCalendar):
                 units *= c_units
         return units
 
+    def get_available_units_range(self, start: datetime, end: datetime):
+        return self._get_available_units_range(start, end)
+
+    def _get_available_units_range(self, start: datetime, end: datetime, days=None):
+        return _combine_ranges(self.__calendars, start, end, operator.mul, days=days)
+
+    def _optimize(self) -> IWorkCalendar:
+        calendars = _optimize_all(self.__calendars)
+        # Units are multiplied from left to right, so only the first calendar is flattened
+        if calendars and type(calendars[0]) is WorkCalendarsMul:
+            calendars[0:1] = calendars[0].__calendars
+        calendars = _fold_leading(calendars, operator.mul)
+        return calendars[0] if len(calendars) == 1 else WorkCalendarsMul(calendars)
+
     def __repr__(self):
         return _repr_standard_calendars(self, self.__calendars, '*')
 
@@ -247,6 +608,9 @@ class WorkCalendarDiv(IWorkCalendar):
     ):
         self.__calendars = calendars if calendars is not None else []
 
+    def _is_daily(self) -> bool:
+        return all(c._is_daily() for c in self.__calendars)
+
     def get_available_units(self, date: datetime) -> Optional[float]:
         units = None
         for c in self.__calendars:
@@ -259,18 +623,69 @@ class WorkCalendarDiv(IWorkCalendar):
                 units /= c_units
         return units
 
+    def get_available_units_range(self, start: datetime, end: datetime):
+        return self._get_available_units_range(start, end)
+
+    def _get_available_units_range(self, start: datetime, end: datetime, days=None):
+        return _combine_ranges(self.__calendars, start, end, _divide, days=days)
+
+    def _optimize(self) -> IWorkCalendar:
+        calendars = _optimize_all(self.__calendars)
+        # Units are divided from left to right, so only the first calendar is flattened
+        if calendars and type(calendars[0]) is WorkCalendarDiv:
+            calendars[0:1] = calendars[0].__calendars
+        calendars = _fold_leading(calendars, operator.truediv)
+        return calendars[0] if len(calendars) == 1 else WorkCalendarDiv(calendars)
+
     def __repr__(self):
         return _repr_standard_calendars(self, self.__calendars, '/')
 
 
 class FuncCalendar(IWorkCalendar):
 
-    def __init__(self, calendar: IWorkCalendar, func: Callable[[float], float]):
+    def __init__(self, calendar: IWorkCalendar, func: Callable[[float], float], vectorized: bool = False):
+        """
+        :param calendar: calendar
+        :param func: function of units
+        :param vectorized: func is elementwise function of numpy arrays, like numpy ufuncs. It gets NaN for days
+        without units and returns NaN for days without units. Ranges of units are passed to func in one call
+        """
         self.__calendar = calendar
         self.__func = func
+        self.__vectorized = vectorized
 
     def get_available_units(self, date: datetime) -> Optional[float]:
-        return self.__func(self.__calendar.get_available_units(date))
+        units = self.__calendar.get_available_units(date)
+        if not self.__vectorized:
+            return self.__func(units)
+        np = _numpy()
+        res = self.__func(np.array([units], dtype=float))[0]
+        return None if np.isnan(res) else float(res)
+
+    def get_available_units_range(self, start: datetime, end: datetime):
+        return self._get_available_units_range(start, end)
+
+    def _get_available_units_range(self, start: datetime, end: datetime, days=None):
+        np = _numpy()
+        units = self.__calendar._get_available_units_range(start, end, days)
+        if self.__vectorized:
+            res = np.asarray(self.__func(units), dtype=float)
+        else:
+            values = units.tolist()
+            for i in (range(len(values)) if days is None else np.flatnonzero(days).tolist()):
+                u = values[i]
+                values[i] = self.__func(None if u != u else u)
+            res = np.array(values, dtype=float)
+        if days is not None:
+            res[~days] = np.nan
+        return res
+
+    def _is_daily(self) -> bool:
+        return self.__calendar._is_daily()
+
+    def _optimize(self) -> IWorkCalendar:
+        calendar = self.__calendar._optimize()
+        return self if calendar is self.__calendar else FuncCalendar(calendar, self.__func, self.__vectorized)
 
     def __repr__(self):
         res = 'Func: ' + str(self.__func) + '\n'
@@ -297,6 +712,26 @@ class FixedCalendar(IWorkCalendar):
 
         return self.__units
 
+    def get_available_units_range(self, start: datetime, end: datetime):
+        np = _numpy()
+        first, days = _range_days(start, end)
+        res = np.zeros(days)
+        i, j = _days_slice(first, days, self.__start, self.__end)
+        res[i:j] = self.__units
+        return res
+
+    def _is_daily(self) -> bool:
+        # Only midnight of end day is before end
+        return _is_day_start(self.__start) and self.__end is None
+
+    def _constant(self) -> Optional[float]:
+        """Units, if calendar has no interval, otherwise None"""
+        return self.__units if self.__start is None and self.__end is None else None
+
+    def _never_positive(self) -> bool:
+        empty = self.__start is not None and self.__end is not None and self.__start > self.__end
+        return self.__units <= 0 or empty
+
     def __repr__(self):
         return "Fixed: " + _repr_units(self.__units) + ' ' + _repr_interval(self.__start, self.__end)
 
@@ -311,6 +746,8 @@ class DirectCalendar(IWorkCalendar):
             self.__units = {_day_start(k): v for k, v in units.items()}
         else:
             self.__units = {}
+        # Day ordinals and units sorted by day, see __sorted_units
+        self.__sorted = None
 
     def get_available_units(self, date: datetime) -> Optional[float]:
         key = _day_start(date)
@@ -319,8 +756,66 @@ class DirectCalendar(IWorkCalendar):
         else:
             return None
 
+    def __sorted_units(self):
+        if self.__sorted is None:
+            np = _numpy()
+            # Only keys at the beginning of day are found by get_available_units
+            days = sorted(k for k in self.__units if _is_day_start(k))
+            self.__sorted = (
+                np.array([d.toordinal() for d in days], dtype=np.int64),
+                np.array([self.__units[d] for d in days], dtype=float)
+            )
+        return self.__sorted
+
+    def get_available_units_range(self, start: datetime, end: datetime):
+        np = _numpy()
+        first, days = _range_days(start, end)
+        ordinals, units = self.__sorted_units()
+        first = first.toordinal()
+        i = np.searchsorted(ordinals, first, side='left')
+        j = np.searchsorted(ordinals, first + days, side='left')
+        res = np.full(days, np.nan)
+        res[ordinals[i:j] - first] = units[i:j]
+        return res
+
+    def _is_daily(self) -> bool:
+        return True
+
+    def __days(self) -> Dict[datetime, float]:
+        """Units of days, which get_available_units finds"""
+        return {k: v for k, v in self.__units.items() if _is_day_start(k) and v is not None}
+
+    def _never_positive(self) -> bool:
+        return all(v <= 0 for v in self.__days().values())
+
+    def _always_none(self) -> bool:
+        return len(self.__days()) == 0
+
+    @staticmethod
+    def _merge(
+            first: 'DirectCalendar',
+            second: 'DirectCalendar',
+            func: Callable[[Optional[float], Optional[float]], Optional[float]]
+    ) -> 'DirectCalendar':
+        """
+        Calendar with units func(units of first, units of second) for days of both calendars
+        :param first: calendar
+        :param second: calendar
+        :param func: function of units, None if day has no units
+        :return: calendar
+        """
+        days, other = first.__days(), second.__days()
+        units = {}
+        for d in list(days) + [d for d in other if d not in days]:
+            u = func(days.get(d), other.get(d))
+            if u is not None:
+                units[d] = u
+        return DirectCalendar(units)
+
     def set_units(self, units: Dict[datetime, float]):
         self.__units = self.__units | units
+        self.__sorted = None
+        IWorkCalendar.version += 1
 
     @property
     def dates(self):
@@ -409,6 +904,27 @@ class WeeklyCalendar(IWorkCalendar):
 
         return self.__day_hours[date.weekday()]
 
+    def get_available_units_range(self, start: datetime, end: datetime):
+        np = _numpy()
+        first, days = _range_days(start, end)
+        res = np.full(days, np.nan)
+        i, j = _days_slice(first, days, self.__start, self.__end)
+        if i < j:
+            week = np.array([self.__day_hours[k] for k in range(0, 7)], dtype=float)
+            # Week starting from weekday of day i, repeated over days from i to j
+            res[i:j] = np.resize(np.roll(week, -(first + timedelta(days=i)).weekday()), j - i)
+        return res
+
+    def _is_daily(self) -> bool:
+        # Only midnight of end day is before end
+        return _is_day_start(self.__start) and self.__end is None
+
+    def _never_positive(self) -> bool:
+        return self._always_none() or all(v <= 0 for v in self.__day_hours.values())
+
+    def _always_none(self) -> bool:
+        return self.__start is not None and self.__end is not None and self.__start > self.__end
+
     def clone(self) -> 'WeeklyCalendar':
         return WeeklyCalendar(units_per_day=self.__day_hours)
 
@@ -416,6 +932,161 @@ class WeeklyCalendar(IWorkCalendar):
         return _repr_week_calendar(self, self.__start, self.__end)
 
 
+class CompiledCalendar(IWorkCalendar):
+    """
+    Calendar evaluated once for every day from start to end. Lookups give the same
+    units as calendar, but cost O(1). Cumulative sums of units answer
+    units_between and date_after_units in O(log days). Dates outside of compiled days and times of day of calendars,
+    which depend on time of day, are passed to calendar. Compiled calendar is a snapshot: later changes
+    of calendar units are not reflected. Requires numpy
+    """
+
+    def __init__(self, calendar: IWorkCalendar, start: datetime, end: datetime):
+        """
+        :param calendar: calendar
+        :param start: first day
+        :param end: last day
+        """
+        np = _numpy()
+        start = _day_start(start)
+        end = _day_start(end)
+        if start > end:
+            raise RuntimeError("Start after end")
+
+        self.__calendar = calendar
+        self.__start = start
+        self.__end = end
+        self.__daily = calendar._is_daily()
+        self.__version = IWorkCalendar.version
+
+        # Units are kept as calendar returns them (i.e. int units stay int), float copy is used for sums only
+        days = (end - start).days + 1
+        self.__values = [calendar.get_available_units(start + timedelta(days=i)) for i in range(days)]
+        self.__range = np.array([np.nan if v is None else v for v in self.__values], dtype=float)
+        units = np.where(np.isnan(self.__range), 0.0, self.__range)
+        # Units of days before day i
+        self.__cumulative = np.concatenate(([0.0], np.cumsum(units)))
+        # Days with units > 0
+        self.__available: List[int] = np.flatnonzero(units > 0).tolist()
+
+    @property
+    def calendar(self) -> IWorkCalendar:
+        """Source calendar"""
+        return self.__calendar
+
+    @property
+    def start(self) -> datetime:
+        """First compiled day"""
+        return self.__start
+
+    @property
+    def end(self) -> datetime:
+        """Last compiled day"""
+        return self.__end
+
+    @property
+    def is_stale(self) -> bool:
+        """True if units of some calendar changed after compilation"""
+        return self.__version != IWorkCalendar.version
+
+    def _is_daily(self) -> bool:
+        return self.__daily
+
+    def _values(self) -> List[Optional[float]]:
+        """Units of compiled days, None for days without units"""
+        return self.__values
+
+    def __day(self, date: datetime) -> int:
+        """Index of compiled day or -1"""
+        if self.__daily or _is_day_start(date):
+            i = (date - self.__start).days
+            if 0 <= i < len(self.__values):
+                return i
+        return -1
+
+    def __index(self, date: datetime) -> int:
+        """Index of day, date must be inside compiled days"""
+        i = (_day_start(date) - self.__start).days
+        if i < 0 or i > len(self.__values):
+            raise RuntimeError(f"Date {date.strftime('%Y-%m-%d')} outside of compiled calendar "
+                               f"{_repr_interval(self.__start, self.__end)}")
+        return i
+
+    def get_available_units(self, date: datetime) -> Optional[float]:
+        i = self.__day(date)
+        if i < 0:
+            return self.__calendar.get_available_units(date)
+        return self.__values[i]
+
+    def get_available_units_range(self, start: datetime, end: datetime):
+        return self._get_available_units_range(start, end)
+
+    def _get_available_units_range(self, start: datetime, end: datetime, days=None):
+        first, n = _range_days(start, end)
+        i = (first - self.__start).days
+        if 0 <= i and i + n <= len(self.__values):
+            res = self.__range[i:i + n].copy()
+            if days is not None:
+                res[~days] = _numpy().nan
+            return res
+        return self.__calendar._get_available_units_range(start, end, days)
+
+    def units_between(self, start: datetime, end: datetime) -> float:
+        """
+        Sum of units of days from start to end, end day is not included. Time of day is ignored
+        :param start: first day
+        :param end: day after last day, at most day after compiled end
+        :return: sum of units
+        """
+        i, j = self.__index(start), self.__index(end)
+        if j <= i:
+            return 0.0
+        return float(self.__cumulative[j] - self.__cumulative[i])
+
+    def date_after_units(self, date: datetime, units: float) -> datetime:
+        """
+        Date when units of work starting at beginning of day are done. Units of day are spread over 24 hours,
+        so units = 4 with 8 units available at day give noon
+        :param date: day work starts
+        :param units: units of work
+        :return: date
+        :raises RuntimeError: if work can't be done till the end of compiled days
+        """
+        np = _numpy()
+        i = self.__index(date)
+        if units <= 0:
+            return self.__start + timedelta(days=i)
+        target = self.__cumulative[i] + units
+        j = int(np.searchsorted(self.__cumulative, target, side='left'))
+        if j >= len(self.__cumulative):
+            raise RuntimeError(f"Can't do {units} units from {date.strftime('%Y-%m-%d')} till "
+                               f"{self.__end.strftime('%Y-%m-%d')}")
+        day_units = self.__cumulative[j] - self.__cumulative[j - 1]
+        percent = float((target - self.__cumulative[j - 1]) / day_units)
+        return self.__start + timedelta(days=j - 1, hours=24 * percent)
+
+    def nearest_available_day(self, date: datetime, direction: int) -> Optional[datetime]:
+        """
+        Nearest compiled day with units > 0 from day of date
+        :param date: date
+        :param direction: 1 - search forward, -1 - backward
+        :return: day or None, if there are no such days in compiled calendar
+        """
+        i = (_day_start(date) - self.__start).days
+        if direction > 0:
+            k = bisect.bisect_left(self.__available, i)
+            if k == len(self.__available):
+                return None
+        else:
+            k = bisect.bisect_right(self.__available, i) - 1
+            if k < 0:
+                return None
+        return self.__start + timedelta(days=self.__available[k])
+
+    def __repr__(self):
+        return 'Compiled ' + _repr_interval(self.__start, self.__end) + ':\n' + self.__calendar.__repr__()
+
+
 DEFAULT_CALENDAR = WeeklyCalendar(
     days=[0, 1, 2, 3, 4],
     units_per_day=8
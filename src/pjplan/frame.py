@@ -0,0 +1,381 @@
+"""
+Columnar representation of WBS: every task field is stored in separate numpy array (struct of arrays).
+Requires numpy.
+"""
+import math
+import re
+from datetime import datetime, timedelta
+from typing import Any, Iterable, List, Optional
+
+from pjplan.task import Task
+from pjplan.wbs import WBS
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("TaskFrame requires numpy. Install it with 'pip install numpy'")
+    return numpy
+
+
+def _objects(values: Iterable[Any]):
+    """Object array. Unlike numpy.array, doesn't unpack tuple values to dimensions"""
+    np = _numpy()
+    values = list(values)
+    res = np.empty(len(values), dtype=object)
+    for i, v in enumerate(values):
+        res[i] = v
+    return res
+
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _dates(values: List[Optional[datetime]]):
+    """datetime64[us] array, NaT for None values"""
+    np = _numpy()
+    nat = np.iinfo(np.int64).min
+    return np.fromiter(
+        (nat if v is None else (v - _EPOCH) // _MICROSECOND for v in values), np.int64, len(values)
+    ).view('datetime64[us]')
+
+
+# Filter suffixes in order of matching. Same as task list filters
+_FILTER_OPS = ('_not_like_', '_like_', '_not_in_', '_is_none_', '_is_not_none_', '_in_', '_ne_', '_le_', '_lt_',
+               '_ge_', '_gt_')
+
+_ROLLUPS = ('sum', 'min', 'max')
+
+
+class TaskFrame:
+    """
+    WBS stored as numpy columns. Rows follow WBS tasks order (parents before children).
+    Columns:
+    - id: task ids (object)
+    - parent: row of parent task, -1 for root tasks (int64)
+    - name: task names (object)
+    - resource: resource codes, index in resources list, -1 if no resource (int32)
+    - estimate, spent: float64, NaN if not set
+    - start, end, min_start: datetime64[us], NaT if not set
+    - milestone: bool
+    - pred_ptr, pred_idx: predecessors in CSR format. Predecessors rows of task in row i are
+      pred_idx[pred_ptr[i]:pred_ptr[i + 1]]
+    Custom task attributes are not stored in frame
+    """
+
+    def __init__(
+            self,
+            id,
+            parent,
+            name,
+            resource,
+            resources: List[str],
+            estimate,
+            spent,
+            start,
+            end,
+            min_start,
+            milestone,
+            pred_ptr,
+            pred_idx
+    ):
+        """
+        :param id: task ids
+        :param parent: parent rows, -1 for root tasks
+        :param name: task names
+        :param resource: resource codes
+        :param resources: resource names, resource code is index in this list
+        :param estimate: task estimations
+        :param spent: task completed work
+        :param start: task start dates
+        :param end: task end dates
+        :param min_start: task min start dates
+        :param milestone: milestone flags
+        :param pred_ptr: predecessors offsets, len(pred_ptr) == len(id) + 1
+        :param pred_idx: predecessor rows
+        """
+        np = _numpy()
+        self.id = _objects(id)
+        self.parent = np.asarray(parent, dtype=np.int64)
+        self.name = _objects(name)
+        self.resource = np.asarray(resource, dtype=np.int32)
+        self.resources = list(resources)
+        self.estimate = np.asarray(estimate, dtype=np.float64)
+        self.spent = np.asarray(spent, dtype=np.float64)
+        self.start = np.asarray(start, dtype='datetime64[us]')
+        self.end = np.asarray(end, dtype='datetime64[us]')
+        self.min_start = np.asarray(min_start, dtype='datetime64[us]')
+        self.milestone = np.asarray(milestone, dtype=bool)
+        self.pred_ptr = np.asarray(pred_ptr, dtype=np.int64)
+        self.pred_idx = np.asarray(pred_idx, dtype=np.int64)
+
+        n = len(self.id)
+        for column in ('parent', 'name', 'resource', 'estimate', 'spent', 'start', 'end', 'min_start', 'milestone'):
+            if len(self.__getattribute__(column)) != n:
+                raise RuntimeError(f"Column '{column}' length differs from ids length")
+        if len(self.pred_ptr) != n + 1:
+            raise RuntimeError("Predecessors offsets length must be equal to ids length + 1")
+        if n and (self.parent.min() < -1 or self.parent.max() >= n):
+            raise RuntimeError("Parent row out of range")
+        if len(self.pred_idx) and (self.pred_idx.min() < 0 or self.pred_idx.max() >= n):
+            raise RuntimeError("Predecessor row out of range")
+
+    @staticmethod
+    def from_wbs(wbs: WBS) -> 'TaskFrame':
+        """
+        Creates frame from WBS in O(n + e), n - tasks count, e - links count
+        :param wbs: WBS
+        :return: frame
+        """
+        np = _numpy()
+        tasks = wbs.tasks[:]
+        rows = {id(t): i for i, t in enumerate(tasks)}
+
+        resource_codes = {}
+        resources = []
+        codes = []
+        for t in tasks:
+            if t.resource is None:
+                codes.append(-1)
+                continue
+            code = resource_codes.get(t.resource)
+            if code is None:
+                code = len(resources)
+                resource_codes[t.resource] = code
+                resources.append(t.resource)
+            codes.append(code)
+
+        pred_ptr = [0]
+        pred_idx = []
+        for t in tasks:
+            pred_idx += [rows[id(p)] for p in t._predecessors_links()]
+            pred_ptr.append(len(pred_idx))
+
+        return TaskFrame(
+            id=[t.id for t in tasks],
+            parent=[rows.get(id(t.parent), -1) for t in tasks],
+            name=[t.name for t in tasks],
+            resource=codes,
+            resources=resources,
+            estimate=np.array([t.estimate for t in tasks], dtype=np.float64),
+            spent=np.array([t.spent for t in tasks], dtype=np.float64),
+            start=_dates([t.start for t in tasks]),
+            end=_dates([t.end for t in tasks]),
+            min_start=_dates([t.min_start for t in tasks]),
+            milestone=np.array([t.milestone for t in tasks], dtype=bool),
+            pred_ptr=pred_ptr,
+            pred_idx=pred_idx
+        )
+
+    def to_wbs(self) -> WBS:
+        """
+        Creates WBS from frame in O(n + e), n - tasks count, e - links count
+        :return: WBS
+        """
+        np = _numpy()
+        estimate = self.estimate.tolist()
+        spent = self.spent.tolist()
+        start = self.start.tolist()
+        end = self.end.tolist()
+        min_start = self.min_start.tolist()
+
+        tasks = []
+        for i in range(len(self)):
+            code = int(self.resource[i])
+            tasks.append(Task(
+                self.id[i],
+                name=self.name[i],
+                resource=self.resources[code] if code >= 0 else None,
+                start=start[i],
+                end=end[i],
+                milestone=bool(self.milestone[i]),
+                estimate=None if math.isnan(estimate[i]) else estimate[i],
+                spent=None if math.isnan(spent[i]) else spent[i],
+                min_start=min_start[i]
+            ))
+
+        # Tasks are attached in order of depth, so every task is appended to already attached parent
+        wbs = WBS()
+        order = np.argsort(self.__depth(), kind='stable')
+        for i in order.tolist():
+            p = int(self.parent[i])
+            if p < 0:
+                wbs // tasks[i]
+            else:
+                tasks[p] // tasks[i]
+
+        for i, t in enumerate(tasks):
+            preds = self.pred_idx[self.pred_ptr[i]:self.pred_ptr[i + 1]].tolist()
+            if preds:
+                t.predecessors = [tasks[p] for p in preds]
+
+        return wbs
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def __depth(self):
+        """Depth of every task in hierarchy, 0 for root tasks"""
+        np = _numpy()
+        depth = np.zeros(len(self), dtype=np.int64)
+        p = self.parent.copy()
+        for _ in range(len(self) + 1):
+            has_parent = p >= 0
+            if not has_parent.any():
+                return depth
+            depth[has_parent] += 1
+            p[has_parent] = self.parent[p[has_parent]]
+        raise RuntimeError("Cyclic parent dependency")
+
+    def __column(self, name: str):
+        if name == 'resource':
+            return _objects(self.resources + [None])[self.resource]
+        if name == 'parent_id':
+            return _objects(list(self.id) + [None])[self.parent]
+        if name in ('id', 'name', 'estimate', 'spent', 'start', 'end', 'min_start', 'milestone'):
+            return self.__getattribute__(name)
+        raise RuntimeError(f"Unknown column '{name}'")
+
+    def __not_none(self, column):
+        np = _numpy()
+        if column.dtype.kind in 'fM':
+            return ~np.isnan(column)
+        if column.dtype == object:
+            return np.array([v is not None for v in column], dtype=bool)
+        return np.ones(len(column), dtype=bool)
+
+    def __scalar(self, column, value):
+        np = _numpy()
+        if column.dtype.kind == 'M':
+            return np.datetime64(value, 'us')
+        return value
+
+    def __match(self, key: str, value: Any):
+        np = _numpy()
+        op = next((o for o in _FILTER_OPS if key.endswith(o)), None)
+        column = self.__column(key[0:-len(op)] if op else key)
+        not_none = self.__not_none(column)
+
+        if op == '_is_none_':
+            return ~not_none
+        if op == '_is_not_none_':
+            return not_none
+        if op in ('_like_', '_not_like_'):
+            regex = re.compile(value)
+            found = np.array([v is not None and regex.search(v) is not None for v in column], dtype=bool)
+            return not_none & (found if op == '_like_' else ~found)
+        if op in ('_in_', '_not_in_'):
+            values = list(value)
+            if column.dtype == object:
+                found = np.array([v in values for v in column], dtype=bool)
+            else:
+                found = np.isin(column, [self.__scalar(column, v) for v in values if v is not None])
+                if None in values:
+                    found |= ~not_none
+            return found if op == '_in_' else ~found
+        if op is None:
+            if value is None:
+                return ~not_none
+            if column.dtype == object:
+                return np.array([v == value for v in column], dtype=bool)
+            return not_none & (column == self.__scalar(column, value))
+
+        if value is None:
+            return np.zeros(len(self), dtype=bool)
+        if column.dtype == object:
+            column = np.where(not_none, column, value)
+        else:
+            value = self.__scalar(column, value)
+        with np.errstate(invalid='ignore'):
+            if op == '_ne_':
+                res = column != value
+            elif op == '_le_':
+                res = column <= value
+            elif op == '_lt_':
+                res = column < value
+            elif op == '_ge_':
+                res = column >= value
+            else:
+                res = column > value
+        return not_none & np.asarray(res, dtype=bool)
+
+    def mask(self, **kwargs):
+        """
+        Vectorized tasks filter. Supports same filters as task lists: field=value, field_gt_=value,
+        field_in_=[values], field_like_='regex', field_is_none_=True, etc.
+        :param kwargs: filters
+        :return: bool array, True for rows matched all filters
+        """
+        np = _numpy()
+        res = np.ones(len(self), dtype=bool)
+        for k, v in kwargs.items():
+            res &= self.__match(k, v)
+        return res
+
+    def select(self, **kwargs):
+        """
+        Rows of tasks matched all filters. See mask for filters description
+        :param kwargs: filters
+        :return: array of rows
+        """
+        return _numpy().flatnonzero(self.mask(**kwargs))
+
+    def tasks(self, wbs: WBS, rows: Optional[Iterable[int]] = None, **kwargs) -> List[Task]:
+        """
+        Tasks of WBS which frame was created from
+        :param wbs: source WBS
+        :param rows: rows of tasks. If None, rows are selected with kwargs filters
+        :param kwargs: filters, see mask
+        :return: list of tasks
+        """
+        if rows is None:
+            rows = self.select(**kwargs)
+        return [wbs[self.id[i]] for i in rows]
+
+    def rollup(self, column: str, how: str = 'sum'):
+        """
+        Aggregates column values of task and all its children
+        :param column: estimate, spent, start, end or min_start
+        :param how: sum, min or max. Dates support min and max only
+        :return: array of aggregated values
+        """
+        np = _numpy()
+        if how not in _ROLLUPS:
+            raise RuntimeError(f"Unsupported rollup '{how}'")
+        if column not in ('estimate', 'spent', 'start', 'end', 'min_start'):
+            raise RuntimeError(f"Column '{column}' can't be rolled up")
+
+        values = self.__getattribute__(column)
+        is_date = values.dtype.kind == 'M'
+        if is_date and how == 'sum':
+            raise RuntimeError("Dates can't be summed")
+
+        missing = np.isnan(values)
+        if is_date:
+            values = values.astype(np.int64)
+
+        if how == 'sum':
+            res = np.where(missing, 0.0, values)
+            ufunc = np.add
+        elif how == 'min':
+            res = np.where(missing, np.iinfo(np.int64).max if is_date else np.inf, values)
+            ufunc = np.minimum
+        else:
+            res = np.where(missing, np.iinfo(np.int64).min if is_date else -np.inf, values)
+            ufunc = np.maximum
+        present = ~missing
+
+        depth = self.__depth()
+        for d in range(int(depth.max()) if len(self) else 0, 0, -1):
+            rows = np.flatnonzero(depth == d)
+            ufunc.at(res, self.parent[rows], res[rows])
+            np.logical_or.at(present, self.parent[rows], present[rows])
+
+        if is_date:
+            res = res.astype('datetime64[us]')
+            res[~present] = np.datetime64('NaT')
+        else:
+            res[~present] = np.nan
+        return res
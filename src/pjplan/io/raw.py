@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import List, Iterable, Any
 
 from pjplan import Task, WBS
+from pjplan.wbs import WBSBuilder
 
 
 class TaskRaw:
@@ -54,9 +55,9 @@ def tasks_to_raws(tasks: Iterable[Task]) -> List[TaskRaw]:
             parent_id=t.parent.id if t.parent and t.parent.id != 0 else None,
             predecessor_ids=[p.id for p in t.predecessors]
         )
-        for k in t.__dict__.keys():
-            if not k.startswith('_') and k not in raw.__dict__:
-                raw.__setattr__(k, t.__getattribute__(k))
+        for k, v in t.to_dict().items():
+            if k not in raw.__dict__:
+                raw.__setattr__(k, v)
 
         raws.append(raw)
 
@@ -65,6 +66,7 @@ def tasks_to_raws(tasks: Iterable[Task]) -> List[TaskRaw]:
 
 def raws_to_wbs(raws: List[TaskRaw]) -> WBS:
     tasks_by_id = {}
+    tasks = []
     for raw in raws:
         t = Task(
             id=raw.id,
@@ -78,35 +80,16 @@ def raws_to_wbs(raws: List[TaskRaw]) -> WBS:
         )
 
         for k in raw.__dict__.keys():
-            if k not in dir(t):
+            if not hasattr(t, k):
                 t.__setattr__(k, raw.__getattribute__(k))
 
         tasks_by_id[t.id] = t
+        tasks.append(t)
 
-    roots = []
-    for raw in raws:
-        task = tasks_by_id[raw.id]
-
-        if raw.parent_id is not None:
-            parent_task = tasks_by_id.get(raw.parent_id)
-            if parent_task is not None:
-                parent_task.children.append(task)
-                task.parent = parent_task
-            else:
-                roots.append(task)
-        else:
-            roots.append(task)
-
-    wbs = WBS()
-    for r in roots:
-        wbs.roots.append(r)
-
-    for raw in raws:
-        task = wbs[raw.id]
-
-        for predecessor_id in raw.predecessor_ids:
-            predecessor_task = wbs[predecessor_id]
-            if predecessor_task is not None:
-                task.predecessors.append(predecessor_task)
+    builder = WBSBuilder()
+    for raw, t in zip(raws, tasks):
+        # Tasks with unknown parent become roots
+        parent_id = raw.parent_id if raw.parent_id in tasks_by_id else None
+        builder.add(t, parent_id, raw.predecessor_ids)
 
-    return wbs
+    return builder.build()
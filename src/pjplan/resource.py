@@ -1,8 +1,12 @@
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, List
 
 from pjplan import IWorkCalendar, DEFAULT_CALENDAR, Task
+from pjplan.calendar import CompiledCalendar, _has_numpy, _day_start, _numpy, _range_days
+
+# Days compiled around the first requested date. Range is doubled when dates outside it are requested
+_COMPILED_DAYS = 366
 
 
 class IResource(ABC):
@@ -24,6 +28,18 @@ class IResource(ABC):
         """
         pass
 
+    def get_available_units_range(self, start: datetime, end: datetime):
+        """
+        Возвращает количество доступных рабочих часов ресурса для каждого дня с start по end (на начало дня).
+        Требует numpy
+        :param start: первый день
+        :param end: последний день
+        :return: массив количества доступных часов по дням
+        """
+        np = _numpy()
+        first, days = _range_days(start, end)
+        return np.array([self.get_available_units(first + timedelta(days=i), None) for i in range(days)], dtype=float)
+
     def get_nearest_availability_date(self, start_date: datetime, direction: int, max_days=100000) -> datetime:
         """
         Возвращает ближайшую дату доступности ресурса, начиная со start_date
@@ -72,11 +88,117 @@ class Resource(IResource):
         """
         super().__init__(name)
         self.calendar = calendar
+        # Calendar compiled for days around requested dates, see __compiled_calendar
+        self.__compiled: Optional[CompiledCalendar] = None
+        # Copy of compiled calendar state for fast lookups: calendar, version, first day and units of days
+        self.__source: Optional[IWorkCalendar] = None
+        self.__version = -1
+        self.__first: Optional[datetime] = None
+        self.__units: List[float] = []
+        # Calendar, which can't be compiled
+        self.__not_compiled: Optional[IWorkCalendar] = None
+        # Optimized calendar with calendar and version it was made for, see __optimized_calendar
+        self.__optimized: Optional[IWorkCalendar] = None
+        self.__optimized_source: Optional[IWorkCalendar] = None
+        self.__optimized_version = -1
+
+    def __optimized_calendar(self) -> IWorkCalendar:
+        """Optimized calendar. Calendar is optimized again when it is changed or units of calendars change"""
+        if self.__optimized_source is not self.calendar or self.__optimized_version != IWorkCalendar.version:
+            self.__optimized = self.calendar.optimize()
+            self.__optimized_source = self.calendar
+            self.__optimized_version = IWorkCalendar.version
+        return self.__optimized
+
+    # noinspection PyProtectedMember
+    def __compiled_calendar(self, date: datetime) -> Optional[CompiledCalendar]:
+        """
+        Compiled calendar, which covers date. Calendar is recompiled when it is changed or date is outside
+        of compiled days
+        :param date: date
+        :return: compiled calendar or None, if calendar depends on time of day or numpy is not installed
+        """
+        calendar = self.calendar
+        compiled = self.__compiled
+        if compiled is not None and compiled.calendar is self.__optimized_calendar() and not compiled.is_stale:
+            if compiled.start <= date < compiled.end + timedelta(days=1):
+                return compiled
+            days = (compiled.end - compiled.start).days + 1
+            start = min(compiled.start, _day_start(date) - timedelta(days=days))
+            end = max(compiled.end, _day_start(date) + timedelta(days=days))
+        else:
+            if calendar is self.__not_compiled:
+                return None
+            if not calendar._is_daily() or not _has_numpy():
+                self.__not_compiled = calendar
+                return None
+            start = _day_start(date) - timedelta(days=_COMPILED_DAYS)
+            end = _day_start(date) + timedelta(days=_COMPILED_DAYS)
+
+        try:
+            compiled = self.__optimized_calendar().compile(start, end)
+        except (ArithmeticError, TypeError, ValueError):
+            self.__compiled = self.__source = self.__first = None
+            self.__units = []
+            self.__not_compiled = calendar
+            return None
+
+        self.__compiled = compiled
+        self.__source = calendar
+        self.__version = IWorkCalendar.version
+        self.__first = compiled.start
+        self.__units = [0 if v is None else v for v in compiled._values()]
+        return compiled
 
     def get_available_units(self, date: datetime, task: Optional[Task] = None) -> float:
-        units = self.calendar.get_available_units(date)
+        if self.__source is self.calendar and self.__version == IWorkCalendar.version:
+            # Compiled calendars of resource depend on day only
+            i = (date - self.__first).days
+            if 0 <= i < len(self.__units):
+                return self.__units[i]
+
+        compiled = self.__compiled_calendar(date)
+        units = (compiled if compiled is not None else self.__optimized_calendar()).get_available_units(date)
         return 0 if units is None else units
 
+    def __calendar_units(self) -> bool:
+        """True if units of resource are units of calendar, i.e. get_available_units is not overridden"""
+        return type(self).get_available_units is Resource.get_available_units
+
+    def get_available_units_range(self, start: datetime, end: datetime):
+        if not self.__calendar_units():
+            return super().get_available_units_range(start, end)
+        units = self.__optimized_calendar().get_available_units_range(start, end)
+        units[_numpy().isnan(units)] = 0
+        return units
+
+    def get_nearest_availability_date(self, start_date: datetime, direction: int, max_days=100000) -> datetime:
+        if not self.__calendar_units():
+            return super().get_nearest_availability_date(start_date, direction, max_days)
+        # Day, which units are checked first
+        day = start_date - timedelta(days=1) if direction < 0 else start_date
+        compiled = self.__compiled_calendar(day)
+        while compiled is not None:
+            found = compiled.nearest_available_day(day, direction)
+            if found is not None:
+                steps = abs((found - _day_start(day)).days)
+                if steps < max_days:
+                    return start_date + timedelta(days=direction * steps)
+                break
+            # No available days till the end of compiled days, compile more days
+            last = compiled.end if direction > 0 else compiled.start
+            if abs((last - _day_start(day)).days) >= max_days:
+                break
+            compiled = self.__compiled_calendar(last + timedelta(days=direction))
+
+        if compiled is None:
+            return super().get_nearest_availability_date(start_date, direction, max_days)
+
+        raise RuntimeError(
+            "Can't find nearest availability time for resource", self.name,
+            "after", (start_date + timedelta(days=direction * max_days)).strftime('%Y-%m-%d')
+        )
+
     def __str__(self):
         return self.name
 
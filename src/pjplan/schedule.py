@@ -2,46 +2,167 @@ import dataclasses
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import List, Set, Callable
+from typing import List, Callable, Dict, Tuple, Optional, Iterator, Any
 
 from pjplan import Task, WBS, IResource, Resource
+from pjplan.calendar import _has_numpy, _is_day_start
+from pjplan.task import _ImmutableTaskList, _TaskMarks
 from pjplan.utils import TextTable, GREEN, YELLOW, GREY, RED
 
 
-def _validate_graph_isolation(project: WBS):
-    all_tasks = {task.id: task for task in project.tasks}
+def _pass_links(task: Task, forward: bool) -> Iterator[Tuple[Task, bool]]:
+    """Tasks which must be calculated before task and True for children"""
+    for t in (task.predecessors if forward else task.successors):
+        yield t, False
+    for t in (task.children if forward else reversed(task.children)):
+        yield t, True
 
-    for t in all_tasks.values():
-        for pr in t.predecessors:
-            if pr.id not in all_tasks and (not pr.start or not pr.end):
-                raise RuntimeError(
-                    "Task {t.id} ({t.name}) has predecessor {pr.id} ({pr.name}) w/o dates and outside wbs"
-                )
-
-
-def _check_loops(project: WBS):
-    validated = set()
-    for t in project.tasks:
-        _check_loops_from_task(t, set(), validated)
 
+class _PassOrder:
+    """
+    Validated order of scheduler pass. Predecessors (successors for backward pass) and children of task are placed
+    before task, in the depth-first order they are reached from roots.
+    Origin of every task is task it was first reached from and True, if it was reached as a child.
+    Task gets min date of origin task, child gets max end of origin predecessors (min start of successors).
+    Tasks of WBS are kept by ids, so order is reused for every clone of unchanged WBS
+    """
 
-def _check_loops_from_task(task: Task, visited_tasks: Set[int], validated: Set[int]):
-    if task.id in validated:
-        return
-
-    if task.id in visited_tasks:
-        raise RuntimeError(
-            "Found circle",
-            [str(t) + "-->" for t in visited_tasks] + [str(task.id) + ":" + task.name]
-        )
-
-    visited_tasks.add(task.id)
-
-    for s in task.predecessors:
-        _check_loops_from_task(s, visited_tasks, validated)
+    def __init__(self, wbs: WBS, forward: bool):
+        """
+        Walks tasks and links of WBS once: builds order, finds cycles, predecessors outside WBS and the latest end
+        :param wbs: WBS
+        :param forward: True for forward pass, False for backward
+        """
+        tasks: List[Task] = []
+        origins: Dict[Task, Tuple[Optional[Task], bool]] = {}
+        # Links with predecessors outside WBS: task id and predecessor
+        self.__external: List[Tuple[Any, Task]] = []
+        # WBS task with the latest end
+        latest: Optional[Task] = None
+
+        entered = _TaskMarks(wbs)
+        done = _TaskMarks(wbs)
+        for root in (wbs.roots if forward else reversed(wbs.roots)):
+            if root in entered:
+                continue
+            entered.add(root)
+            origins[root] = (None, False)
+            stack = [(root, _pass_links(root, forward))]
+            while stack:
+                task, links = stack[-1]
+                for t, is_child in links:
+                    if t not in entered:
+                        entered.add(t)
+                        origins[t] = (task, is_child)
+                        stack.append((t, _pass_links(t, forward)))
+                        break
+                    if t not in done:
+                        path = [f[0] for f in stack]
+                        path = path[next(i for i, v in enumerate(path) if v is t):] + [t]
+                        raise RuntimeError("Cyclic dependency between tasks and their children: " +
+                                           " --> ".join(str(v.id) for v in path))
+                else:
+                    stack.pop()
+                    done.add(task)
+                    tasks.append(task)
+                    if task.wbs is wbs:
+                        for pr in task.predecessors:
+                            if pr.wbs is not wbs:
+                                self.__external.append((task.id, pr))
+                        if task.end is not None and (latest is None or task.end > latest.end):
+                            latest = task
+
+        # Task ids for WBS tasks, tasks themselves for tasks outside WBS
+        self.__tasks: List[Tuple[bool, Any]] = [(t.wbs is wbs, t.id if t.wbs is wbs else t) for t in tasks]
+        positions = {id(t): i for i, t in enumerate(tasks)}
+        # Position of origin task or -1 and True, if task is a child of origin
+        self.__origins: List[Tuple[int, bool]] = []
+        for t in tasks:
+            origin, is_child = origins[t]
+            self.__origins.append((positions[id(origin)] if origin is not None else -1, is_child))
+        self.__latest = latest.id if latest is not None else None
+        self.__latest_end = latest.end if latest is not None else None
+
+    def validate(self, wbs: WBS, check_end_dates: bool):
+        """
+        Checks dates, which are not tracked by WBS: dates of predecessors outside WBS and current time
+        :param wbs: WBS
+        :param check_end_dates: check that no task ends in future
+        """
+        for task_id, pr in self.__external:
+            if not pr.start or not pr.end:
+                t = wbs[task_id]
+                raise RuntimeError(
+                    f"Task {t.id} ({t.name}) has predecessor {pr.id} ({pr.name}) w/o dates and outside wbs"
+                )
+        if check_end_dates and self.__latest_end is not None and self.__latest_end > datetime.now():
+            raise RuntimeError(f"Task {self.__latest} has end date in future. Can't schedule this task.")
 
-    visited_tasks.remove(task.id)
-    validated.add(task.id)
+    # noinspection PyProtectedMember
+    def tasks(self, wbs: WBS) -> Tuple[List[Task], Dict[Task, Tuple[Optional[Task], bool]]]:
+        """
+        Order and origins of tasks of WBS
+        :param wbs: validated WBS or its clone
+        :return: tasks and their origins
+        """
+        registry = wbs._registry()
+        tasks = [registry[key] if internal else key for internal, key in self.__tasks]
+        origins = {}
+        for t, (origin, is_child) in zip(tasks, self.__origins):
+            origins[t] = (tasks[origin] if origin >= 0 else None, is_child)
+        return tasks, origins
+
+
+# noinspection PyProtectedMember
+def _validate(wbs: WBS, clone: WBS, forward: bool, check_end_dates: bool) -> _PassOrder:
+    """
+    Validates WBS before scheduling: no cycles of links and children, predecessors outside WBS have dates
+    and, optionally, no task ends in future. Pass order is cached at WBS until its tasks hierarchy, links or dates
+    change, so repeated validation of unchanged WBS costs O(number of links outside WBS)
+    :param wbs: WBS
+    :param clone: clone of WBS to be scheduled. Clone orders links by WBS order, so order is built on clone
+    :param forward: True for forward pass, False for backward
+    :param check_end_dates: check that no task ends in future
+    :return: pass order
+    """
+    key = (_PassOrder, forward)
+    order = wbs._cached(key)
+    if order is None:
+        order = _PassOrder(clone, forward)
+        wbs._cache(key, order)
+    order.validate(wbs, check_end_dates)
+    return order
+
+
+def _pass_min_date(
+        task: Task,
+        origins: Dict[Task, Tuple[Optional[Task], bool]],
+        min_dates: Dict[Task, datetime],
+        links_bound: Callable[[Task], datetime],
+        default: datetime
+) -> datetime:
+    """
+    Min date of task in scheduler pass, see _PassOrder
+    :param task: task
+    :param origins: origins of tasks
+    :param min_dates: resolved min dates of tasks, updated by call
+    :param links_bound: max end of predecessors (min start of successors) of task
+    :param default: min date of roots
+    :return: min date
+    """
+    chain = []
+    res_task = task
+    while task not in min_dates:
+        origin, is_child = origins[task]
+        if origin is None:
+            min_dates[task] = default
+            break
+        chain.append(task)
+        task = origin
+    for t in reversed(chain):
+        origin, is_child = origins[t]
+        min_dates[t] = links_bound(origin) if is_child else min_dates[origin]
+    return min_dates[res_task]
 
 
 @dataclass(frozen=True)
@@ -85,6 +206,21 @@ class ResourceUsageReport:
 
         resources = set([item.resource for item in self.__rows])
 
+        reserved = {}
+        for item in self.__rows:
+            key = (item.resource, item.date)
+            reserved[key] = reserved.get(key, 0) + item.units
+
+        # Available units of resources for all days of report
+        available = {}
+        if _has_numpy() and _is_day_start(min_date):
+            for k in resources:
+                try:
+                    available[k] = k.get_available_units_range(min_date, max_date).tolist()
+                except ArithmeticError:
+                    # Units of some day can't be calculated. Units of days with reserved units are taken one by one
+                    pass
+
         table = TextTable()
         table.new_row()
         table.new_cell('DATE', RED)
@@ -93,48 +229,54 @@ class ResourceUsageReport:
             table.new_cell(name.upper(), RED)
 
         d = min_date
+        i = 0
         while d <= max_date:
             table.new_row()
             table.new_cell(d.strftime('%y-%m-%d'))
             for k in resources:
-                val = self.reserved(k, d)
+                val = reserved.get((k, d), 0)
                 if val == 0:
                     color = GREY
-                elif val == k.get_available_units(d):
+                elif val == (available[k][i] if k in available else k.get_available_units(d)):
                     color = GREEN
                 else:
                     color = YELLOW
                 table.new_cell(f"{val:.1f}", color)
             d += timedelta(days=1)
+            i += 1
 
         return table.text_repr(True)
 
 
 class _ResourceUsage:
+    """
+    Resource usage ledger.
+    Keeps running totals of reserved units by (resource, day) and by (resource, day, task),
+    so reserve/reserved calls cost O(1) regardless of number of reservations made
+    """
 
     def __init__(self):
         self.rows: List[ResourceUsageRow] = []
+        self.__by_day: Dict[Tuple[IResource, datetime], float] = {}
+        self.__by_task: Dict[Tuple[IResource, datetime, Task], float] = {}
 
     @staticmethod
     def __get_key(date: datetime):
         return datetime(date.year, date.month, date.day, 0, 0, 0, 0)
 
     def reserve(self, resource: IResource, date: datetime, task: Task, units: float) -> float:
-        self.rows.append(ResourceUsageRow(resource, self.__get_key(date), task, units))
+        key = self.__get_key(date)
+        self.rows.append(ResourceUsageRow(resource, key, task, units))
+        self.__by_day[(resource, key)] = self.__by_day.get((resource, key), 0) + units
+        self.__by_task[(resource, key, task)] = self.__by_task.get((resource, key, task), 0) + units
         resource.reserve(date, task, units)
         return units
 
     def reserved(self, resource: IResource, date: datetime, task: Task = None) -> float:
+        key = self.__get_key(date)
         if task is None:
-            units = [item.units
-                     for item in self.rows
-                     if item.resource == resource and item.date == self.__get_key(date)]
-        else:
-            units = [item.units
-                     for item in self.rows
-                     if item.resource == resource and item.date == self.__get_key(date) and item.task == task]
-
-        return sum(units, 0)
+            return self.__by_day.get((resource, key), 0)
+        return self.__by_task.get((resource, key, task), 0)
 
 
 @dataclass(frozen=True)
@@ -147,6 +289,18 @@ class Schedule:
     resource_usage: ResourceUsageReport
     """Resource usage report"""
 
+    def active_on(self, date: datetime) -> _ImmutableTaskList:
+        """
+        Scheduled tasks active on date: task.start <= date <= task.end
+        :param date: date
+        :return: list of tasks
+        """
+        return self.schedule.tasks.active_between(date, date)
+
+    def dispose(self):
+        """Unlinks tasks of schedule, so they are freed without garbage collector, see WBS.dispose"""
+        self.schedule.dispose()
+
 
 class IScheduler(ABC):
     """WBS schedule calculator"""
@@ -237,27 +391,42 @@ class ForwardScheduler(IScheduler):
         percent = reserved / date_available_units
         return date + timedelta(hours=24 * percent)
 
-    def __forward_pass(
+    def __forward_pass(self, wbs: WBS, order: _PassOrder, resource_usage: _ResourceUsage):
+        tasks, origins = order.tasks(wbs)
+        min_dates: Dict[Task, datetime] = {}
+        bounds: Dict[Task, datetime] = {}
+
+        def max_predecessor_ends(task: Task) -> datetime:
+            res = bounds.get(task)
+            if res is None:
+                res = bounds[task] = max(
+                    [t.end for t in task.predecessors if t.end is not None] + [min_dates[task]]
+                )
+            return res
+
+        for t in tasks:
+            min_date = _pass_min_date(t, origins, min_dates, max_predecessor_ends, self.__start)
+            self.__calc_task(t, min_date, max_predecessor_ends(t), resource_usage)
+
+    def __calc_task(
             self,
             _task: Task,
             min_date: datetime,
-            resource_usage: _ResourceUsage,
-            calculated: List[int]
+            max_predecessor_ends: datetime,
+            resource_usage: _ResourceUsage
     ):
-        if _task.id in calculated:
-            return
-
-        for pred in _task.predecessors:
-            self.__forward_pass(pred, min_date, resource_usage, calculated)
-
-        max_predecessor_ends = max([t.end for t in _task.predecessors if t.end is not None] + [min_date])
-
-        for ch in _task.children:
-            self.__forward_pass(ch, max_predecessor_ends, resource_usage, calculated)
-
+        """
+        Calculates task, which predecessors and children are already calculated
+        :param _task: task
+        :param min_date: task can't start before this date
+        :param max_predecessor_ends: max of min_date and ends of predecessors
+        :param resource_usage: resource usage
+        """
         resource = self.__resources.setdefault(_task.resource, Resource(_task.resource))
 
         is_leaf = len(_task.children) == 0
+        # Totals of children, they are already calculated
+        rollup = None if is_leaf else _task.rollup
 
         if _task.milestone:
             _task.start = _task.end = max_predecessor_ends
@@ -281,13 +450,13 @@ class ForwardScheduler(IScheduler):
                 if is_leaf:
                     _task.estimate = self.__default_estimate
                 else:
-                    _task.estimate = sum([ch.estimate for ch in _task.children])
+                    _task.estimate = rollup.estimate
 
             if _task.spent is None:
                 if is_leaf:
                     _task.spent = 0
                 else:
-                    _task.spent = sum([ch.spent for ch in _task.children])
+                    _task.spent = rollup.spent
 
             if _task.end is None:
                 if is_leaf:
@@ -300,22 +469,16 @@ class ForwardScheduler(IScheduler):
                         datetime.now()
                     )
                 else:
-                    _task.end = max([t.end for t in _task.children if t.end is not None])
-
-        calculated.append(_task.id)
+                    _task.end = rollup.end
 
+    # noinspection PyProtectedMember
     def calc(self, wbs: WBS) -> Schedule:
-        _validate_graph_isolation(wbs)
-        _check_loops(wbs)
-        self.__check_no_end_dates_in_future(wbs)
-
-        forward = wbs.clone()
+        forward = wbs._schedule_copy()
+        order = _validate(wbs, forward, True, True)
         self.__prepare_tasks(forward)
 
         forward_resource_usage = _ResourceUsage()
-        calculated = []
-        for t in forward.roots:
-            self.__forward_pass(t, self.__start, forward_resource_usage, calculated)
+        self.__forward_pass(forward, order, forward_resource_usage)
 
         return Schedule(
             forward,
@@ -323,13 +486,6 @@ class ForwardScheduler(IScheduler):
             ResourceUsageReport(forward_resource_usage.rows)
         )
 
-    @staticmethod
-    def __check_no_end_dates_in_future(project: WBS):
-        now = datetime.now()
-        for t in project.tasks:
-            if t.end is not None and t.end > now:
-                raise RuntimeError(f"Task {t.id} has end date in future. Can't schedule this task.")
-
     @staticmethod
     def __prepare_tasks(project: WBS):
         for t in project.tasks:
@@ -409,27 +565,42 @@ class BackwardScheduler(IScheduler):
 
         return date + timedelta(days=1) - timedelta(hours=24 * percent)
 
-    def __backward_pass(
+    def __backward_pass(self, wbs: WBS, order: _PassOrder, resource_usage: _ResourceUsage):
+        tasks, origins = order.tasks(wbs)
+        min_dates: Dict[Task, datetime] = {}
+        bounds: Dict[Task, datetime] = {}
+
+        def min_successor_starts(task: Task) -> datetime:
+            res = bounds.get(task)
+            if res is None:
+                res = bounds[task] = min(
+                    [t.start for t in task.successors if t.start is not None] + [min_dates[task]]
+                )
+            return res
+
+        for t in tasks:
+            min_date = _pass_min_date(t, origins, min_dates, min_successor_starts, self.__end)
+            self.__calc_task(t, min_date, min_successor_starts(t), resource_usage)
+
+    def __calc_task(
             self,
             _task: Task,
             min_date: datetime,
-            resource_usage: _ResourceUsage,
-            calculated: List[int]
+            min_successor_starts: datetime,
+            resource_usage: _ResourceUsage
     ):
-        if _task.id in calculated:
-            return
-
-        for pred in _task.successors:
-            self.__backward_pass(pred, min_date, resource_usage, calculated)
-
-        min_successor_starts = min([t.start for t in _task.successors if t.start is not None] + [min_date])
-
-        for ch in reversed(_task.children):
-            self.__backward_pass(ch, min_successor_starts, resource_usage, calculated)
-
+        """
+        Calculates task, which successors and children are already calculated
+        :param _task: task
+        :param min_date: task can't end after this date
+        :param min_successor_starts: min of min_date and starts of successors
+        :param resource_usage: resource usage
+        """
         resource = self.__resources.setdefault(_task.resource, Resource(_task.resource))
 
         is_leaf = len(_task.children) == 0
+        # Totals of children, they are already calculated
+        rollup = None if is_leaf else _task.rollup
 
         if _task.milestone:
             _task.start = _task.end = min_successor_starts
@@ -452,13 +623,13 @@ class BackwardScheduler(IScheduler):
                 if is_leaf:
                     _task.estimate = self.__default_estimate
                 else:
-                    _task.estimate = sum([ch.estimate for ch in _task.children])
+                    _task.estimate = rollup.estimate
 
             if _task.spent is None:
                 if is_leaf:
                     _task.spent = 0
                 else:
-                    _task.spent = sum([ch.spent for ch in _task.children])
+                    _task.spent = rollup.spent
 
             if is_leaf:
                 left_hours = max(_task.estimate - _task.spent, 0)
@@ -470,9 +641,7 @@ class BackwardScheduler(IScheduler):
                     start = min(_task.start, start)
                 _task.start = start
             else:
-                _task.start = min([t.start for t in _task.children if t.start is not None])
-
-        calculated.append(_task.id)
+                _task.start = rollup.start
 
     @staticmethod
     def __prepare_tasks(project: WBS):
@@ -480,19 +649,14 @@ class BackwardScheduler(IScheduler):
             if len(t.children) > 0:
                 t.start = t.end = t.estimate = t.spent = None
 
+    # noinspection PyProtectedMember
     def calc(self, project: WBS) -> Schedule:
-        _validate_graph_isolation(project)
-        _check_loops(project)
-
-        backward = project.clone()
+        backward = project._schedule_copy()
+        order = _validate(project, backward, False, False)
         self.__prepare_tasks(backward)
 
         backward_resource_usage = _ResourceUsage()
-        backward_roots = backward.roots
-
-        calculated = []
-        for i in range(len(backward_roots) - 1, -1, -1):
-            self.__backward_pass(backward_roots[i], self.__end, backward_resource_usage, calculated)
+        self.__backward_pass(backward, order, backward_resource_usage)
 
         return Schedule(
             backward,
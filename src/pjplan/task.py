@@ -1,18 +1,26 @@
+import bisect
+import heapq
+import itertools
+import operator
 import re
 import sys
 from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import List, Optional, Union, Iterable, Callable, Any
+from collections import deque
+from typing import List, Optional, Union, Iterable, Iterator, Callable, Any, Dict, Sequence, Tuple, NamedTuple
 
 from pjplan.utils import GREY, RED, PINK, YELLOW, TEAL, BLUE, TextTable
 
 EMPTY_TASK_ID = sys.maxsize
 
+# Source of initial positions of tasks in topological order
+_ORDER = itertools.count()
+
 
 def _to_list(val: Union['Task', Iterable['Task']]) -> List['Task']:
     if val is None:
         return []
-    elif type(val) is Task:
+    elif isinstance(val, Task):
         return [val]
     elif type(val) is list or type(val) is tuple or type(val) is set or isinstance(val, Iterable):
         return [t for t in val if t is not None]
@@ -20,35 +28,87 @@ def _to_list(val: Union['Task', Iterable['Task']]) -> List['Task']:
         raise RuntimeError("Unsupported type", type(val))
 
 
+# Shared empty storage for task links. Link lists are created on first link only
+_NO_TASKS = ()
+
+# Task attributes stored in slots, which are exported with custom attributes
+_TASK_FIELDS = ('name', 'resource', 'start', 'end', 'milestone', 'min_start')
+
+
+def _custom_attributes(task: 'Task') -> Dict[str, Any]:
+    """
+    Attributes of task kept in instance __dict__, i.e. custom attributes. Reading __dict__ creates it,
+    so empty __dict__ is dropped again and tasks without custom attributes stay small
+    """
+    attributes = task.__dict__
+    if not attributes:
+        del task.__dict__
+    return attributes
+
+
+def _has_task_attribute(task: 'Task', name: str) -> bool:
+    """Checks task has data field or custom attribute with specified name"""
+    return name in _TASK_FIELDS or (not hasattr(Task, name) and hasattr(task, name))
+
+
 def _find_root(task: 'Task'):
-    if task.parent is not None:
-        return _find_root(task.parent)
+    while task.parent is not None:
+        task = task.parent
     return task
 
 
+# noinspection PyProtectedMember
+def _iter_subtree(task: 'Task', order: str = 'pre', prune: Callable[['Task'], bool] = None) -> Iterator['Task']:
+    """
+    Iterates all children of task without recursion
+    :param task: task
+    :param order: 'pre' - parent before its children, 'post' - children before parent, 'bfs' - level by level
+    :param prune: children of tasks matching this predicate are not iterated
+    :return: iterator over tasks
+    """
+    if order == 'pre':
+        stack = list(reversed(task._children_links()))
+        while stack:
+            t = stack.pop()
+            yield t
+            if prune is None or not prune(t):
+                stack.extend(reversed(t._children_links()))
+    elif order == 'post':
+        stack = [(t, False) for t in reversed(task._children_links())]
+        while stack:
+            t, expanded = stack.pop()
+            if expanded:
+                yield t
+                continue
+            stack.append((t, True))
+            if prune is None or not prune(t):
+                stack.extend((ch, False) for ch in reversed(t._children_links()))
+    elif order == 'bfs':
+        queue = deque(task._children_links())
+        while queue:
+            t = queue.popleft()
+            yield t
+            if prune is None or not prune(t):
+                queue.extend(t._children_links())
+    else:
+        raise RuntimeError(f"Unknown tasks order '{order}'")
+
+
 def _collect_subtree(task: 'Task') -> List['Task']:
     res = [task]
-    for ch in task.children:
-        res += _collect_subtree(ch)
+    res.extend(_iter_subtree(task))
     return res
 
 
-def _has_id_intersection(parent: 'Task', children: Iterable['Task']):
-    parent_root = _find_root(parent)
-    parent_tree = _collect_subtree(parent_root)
-    all_children_tasks = []
-    for ch in children:
-        all_children_tasks += _collect_subtree(ch)
-
-    parent_tree_object_ids = set([id(t) for t in parent_tree])
-    new_tasks = [t for t in all_children_tasks if id(t) not in parent_tree_object_ids]
-
-    if len(new_tasks) == 0:
-        return False
-
-    parent_tree_ids = set([t.id for t in parent_tree])
-    new_task_ids = set([t.id for t in new_tasks])
-    return len(parent_tree_ids.intersection(new_task_ids)) > 0
+def _has_id_intersection(registry: Dict[Any, 'Task'], tasks: Dict[Any, 'Task']) -> bool:
+    """Checks if any of tasks ids is already used by another task object in registry"""
+    if len(registry) < len(tasks):
+        registry, tasks = tasks, registry
+    for k, v in tasks.items():
+        other = registry.get(k)
+        if other is not None and other is not v:
+            return True
+    return False
 
 
 def _check_not_none(obj: Any, name: str):
@@ -62,6 +122,119 @@ def _check_no_nones_in_list(lst: List, name: str):
             raise RuntimeError(f"{name} contains None value")
 
 
+# Link lists longer than this are converted to _TaskSet, so membership checks for hub tasks are not linear
+_TASK_SET_MIN_SIZE = 64
+
+
+class _TaskSet:
+    """
+    Insertion ordered set of tasks with read-only list interface. Storage of task links with large fan-out:
+    append/remove/contains are O(1), list for iteration and indexing is built on demand
+    """
+
+    __slots__ = ('__tasks', '__list')
+
+    def __init__(self, tasks: Iterable['Task'] = ()):
+        # Tasks are hashed by identity, dict keeps insertion order
+        self.__tasks: Dict['Task', None] = dict.fromkeys(tasks)
+        self.__list: Optional[List['Task']] = None
+
+    def __as_list(self) -> List['Task']:
+        if self.__list is None:
+            self.__list = list(self.__tasks)
+        return self.__list
+
+    def append(self, task: 'Task'):
+        if task not in self.__tasks:
+            self.__tasks[task] = None
+            if self.__list is not None:
+                self.__list.append(task)
+
+    def remove(self, task: 'Task'):
+        if task not in self.__tasks:
+            raise ValueError(f"Task {task.id} not found")
+        del self.__tasks[task]
+        self.__list = None
+
+    def index(self, task: 'Task') -> int:
+        return self.__as_list().index(task)
+
+    def __contains__(self, task: 'Task') -> bool:
+        return task in self.__tasks
+
+    def __len__(self) -> int:
+        return len(self.__tasks)
+
+    def __iter__(self):
+        return iter(self.__as_list())
+
+    def __reversed__(self):
+        return reversed(self.__as_list())
+
+    def __getitem__(self, item):
+        return self.__as_list()[item]
+
+    def __add__(self, other):
+        return self.__as_list() + other
+
+    def __eq__(self, other):
+        return self.__as_list().__eq__(other)
+
+    def __str__(self) -> str:
+        return self.__as_list().__str__()
+
+    def __repr__(self) -> str:
+        return self.__as_list().__repr__()
+
+
+def _task_links(tasks: List['Task']) -> Union[List['Task'], _TaskSet]:
+    """Storage for task links: list for small number of tasks, _TaskSet for large"""
+    return _TaskSet(tasks) if len(tasks) > _TASK_SET_MIN_SIZE else tasks
+
+
+def _append_link(links: Union[Sequence['Task'], _TaskSet], task: 'Task') -> Union[List['Task'], _TaskSet]:
+    """Appends task to link storage, returns storage to keep in task"""
+    if links is _NO_TASKS:
+        return [task]
+    links.append(task)
+    if type(links) is list and len(links) > _TASK_SET_MIN_SIZE:
+        return _TaskSet(links)
+    return links
+
+
+# noinspection PyProtectedMember
+class _TaskMarks:
+    """
+    Set of tasks used by graph algorithms. Tasks of WBS are marked in array by their dense indexes (Task._idx),
+    other tasks (i.e. from another project) are kept in set
+    """
+
+    __slots__ = ('__wbs', '__marks', '__others')
+
+    def __init__(self, wbs: 'WBS'):
+        self.__wbs = wbs
+        # Last item is for WBS root task, which has index -1
+        self.__marks = bytearray(len(wbs._tasks_by_idx()) + 1)
+        self.__others = set()
+
+    def add(self, task: 'Task'):
+        if task.wbs is self.__wbs:
+            self.__marks[task._idx] = 1
+        else:
+            self.__others.add(task)
+
+    def discard(self, task: 'Task'):
+        if task.wbs is self.__wbs:
+            self.__marks[task._idx] = 0
+        else:
+            self.__others.discard(task)
+
+    def __contains__(self, task: 'Task') -> bool:
+        if task.wbs is self.__wbs:
+            return self.__marks[task._idx] == 1
+        return task in self.__others
+
+
 def _unique_tasks(tasks):
     m = set()
     res = []
@@ -73,6 +246,275 @@ def _unique_tasks(tasks):
     return res
 
 
+def _unique_objects(tasks: Iterable['Task']) -> List['Task']:
+    m = set()
+    res = []
+    for t in tasks:
+        if id(t) not in m:
+            m.add(id(t))
+            res.append(t)
+
+    return res
+
+
+class TaskRollup(NamedTuple):
+    """
+    Totals of task subtree leaves, see Task.rollup. Milestones are rolled up as leaves
+    """
+    estimate: float
+    """Sum of estimates, None estimates are counted as 0"""
+    spent: float
+    """Sum of spent times, None spent times are counted as 0"""
+    start: Optional[datetime]
+    """Minimal start date, None if no leaf has start date"""
+    end: Optional[datetime]
+    """Maximal end date, None if no leaf has end date"""
+    leaves: int
+    """Number of leaves"""
+
+
+# Task fields totals are calculated from
+_ROLLUP_FIELDS = frozenset(('estimate', 'spent', 'start', 'end', 'milestone'))
+
+
+class _ClosureCache:
+    """
+    Memoized transitive closures of predecessor/successor links of WBS tasks. WBS invalidates it on changes
+    of its links and tasks only, so closures reaching tasks outside of WBS are not memoized:
+    their links change without notice to this WBS
+    """
+
+    def __init__(self):
+        self.__closures = {}
+
+    def invalidate(self):
+        if self.__closures:
+            self.__closures = {}
+
+    def get(self, task: 'Task', successors: bool):
+        return self.__closures.get((task, successors))
+
+    def put(self, task: 'Task', successors: bool, closure):
+        self.__closures[(task, successors)] = closure
+
+
+# noinspection PyProtectedMember
+def _links_changed(tasks: Iterable['Task']) -> bool:
+    """
+    Invalidates link closures and versions of WBS of tasks, which links changed
+    :return: True if WBS of any task tracks changes, so link changes must be recorded with _record_link
+    """
+    tracked = False
+    for t in tasks:
+        wbs = t.wbs
+        if wbs is not None:
+            wbs._links_changed()
+            if wbs._changes() is not None:
+                tracked = True
+    return tracked
+
+
+# Marks attributes, which did not exist before change
+_MISSING = object()
+
+# Task links are saved by _Batch with all other links of task, not as attributes
+_LINK_ATTRIBUTES = frozenset(('parent', 'children', 'predecessors', 'successors'))
+
+
+class TaskChange(NamedTuple):
+    """Change of WBS task, see WBS.track_changes"""
+    version: int
+    """Version of WBS changes journal after this change"""
+    kind: str
+    """
+    'add' - task added to WBS, 'remove' - task removed from WBS, 'attribute' - attribute changed,
+    'parent' - parent changed, 'link' - predecessor added, 'unlink' - predecessor removed
+    """
+    task: 'Task'
+    """Changed task. Successor task for 'link' and 'unlink' changes"""
+    name: Optional[str] = None
+    """Attribute name for 'attribute' change"""
+    old: Any = None
+    """Old attribute value or old parent. Removed predecessor for 'unlink' change"""
+    new: Any = None
+    """New attribute value or new parent. Added predecessor for 'link' change"""
+
+
+class _ChangeJournal:
+    """Journal of WBS changes with subscribers, see WBS.track_changes"""
+
+    def __init__(self, wbs: 'WBS'):
+        """
+        :param wbs: WBS of journal. Changes made in batch of WBS are notified at the end of batch
+        """
+        self.__wbs = wbs
+        self.__version = 0
+        self.__changes: List[TaskChange] = []
+        self.__versions: List[int] = []
+        self.subscribers: List[Callable[[List[TaskChange]], None]] = []
+
+    @property
+    def version(self) -> int:
+        return self.__version
+
+    def record(self, task: 'Task', kind: str, name: str = None, old: Any = None, new: Any = None):
+        batch = self.__wbs._batch()
+        if batch is not None:
+            batch.save_changes(self)
+        self.__version += 1
+        change = TaskChange(self.__version, kind, task, name, old, new)
+        self.__changes.append(change)
+        self.__versions.append(self.__version)
+        if batch is None:
+            self.notify([change])
+
+    def notify(self, changes: List[TaskChange]):
+        if changes:
+            for callback in list(self.subscribers):
+                callback(changes)
+
+    def size(self) -> int:
+        return len(self.__changes)
+
+    def since(self, version: int) -> List[TaskChange]:
+        return self.__changes[bisect.bisect_right(self.__versions, version):]
+
+    def tail(self, size: int) -> List[TaskChange]:
+        """Changes recorded after journal had specified size"""
+        return self.__changes[size:]
+
+    def truncate(self, size: int):
+        """Drops changes recorded after journal had specified size. Versions are not reused"""
+        del self.__changes[size:]
+        del self.__versions[size:]
+
+    def clear(self, version: int):
+        """Drops changes up to version"""
+        pos = bisect.bisect_right(self.__versions, version)
+        del self.__changes[:pos]
+        del self.__versions[:pos]
+
+
+def _real_parent(task: Optional['Task']) -> Optional['Task']:
+    """Parent task as seen by user: None for root of WBS"""
+    return None if task is None or task.id == EMPTY_TASK_ID else task
+
+
+def _record_link(predecessor: 'Task', successor: 'Task', added: bool):
+    """Records link change in journals of WBS of both tasks"""
+    journals = []
+    for wbs in (successor.wbs, predecessor.wbs):
+        journal = wbs._changes() if wbs is not None else None
+        if journal is not None and journal not in journals:
+            journals.append(journal)
+            if added:
+                journal.record(successor, 'link', new=predecessor)
+            else:
+                journal.record(successor, 'unlink', old=predecessor)
+
+
+class _Batch:
+    """
+    Journal of changes made inside WBS.batch(). Keeps state of every task and attribute before first change, so
+    all changes can be rolled back. Collects new links, which checks are deferred until commit.
+    Batch is active in one WBS, see WBS._batch
+    """
+
+    def __init__(self):
+        self.__tasks: Dict[int, Tuple['Task', tuple]] = {}
+        self.__attributes: Dict[Tuple[int, str], Tuple['Task', str, Any]] = {}
+        self.__registries: Dict[int, Tuple['WBS', Dict[Any, 'Task']]] = {}
+        # Change journals with their sizes before batch
+        self.__journals: Dict[int, Tuple[_ChangeJournal, int]] = {}
+        # New links: predecessor, successor and True if predecessor must not be a parent of successor,
+        # False if successor must not be a parent of predecessor
+        self.links: List[Tuple['Task', 'Task', bool]] = []
+
+    # noinspection PyProtectedMember
+    def save(self, task: 'Task'):
+        if id(task) not in self.__tasks:
+            self.__tasks[id(task)] = (task, task._links_state())
+
+    def save_attribute(self, task: 'Task', key: str):
+        if key not in _LINK_ATTRIBUTES and (id(task), key) not in self.__attributes:
+            self.__attributes[(id(task), key)] = (task, key, getattr(task, key, _MISSING))
+
+    def save_registry(self, wbs: 'WBS', registry: Dict[Any, 'Task']):
+        if id(wbs) not in self.__registries:
+            self.__registries[id(wbs)] = (wbs, dict(registry))
+
+    def save_changes(self, journal: _ChangeJournal):
+        if id(journal) not in self.__journals:
+            self.__journals[id(journal)] = (journal, journal.size())
+
+    def notify(self):
+        """Notifies subscribers of change journals about all changes made in batch"""
+        for journal, size in self.__journals.values():
+            journal.notify(journal.tail(size))
+
+    # noinspection PyProtectedMember
+    def rollback(self):
+        """Restores state of all changed tasks and WBS registries"""
+        for task, key, value in self.__attributes.values():
+            if value is _MISSING:
+                if hasattr(task, key):
+                    delattr(task, key)
+            else:
+                setattr(task, key, value)
+
+        wbs_list = {}
+        for task, state in self.__tasks.values():
+            for wbs in (task.wbs, state[0]):
+                if wbs is not None:
+                    wbs_list[id(wbs)] = wbs
+            task._restore_links_state(state)
+        for task, _ in self.__tasks.values():
+            task._rollup_changed(all_parents=True)
+            if task.wbs is None:
+                task._unwatch()
+
+        for wbs, registry in self.__registries.values():
+            wbs_list[id(wbs)] = wbs
+            wbs._restore_registry(registry)
+
+        for wbs in wbs_list.values():
+            wbs._rebuild_indexes()
+            wbs._links_changed()
+
+        for journal, size in self.__journals.values():
+            journal.truncate(size)
+
+
+# noinspection PyProtectedMember
+def _journal(tasks: Sequence['Task']) -> Optional[_Batch]:
+    """
+    Saves state of tasks before change, if WBS of tasks has active batch
+    :return: active batch or None
+    :raises RuntimeError: if tasks of WBS with active batch are changed together with tasks of other WBS
+    """
+    batch = None
+    first = None
+    mixed = False
+    for t in tasks:
+        wbs = t.wbs if t is not None else None
+        if wbs is None:
+            continue
+        if first is None:
+            first = wbs
+        elif wbs is not first:
+            mixed = True
+        if batch is None:
+            batch = wbs._batch()
+    if batch is None:
+        return None
+    if mixed:
+        raise RuntimeError("Tasks of other WBS can't be changed in batch")
+    for t in tasks:
+        if t is not None:
+            batch.save(t)
+    return batch
+
+
 class _Repr:
     """Utility class for print task sheets"""
 
@@ -81,12 +523,22 @@ class _Repr:
         'level_colors': [BLUE, TEAL, YELLOW, PINK, RED, GREY]
     }
 
+    # noinspection PyProtectedMember
+    @staticmethod
+    def __iter_levels(tasks: Iterable['Task'], children=True):
+        """Iterates tasks and (optionally) their children in print order, with nesting levels"""
+        stack = [(t, 0) for t in reversed(list(tasks))]
+        while stack:
+            task, level = stack.pop()
+            yield task, level
+            if children:
+                stack.extend((ch, level + 1) for ch in reversed(task._children_links()))
+
     @staticmethod
     def __calc_max_title_len(task: 'Task', level, _current_max):
-        name_len = len(task.name) if task.name is not None else 0
-        _current_max = max(_current_max, len('   ' * level) + name_len)
-        for ch in task.children:
-            _current_max = _Repr.__calc_max_title_len(ch, level + 1, _current_max)
+        for t, lvl in _Repr.__iter_levels([task]):
+            name_len = len(t.name) if t.name is not None else 0
+            _current_max = max(_current_max, len('   ' * (level + lvl)) + name_len)
         return _current_max
 
     @staticmethod
@@ -103,12 +555,14 @@ class _Repr:
             res.append(_Repr.__get_linked_task_id(task, t))
         return ','.join(res)
 
+    # noinspection PyProtectedMember
     @staticmethod
     def __get_field_value(t: 'Task', field: str) -> str:
+        # Link storage is read directly, so printing doesn't create list views of tasks
         if field == 'predecessors':
-            return '[' + _Repr.__get_linked_tasks_id(t, t.predecessors) + ']'
+            return '[' + _Repr.__get_linked_tasks_id(t, t._predecessors_links()) + ']'
         if field == 'successors':
-            return '[' + _Repr.__get_linked_tasks_id(t, t.successors) + ']'
+            return '[' + _Repr.__get_linked_tasks_id(t, t._successors_links()) + ']'
         if field == 'parent':
             return _Repr.__get_linked_task_id(t, t.parent)
         if field == 'id':
@@ -118,9 +572,9 @@ class _Repr:
         if field == 'spent':
             return '-' if t.spent is None else str(t.spent)
 
-        if field not in t.__dict__:
+        if not _has_task_attribute(t, field):
             field = field.lower()
-            if field not in t.__dict__:
+            if not _has_task_attribute(t, field):
                 return ''
 
         v = t.__getattribute__(field)
@@ -135,15 +589,14 @@ class _Repr:
     @staticmethod
     def __max_field_len(tasks: Iterable['Task'], field: str) -> int:
         max_len = len(field) + 1
-        for t in tasks:
+        for t, _ in _Repr.__iter_levels(tasks):
             max_len = max(max_len, len(_Repr.__get_field_value(t, field)))
-            max_len = max(max_len, _Repr.__max_field_len(t.children, field))
 
         return max_len
 
     # noinspection PyUnresolvedReferences
     @staticmethod
-    def __print_task_subtree(task: 'Task', fields: Iterable[str], level, table: TextTable, children, theme):
+    def __print_task(task: 'Task', fields: Iterable[str], level, table: TextTable, theme):
         values = []
         for f in fields:
             if f == 'name':
@@ -151,10 +604,7 @@ class _Repr:
             else:
                 values.append(_Repr.__get_field_value(task, f))
 
-        if 'print_color' in task.__dict__:
-            color = task.print_color
-        else:
-            color = None
+        color = getattr(task, 'print_color', None)
 
         if color is None:
             colors = theme['level_colors']
@@ -164,10 +614,6 @@ class _Repr:
         for v in values:
             table.new_cell(v)
 
-        if children:
-            for ch in task.children:
-                _Repr.__print_task_subtree(ch, fields, level + 1, table, children, theme)
-
     @staticmethod
     def repr(tasks: Iterable['Task'], fields: Iterable[str] = None, children=True, theme: dict = None):
         if fields is None:
@@ -183,15 +629,177 @@ class _Repr:
         for s in fields:
             table.new_cell(s.upper())
 
-        for _task in tasks:
-            _Repr.__print_task_subtree(_task, fields, 0, table, children, theme)
+        for _task, level in _Repr.__iter_levels(tasks, children):
+            _Repr.__print_task(_task, fields, level, table, theme)
 
         return table.text_repr()
 
 
+# Filter operators in order of suffix matching, with cost rank used to order compiled predicates
+_QUERY_OPS = (
+    ('_not_like_', 4), ('_like_', 4), ('_not_in_', 3), ('_is_none_', 0), ('_is_not_none_', 0), ('_in_', 3),
+    ('_ne_', 2), ('_le_', 2), ('_lt_', 2), ('_ge_', 2), ('_gt_', 2)
+)
+
+_QUERY_CACHE_SIZE = 256
+
+
+def _task_attribute_getter(name: str) -> Callable[['Task'], Any]:
+    """Compiles task attribute access used by filters. Unknown attributes are None"""
+    if name == 'parent_id':
+        return lambda t: t.parent.id if t.parent else None
+    if name in _TASK_FIELDS or name in ('id', 'estimate', 'spent'):
+        return operator.attrgetter(name)
+    if hasattr(Task, name):
+        return lambda t: None
+    return lambda t: getattr(t, name, None)
+
+
+def _query_values(v: Any) -> Any:
+    """Container for fast _in_/_not_in_ lookup. Unhashable values keep original container"""
+    if type(v) in (list, tuple, set, frozenset):
+        try:
+            return frozenset(v)
+        except TypeError:
+            return v
+    return v
+
+
+def _contains(values: Any, v: Any) -> bool:
+    try:
+        return v in values
+    except TypeError:
+        # Unhashable attribute value, search it in frozen container by equality
+        return any(v == x for x in values)
+
+
+def _parse_filter(key: str) -> Tuple[str, Optional[str], int]:
+    """Splits filter name to attribute name, operator suffix (None for equality) and cost rank"""
+    op, cost = next(((o, c) for o, c in _QUERY_OPS if key.endswith(o)), (None, 1))
+    return (key[0:-len(op)] if op else key), op, cost
+
+
+def _query_predicate(key: str, value: Any) -> Tuple[int, Callable[['Task'], bool]]:
+    """Compiles one filter to (cost, predicate)"""
+    name, op, cost = _parse_filter(key)
+    get = _task_attribute_getter(name)
+
+    if op == '_not_like_' or op == '_like_':
+        search = re.compile(value).search
+        found = op == '_like_'
+
+        def like(t):
+            val = get(t)
+            return val is not None and (search(val) is not None) == found
+        return cost, like
+
+    if op == '_not_in_' or op == '_in_':
+        values = _query_values(value)
+        found = op == '_in_'
+        return cost, lambda t: _contains(values, get(t)) == found
+
+    if op == '_is_none_':
+        return cost, lambda t: get(t) is None
+    if op == '_is_not_none_':
+        return cost, lambda t: get(t) is not None
+    if op is None:
+        return cost, lambda t: not get(t) != value
+
+    compare = {
+        '_ne_': operator.ne, '_le_': operator.le, '_lt_': operator.lt, '_ge_': operator.ge, '_gt_': operator.gt
+    }[op]
+
+    def check(t):
+        val = get(t)
+        return val is not None and bool(compare(val, value))
+    return cost, check
+
+
+def _query_cache_key(kwargs: Dict[str, Any]) -> Optional[tuple]:
+    key = tuple(
+        (k, type(v), tuple(v) if type(v) in (list, tuple, set, frozenset) else v) for k, v in kwargs.items()
+    )
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class TaskQuery:
+    """
+    Compiled task filter. Accepts same filters as task lists: field=value, field_gt_=value, field_in_=[values],
+    field_like_='regex', field_is_none_=True, etc. Filters are compiled to predicates once and checked
+    cheapest first, so query may be reused for many searches:
+
+    q = TaskQuery(resource='Dev', estimate_gt_=8)
+    wbs.tasks(q)
+    """
+
+    __cache: Dict[tuple, 'TaskQuery'] = {}
+
+    def __init__(self, **kwargs):
+        """
+        :param kwargs: task filters
+        """
+        self.__filters = dict(kwargs)
+        predicates = [_query_predicate(k, v) for k, v in kwargs.items()]
+        # Stable sort keeps filters order for predicates with same cost
+        self.__predicates = [p for _, p in sorted(predicates, key=lambda cp: cp[0])]
+
+    @staticmethod
+    def compile(**kwargs) -> 'TaskQuery':
+        """
+        Returns compiled query for filters. Queries are cached by filters
+        :param kwargs: task filters
+        :return: query
+        """
+        key = _query_cache_key(kwargs)
+        if key is None:
+            return TaskQuery(**kwargs)
+
+        cache = TaskQuery.__cache
+        query = cache.pop(key, None)
+        if query is None:
+            query = TaskQuery(**kwargs)
+            if len(cache) >= _QUERY_CACHE_SIZE:
+                del cache[next(iter(cache))]
+        cache[key] = query
+        return query
+
+    def _filters(self) -> Dict[str, Any]:
+        return self.__filters
+
+    def __call__(self, task: 'Task') -> bool:
+        """
+        Checks task matches all filters
+        :param task: task
+        :return: True if matched
+        """
+        for p in self.__predicates:
+            if not p(task):
+                return False
+        return True
+
+    def filter(self, tasks: Iterable['Task']) -> List['Task']:
+        """
+        Returns tasks matched all filters, in same order
+        :param tasks: tasks to filter
+        :return: matched tasks
+        """
+        res = [t for t in tasks]
+        for p in self.__predicates:
+            if not res:
+                break
+            res = [t for t in res if p(t)]
+        return res
+
+
 class _ImmutableTaskList:
     """Immutable task list implementation"""
 
+    __slots__ = ('_list',)
+
     def __init__(self, _list: List['Task']):
         self._list = _list
 
@@ -205,14 +813,6 @@ class _ImmutableTaskList:
         _check_not_none(task, "Task")
         return self._list.index(task)
 
-    @staticmethod
-    def __get_task_attribute(t: 'Task', attribute_name: str):
-        if attribute_name == 'parent_id':
-            return t.parent.id if t.parent else None
-        if attribute_name == 'id':
-            return t.id
-        return t.__getattribute__(attribute_name) if attribute_name in t.__dict__ else None
-
     def __call__(
             self,
             key: Optional[Callable[['Task'], bool]] = None,
@@ -220,78 +820,30 @@ class _ImmutableTaskList:
     ) -> Union[Optional['Task'], '_ImmutableTaskList']:
         """
         Search tasks in list
-        :param key: task id or Callable[[Task], bool] that implements filter
-        :param kwargs: task filters
+        :param key: TaskQuery or Callable[[Task], bool] that implements filter
+        :param kwargs: task filters, see TaskQuery
         :return: list of matched tasks
         """
         if key is not None:
+            if isinstance(key, TaskQuery):
+                return _ImmutableTaskList(key.filter(self._list))
             if callable(key):
                 return _ImmutableTaskList([t for t in self if key(t)])
             raise RuntimeError(f"Unsupported key type: {type(key)}")
 
-        if kwargs is None:
+        if not kwargs:
             return _ImmutableTaskList([t for t in self._list])
 
-        def search(t, **kw):
-            for k, v in kw.items():
-                if k.endswith("_not_like_"):
-                    k = k[0:-10]
-                    val = self.__get_task_attribute(t, k)
-                    if val is None or re.search(v, val):
-                        return False
-                elif k.endswith("_like_"):
-                    k = k[0:-6]
-                    val = self.__get_task_attribute(t, k)
-                    if val is None or not re.search(v, val):
-                        return False
-                elif k.endswith("_not_in_"):
-                    k = k[0:-8]
-                    if self.__get_task_attribute(t, k) in v:
-                        return False
-                elif k.endswith("_is_none_"):
-                    k = k[0:-9]
-                    val = self.__get_task_attribute(t, k)
-                    if val is not None:
-                        return False
-                elif k.endswith("_is_not_none_"):
-                    k = k[0:-13]
-                    val = self.__get_task_attribute(t, k)
-                    if val is None:
-                        return False
-                elif k.endswith("_in_"):
-                    k = k[0:-4]
-                    if not self.__get_task_attribute(t, k) in v:
-                        return False
-                elif k.endswith("_ne_"):
-                    k = k[0:-4]
-                    val = self.__get_task_attribute(t, k)
-                    if val is None or not val != v:
-                        return False
-                elif k.endswith("_le_"):
-                    k = k[0:-4]
-                    val = self.__get_task_attribute(t, k)
-                    if val is None or not val <= v:
-                        return False
-                elif k.endswith("_lt_"):
-                    k = k[0:-4]
-                    val = self.__get_task_attribute(t, k)
-                    if val is None or not val < v:
-                        return False
-                elif k.endswith("_ge_"):
-                    k = k[0:-4]
-                    val = self.__get_task_attribute(t, k)
-                    if val is None or not val >= v:
-                        return False
-                elif k.endswith("_gt_"):
-                    k = k[0:-4]
-                    val = self.__get_task_attribute(t, k)
-                    if val is None or not val > v:
-                        return False
-                elif self.__get_task_attribute(t, k) != v:
-                    return False
-            return True
+        return _ImmutableTaskList(TaskQuery.compile(**kwargs).filter(self._list))
 
-        return _ImmutableTaskList([t for t in self if search(t, **kwargs)])
+    def active_between(self, start: datetime, end: datetime) -> '_ImmutableTaskList':
+        """
+        Tasks active in period: task.start <= end and task.end >= start
+        :param start: period start
+        :param end: period end
+        :return: list of tasks
+        """
+        return self(start_le_=end, end_ge_=start)
 
     def order_by(self, key: Union[str, List[str]], reverse=False) -> '_ImmutableTaskList':
 
@@ -333,7 +885,7 @@ class _ImmutableTaskList:
         """
         res = []
         for t in self._list:
-            if attr in dir(t) and not attr.startswith('_'):
+            if not attr.startswith('_') and hasattr(t, attr):
                 res.append(t.__getattribute__(attr))
             else:
                 res.append(None)
@@ -352,26 +904,26 @@ class _ImmutableTaskList:
         :param other: other task list
         :return:
         """
-        return self._list.__add__(_to_list(other))
+        return (self._list or []).__add__(_to_list(other))
 
     def __lshift__(self, other: Union['Task', Iterable['Task']]):
         for t in self:
-            t.predecessors += other
+            t << other
         return other
 
     def __rshift__(self, other: Union['Task', Iterable['Task']]):
         for t in self:
-            t.successors += other
+            t >> other
         return other
 
     def __getitem__(self, query):
-        return self._list.__getitem__(query)
+        return (self._list or []).__getitem__(query)
 
     def __eq__(self, other):
-        return self._list.__eq__(other)
+        return (self._list or []).__eq__(other)
 
     def __str__(self) -> str:
-        return self._list.__str__()
+        return (self._list or []).__str__()
 
     def __repr__(self) -> str:
         return _Repr.repr(self)
@@ -393,10 +945,9 @@ class _ImmutableTaskList:
 
 
 class _TaskList(_ImmutableTaskList, ABC):
-    """Mutable task list implementation"""
+    """Mutable task list implementation. View of task links, cached by task"""
 
-    def __init__(self, _list: List['Task']):
-        super().__init__(_list)
+    __slots__ = ()
 
     @abstractmethod
     def remove(self, task: 'Task'):
@@ -420,11 +971,17 @@ class _TaskList(_ImmutableTaskList, ABC):
 
 
 class _ChildrenList(_TaskList):
+    """List of children tasks"""
+
+    __slots__ = ('__parent',)
 
-    def __init__(self, parent: 'Task', _list, _setter):
-        super().__init__(_list)
+    def __init__(self, parent: 'Task'):
         self.__parent = parent
-        self.__setter = _setter
+
+    # noinspection PyProtectedMember
+    @property
+    def _list(self) -> List['Task']:
+        return self.__parent._children_links()
 
     def append(self, task: 'Task'):
         """
@@ -445,7 +1002,7 @@ class _ChildrenList(_TaskList):
         _check_not_none(task, 'Task')
         if task not in self._list:
             return False
-        self.__parent.children = [t for t in self._list if t != task]
+        self.__parent._remove_child(task)
         return True
 
     def insert(self, index: int, task: 'Task'):
@@ -470,27 +1027,38 @@ class _ChildrenList(_TaskList):
         :raises RuntimeError: if task/before/after does not exists in list
         """
         tasks = _to_list(tasks)
+        children = self._list
         for task in tasks:
-            if task not in self._list:
+            if task not in children:
                 raise RuntimeError("'Task' not found in list")
 
-        if before is not None and before not in self._list:
+        if before is not None and before not in children:
             raise RuntimeError("'Before' not found in list")
-        if after is not None and after not in self._list:
+        if after is not None and after not in children:
             raise RuntimeError("After not found in list")
         if before is not None and after is not None:
             raise RuntimeError("'Before' and 'After' is not None. Only one parameter must be set")
-
-        for task in tasks:
-            self._list.remove(task)
-            if before is not None:
-                self._list.insert(self._list.index(before), task)
-            elif after is not None:
-                self._list.insert(self._list.index(after) + 1, task)
-            else:
-                raise RuntimeError("'Before' or 'After' must be not None")
-
-        self.__setter(self._list)
+        if not tasks:
+            return
+        if before is None and after is None:
+            raise RuntimeError("'Before' or 'After' must be not None")
+
+        # Tasks are moved one by one, each of them right before 'before' or right after 'after'
+        anchor = before if before is not None else after
+        moved = {id(t): t for t in (tasks if before is not None else reversed(tasks))}
+        if id(anchor) in moved:
+            raise RuntimeError("Task can't be moved relative to itself")
+        order = []
+        for t in children:
+            if id(t) in moved:
+                continue
+            if t is anchor and before is not None:
+                order += moved.values()
+            order.append(t)
+            if t is anchor and after is not None:
+                order += moved.values()
+
+        self.__parent._replace_children(order)
 
     def sort(self, key: Union[str, List[str]], reverse=False) -> None:
         """
@@ -499,43 +1067,51 @@ class _ChildrenList(_TaskList):
         :param reverse: reverse sort
         """
         if type(key) is str:
-            self._list = sorted(self._list, key=lambda x: x.__getattribute__(key), reverse=reverse)
+            tasks = sorted(self._list, key=lambda x: x.__getattribute__(key), reverse=reverse)
         elif type(key) is list or type(key) is tuple or type(key) is set:
-            self._list = sorted(self._list,
-                                key=lambda x: '-'.join([str(x.__getattribute__(k)) for k in key]),
-                                reverse=reverse)
+            tasks = sorted(self._list,
+                           key=lambda x: '-'.join([str(x.__getattribute__(k)) for k in key]),
+                           reverse=reverse)
         else:
             raise RuntimeError(f"Unsupported key type {type(key)}")
 
-        self.__setter(self._list)
+        self.__parent._replace_children(tasks)
 
     def reorder(self, ids: List[int]) -> None:
         """
         Put tasks with specified ids on top of list in order
         :param ids: list of task ids
         """
-        if self.__setter is None:
-            raise RuntimeError("Unsupported operation")
-
-        _all = self._list.copy()
+        rest = {id(t): t for t in self._list}
+        by_id = {}
+        for t in reversed(self._list):
+            by_id[t.id] = t
 
         new_list = []
         for _id in ids:
-            ch = next(t for t in self if t.id == _id)
+            if _id not in by_id:
+                raise RuntimeError(f"Task {_id} not found in list")
+            ch = by_id[_id]
+            if rest.pop(id(ch), None) is None:
+                raise RuntimeError(f"Task {_id} is already reordered")
             new_list.append(ch)
-            _all.remove(ch)
 
-        self._list = new_list + _all
-        self.__setter(self._list)
+        self.__parent._replace_children(new_list + list(rest.values()))
 
 
 class _PredecessorsList(_TaskList):
     """List of predecessor tasks"""
 
-    def __init__(self, parent: 'Task', _list):
-        super().__init__(_list)
+    __slots__ = ('__parent',)
+
+    def __init__(self, parent: 'Task'):
         self.__parent = parent
 
+    # noinspection PyProtectedMember
+    @property
+    def _list(self) -> List['Task']:
+        return self.__parent._predecessors_links()
+
     def append(self, task: 'Task'):
         """
         Appends task to predecessors list
@@ -543,7 +1119,7 @@ class _PredecessorsList(_TaskList):
         :raises RuntimeError: if WBS integrity lost (i.e. root is predecessor of child)
         """
         _check_not_none(task, 'Task')
-        self.__parent.predecessors = [v for v in self.__parent.predecessors] + [task]
+        self.__parent._add_predecessors([task])
 
     def remove(self, task: 'Task') -> bool:
         """
@@ -554,17 +1130,23 @@ class _PredecessorsList(_TaskList):
         _check_not_none(task, 'Task')
         if task not in self._list:
             return False
-        self.__parent.predecessors = [v for v in self.__parent.predecessors if v != task]
+        self.__parent._remove_link(task, False)
         return True
 
 
 class _SuccessorsList(_TaskList):
     """List of successors tasks"""
 
-    def __init__(self, parent: 'Task', _list):
-        super().__init__(_list)
+    __slots__ = ('__parent',)
+
+    def __init__(self, parent: 'Task'):
         self.__parent = parent
 
+    # noinspection PyProtectedMember
+    @property
+    def _list(self) -> List['Task']:
+        return self.__parent._successors_links()
+
     def append(self, task: 'Task'):
         """
         Appends task to successors
@@ -572,7 +1154,7 @@ class _SuccessorsList(_TaskList):
         :raises RuntimeError: if WBS integrity lost (i.e. root is successor of child)
         """
         _check_not_none(task, 'Task')
-        self.__parent.successors = [v for v in self.__parent.successors] + [task]
+        self.__parent._add_successors([task])
 
     def remove(self, task: 'Task') -> bool:
         """
@@ -583,7 +1165,7 @@ class _SuccessorsList(_TaskList):
         _check_not_none(task, 'Task')
         if task not in self._list:
             return False
-        self.__parent.successors = [v for v in self.__parent.successors if v != task]
+        self.__parent._remove_link(task, True)
         return True
 
 
@@ -597,6 +1179,14 @@ class Task:
     4. successor
     """
 
+    # Core fields are kept in slots. Custom attributes passed as kwargs go to instance __dict__,
+    # which is created on first custom attribute assignment only
+    __slots__ = (
+        '__id', 'name', 'resource', 'start', 'end', 'milestone', 'min_start', '__estimate', '__spent',
+        '__wbs', '__idx', '__registry', '__ord', '__rollup', '__parent', '__children', '__predecessors', '__successors',
+        '__children_view', '__predecessors_view', '__successors_view', '__dict__', '__weakref__'
+    )
+
     def __init__(
             self,
             id: Any,
@@ -628,6 +1218,13 @@ class Task:
         :param kwargs: additional task attributes
         """
         self.__id = id
+        self.__wbs: Optional['WBS'] = None
+        # Dense index of task in its WBS: 0..len(WBS) - 1, assigned by WBS. Meaningful for tasks of WBS only
+        self.__idx = -1
+        self.__parent = None
+        # Totals of subtree, calculated on demand. None if not calculated or outdated.
+        # If task totals are outdated, totals of all its parents are outdated too
+        self.__rollup: Optional[TaskRollup] = None
         self.name = name
         self.resource = resource
         self.start = start
@@ -636,12 +1233,19 @@ class Task:
         self.__estimate = None
         self.__spent = None
 
-        self.__wbs: Optional['WBS'] = None
+        # Registry of ids of detached task tree. Maintained on detached root task only.
+        self.__registry: Optional[Dict[Any, 'Task']] = None
 
-        self.__parent = None
-        self.__children = []
-        self.__predecessors = []
-        self.__successors = []
+        # Position in topological order. Predecessors always have lower value than successors
+        self.__ord = next(_ORDER)
+
+        self.__children = _NO_TASKS
+        self.__predecessors = _NO_TASKS
+        self.__successors = _NO_TASKS
+
+        self.__children_view = None
+        self.__predecessors_view = None
+        self.__successors_view = None
 
         self.estimate = estimate
         self.spent = spent
@@ -660,12 +1264,400 @@ class Task:
         for k, v in kwargs.items():
             self.__setattr__(k, v)
 
+    # noinspection PyProtectedMember
+    def _watched_setattr(self, key, value):
+        """
+        __setattr__ of watched tasks, see _watch. Changes of public attributes outdate totals of parents
+        and are reported to WBS and its batch
+        """
+        if key[0] == '_':
+            object.__setattr__(self, key, value)
+            return
+        wbs = self.__wbs
+        batch = wbs._batch() if wbs is not None else None
+        if batch is not None:
+            batch.save_attribute(self, key)
+        changes = wbs._changes() if wbs is not None and key not in _LINK_ATTRIBUTES else None
+        if changes is not None:
+            old = getattr(self, key, None)
+        object.__setattr__(self, key, value)
+        if key in _ROLLUP_FIELDS and self.__rollup is not None:
+            self._rollup_changed()
+        if wbs is not None:
+            wbs._attribute_changed(self, key)
+        if changes is not None and self.__id != EMPTY_TASK_ID:
+            changes.record(self, 'attribute', key, old, getattr(self, key, None))
+
+    # noinspection PyProtectedMember
+    def _watched_delattr(self, key):
+        """__delattr__ of watched tasks, see _watched_setattr"""
+        if key[0] == '_':
+            object.__delattr__(self, key)
+            return
+        wbs = self.__wbs
+        batch = wbs._batch() if wbs is not None else None
+        if batch is not None:
+            batch.save_attribute(self, key)
+        changes = wbs._changes() if wbs is not None and key not in _LINK_ATTRIBUTES else None
+        if changes is not None:
+            old = getattr(self, key, None)
+        object.__delattr__(self, key)
+        if key in _ROLLUP_FIELDS and self.__rollup is not None:
+            self._rollup_changed()
+        if wbs is not None:
+            wbs._attribute_changed(self, key)
+        if changes is not None and self.__id != EMPTY_TASK_ID:
+            changes.record(self, 'attribute', key, old, None)
+
+    def _watch(self):
+        """
+        Makes task report changes of public attributes to its WBS and totals of parents. Task is switched
+        to watched subclass of same layout, so tasks nobody watches keep native attribute assignment.
+        Used for tasks of WBS with indexes, change journal or batch (see WBS._watching) and tasks with totals
+        """
+        if type(self) not in _UNWATCHED_CLASSES:
+            self.__class__ = _watched_class(type(self))
+
+    def _unwatch(self):
+        """Switches task back to native attribute assignment, unless its totals are calculated"""
+        cls = _UNWATCHED_CLASSES.get(type(self))
+        if cls is not None and self.__rollup is None:
+            self.__class__ = cls
+
+    # noinspection PyProtectedMember
+    def _structure_changed(self):
+        """Notifies WBS about changes of tasks hierarchy or children order"""
+        if self.__wbs is not None:
+            self.__wbs._structure_changed()
+
+    # noinspection PyProtectedMember
     def _attach(self, wbs: 'WBS'):
         if wbs is None:
             return
+        stack = [self]
+        while stack:
+            t = stack.pop()
+            if t.__wbs is wbs:
+                continue
+            # Attached tasks are not in WBS yet, so they are saved in batch of WBS directly
+            batch = wbs._batch()
+            if batch is not None:
+                batch.save(t)
+            t.__wbs = wbs
+            t.__registry = None
+            wbs._register(t)
+            stack.extend(reversed(t.__children))
+
+    # noinspection PyProtectedMember
+    def _detach(self):
+        if self.__wbs is None:
+            return
+        subtree = _collect_subtree(self)
+        _journal(subtree)
+        for t in subtree:
+            t.__wbs._unregister(t)
+            t.__wbs = None
+        self.__registry = {t.__id: t for t in subtree}
+
+    # noinspection PyProtectedMember
+    def __tree_registry(self) -> Dict[Any, 'Task']:
+        """Registry of ids of tree this task belongs to"""
+        if self.__wbs is not None:
+            return self.__wbs._registry()
+        root = _find_root(self)
+        if root.__registry is None:
+            root.__registry = {t.__id: t for t in _collect_subtree(root)}
+        return root.__registry
+
+    def __subtree_registry(self) -> Dict[Any, 'Task']:
+        """Registry of ids of this task subtree"""
+        if self.__wbs is None and self.__parent is None:
+            return self.__tree_registry()
+        return {t.__id: t for t in _collect_subtree(self)}
+
+    def __split_registry(self):
+        """Moves ids of detached task subtree from its tree registry to the new registry of this task"""
+        _journal((self, _find_root(self)))
+        tree = self.__tree_registry()
+        subtree = self.__subtree_registry()
+        for k in subtree.keys():
+            tree.pop(k, None)
+        self.__registry = subtree
+
+    def __merge_registry(self, parent: 'Task'):
+        """Moves ids of detached root task subtree to registry of detached parent tree"""
+        _journal((self, _find_root(parent)))
+        subtree = self.__tree_registry()
+        self.__registry = None
+        tree = parent.__tree_registry()
+        if len(subtree) > len(tree):
+            subtree.update(tree)
+            _find_root(parent).__registry = subtree
+        else:
+            tree.update(subtree)
+
+    def __append_child(self, task: 'Task'):
+        self.__children = _append_link(self.__children, task)
+
+    def __append_predecessor(self, task: 'Task'):
+        self.__predecessors = _append_link(self.__predecessors, task)
+
+    def __append_successor(self, task: 'Task'):
+        self.__successors = _append_link(self.__successors, task)
+
+    def __move_to_successors_end(self):
+        """
+        Moves task to the end of successors of its predecessors. Links keep the order they get when the whole
+        predecessors list of task is assigned
+        """
+        for v in self.__predecessors:
+            v.__successors.remove(self)
+            v.__append_successor(self)
+
+    def __move_to_predecessors_end(self):
+        """Moves task to the end of predecessors of its successors, see __move_to_successors_end"""
+        for v in self.__successors:
+            v.__predecessors.remove(self)
+            v.__append_predecessor(self)
+
+    def _replace_children(self, tasks: List['Task']):
+        """Sets new order of children. Tasks must be the same as current children"""
+        _journal((self,))
+        if self.__children:
+            self.__children = _task_links(tasks)
+        self._rollup_changed()
+        self._structure_changed()
+
+    def _links_state(self) -> tuple:
+        """Copy of task links and WBS membership, see _Batch"""
+        return (self.__wbs, dict(self.__registry) if self.__registry is not None else None, self.__ord,
+                self.__parent, list(self.__children), list(self.__predecessors), list(self.__successors))
+
+    def _restore_links_state(self, state: tuple):
+        self.__wbs, self.__registry, self.__ord, self.__parent = state[0:4]
+        self.__children = _task_links(state[4]) if state[4] else _NO_TASKS
+        self.__predecessors = _task_links(state[5]) if state[5] else _NO_TASKS
+        self.__successors = _task_links(state[6]) if state[6] else _NO_TASKS
+        self.__rollup = None
+
+    def _remove_child(self, task: 'Task'):
+        """Removes task from children and from WBS"""
+        _journal((self, task))
+        self.__children.remove(task)
+        if task.__wbs is None:
+            task.__split_registry()
+        task.__parent = None
+        task._detach()
+        self._rollup_changed()
+        self._structure_changed()
+
+    def _remove_link(self, task: 'Task', successor: bool):
+        """Removes link to predecessor or successor task"""
+        _journal((self, task, *(self.__successors if successor else self.__predecessors)))
+        if successor:
+            self.__successors.remove(task)
+            task.__predecessors.remove(self)
+            self.__move_to_predecessors_end()
+        else:
+            self.__predecessors.remove(task)
+            task.__successors.remove(self)
+            self.__move_to_successors_end()
+        if _links_changed((self, task, *(self.__successors if successor else self.__predecessors))):
+            if successor:
+                _record_link(self, task, False)
+            else:
+                _record_link(task, self, False)
+
+    def _children_links(self) -> Sequence['Task']:
+        return self.__children
+
+    def _predecessors_links(self) -> Sequence['Task']:
+        return self.__predecessors
+
+    def _successors_links(self) -> Sequence['Task']:
+        return self.__successors
+
+    @property
+    def _idx(self) -> int:
+        """Dense index of task in its WBS, used by algorithms to keep task data in arrays instead of dicts"""
+        return self.__idx
+
+    def _set_idx(self, idx: int):
+        self.__idx = idx
+
+    @property
+    def _ord(self) -> int:
+        """Position of task in topological order of predecessor/successor links"""
+        return self.__ord
+
+    def _set_links(self, wbs: Optional['WBS'], parent: Optional['Task'], children: List['Task'],
+                   predecessors: List['Task'], successors: List['Task'], order: int):
+        """
+        Sets WBS and links of unlinked task without any checks. Used to build whole graph at once, when it is
+        validated by caller. Caller is responsible for registering task in WBS
+        :param order: position in topological order
+        """
+        _journal((self,))
         self.__wbs = wbs
-        for ch in self.children:
-            ch._attach(wbs)
+        self.__registry = None
+        self.__parent = parent
+        self.__children = _task_links(children) if children else _NO_TASKS
+        self.__predecessors = _task_links(predecessors) if predecessors else _NO_TASKS
+        self.__successors = _task_links(successors) if successors else _NO_TASKS
+        self.__ord = order
+        self.__rollup = None
+
+    def _dispose(self, disposed: Dict[int, 'Task']):
+        """
+        Drops all links and WBS of task, so task is freed by reference counting.
+        Links with tasks not being disposed are removed from both sides
+        :param disposed: all tasks being disposed, by id()
+        """
+        for v in self.__predecessors:
+            if id(v) not in disposed:
+                v.__successors.remove(self)
+                _links_changed((v,))
+        for v in self.__successors:
+            if id(v) not in disposed:
+                v.__predecessors.remove(self)
+                _links_changed((v,))
+        self.__wbs = None
+        self.__registry = None
+        self.__parent = None
+        self.__children = _NO_TASKS
+        self.__predecessors = _NO_TASKS
+        self.__successors = _NO_TASKS
+        self.__children_view = None
+        self.__predecessors_view = None
+        self.__successors_view = None
+
+    def _link_external(self, task: 'Task', successor: bool):
+        """
+        Adds link to task, which already has link to this task set by _set_links. Used to link copies of tasks
+        with tasks of other WBS
+        :param task: linked task
+        :param successor: True if this task is successor of task, False if predecessor
+        """
+        _journal((self,))
+        if successor:
+            self.__append_predecessor(task)
+            Task.__order_link(task, self)
+        else:
+            self.__append_successor(task)
+            Task.__order_link(self, task)
+        if _links_changed((self, task)):
+            if successor:
+                _record_link(task, self, True)
+            else:
+                _record_link(self, task, True)
+
+    @staticmethod
+    def __order_link(pred: 'Task', succ: 'Task') -> bool:
+        """
+        Updates topological order of tasks for new link pred -> succ (Pearce-Kelly algorithm).
+        Only tasks between succ and pred in current order are visited and reordered.
+        :return: False if link makes cyclic dependency
+        """
+        lower, upper = succ.__ord, pred.__ord
+        if upper < lower:
+            return True
+
+        forward = []
+        visited = {id(succ)}
+        stack = [succ]
+        while stack:
+            t = stack.pop()
+            if t is pred:
+                return False
+            forward.append(t)
+            for s in t.__successors:
+                if s.__ord <= upper and id(s) not in visited:
+                    visited.add(id(s))
+                    stack.append(s)
+
+        backward = []
+        visited = {id(pred)}
+        stack = [pred]
+        while stack:
+            t = stack.pop()
+            backward.append(t)
+            for p in t.__predecessors:
+                if p.__ord > lower and id(p) not in visited:
+                    visited.add(id(p))
+                    stack.append(p)
+
+        tasks = sorted(backward, key=lambda x: x.__ord) + sorted(forward, key=lambda x: x.__ord)
+        positions = sorted([t.__ord for t in tasks])
+        for t, pos in zip(tasks, positions):
+            t.__ord = pos
+
+        return True
+
+    @staticmethod
+    def _commit_links(links: List[Tuple['Task', 'Task', bool]]):
+        """
+        Checks links added in batch and updates topological order of tasks
+        :param links: predecessor, successor and True if predecessor must not be a parent of successor,
+            False if successor must not be a parent of predecessor
+        :raises RuntimeError: with all found errors
+        """
+        errors = []
+        unordered = {}
+        for pred, succ, parent_is_predecessor in links:
+            if pred not in succ.__predecessors:
+                continue
+            if parent_is_predecessor and pred.__is_ancestor_of(succ):
+                errors.append(f"Task {succ.id}: can't set parent {pred.id} as predecessor")
+            elif not parent_is_predecessor and succ.__is_ancestor_of(pred):
+                errors.append(f"Task {pred.id}: can't set parent {succ.id} as successor")
+            elif pred.__ord >= succ.__ord:
+                unordered[(id(pred), id(succ))] = (pred, succ)
+        if errors:
+            raise RuntimeError("\n".join(errors))
+
+        if len(unordered) == 1:
+            # Single new link against current order, other links are ordered
+            pred, succ = next(iter(unordered.values()))
+            if not Task.__order_link(pred, succ):
+                raise RuntimeError(f"{succ.id} exists in {pred.id} predecessors. Cyclic dependency")
+        elif unordered:
+            Task.__reorder([succ for _, succ in unordered.values()])
+
+    @staticmethod
+    def __reorder(tasks: List['Task']):
+        """
+        Recalculates topological order of all tasks linked with specified tasks (Kahn's algorithm).
+        Tasks keep their current relative order where possible
+        :raises RuntimeError: if links have cyclic dependency
+        """
+        component = {}
+        stack = list(tasks)
+        while stack:
+            t = stack.pop()
+            if id(t) not in component:
+                component[id(t)] = t
+                stack.extend(t.__predecessors)
+                stack.extend(t.__successors)
+
+        in_degree = {k: len(t.__predecessors) for k, t in component.items()}
+        heap = [(t.__ord, k) for k, t in component.items() if in_degree[k] == 0]
+        heapq.heapify(heap)
+        order = []
+        while heap:
+            t = component[heapq.heappop(heap)[1]]
+            order.append(t)
+            for s in t.__successors:
+                in_degree[id(s)] -= 1
+                if in_degree[id(s)] == 0:
+                    heapq.heappush(heap, (s.__ord, id(s)))
+
+        if len(order) < len(component):
+            ids = [t.id for k, t in component.items() if in_degree[k] > 0]
+            raise RuntimeError(f"Cyclic dependency between tasks {ids}")
+
+        positions = sorted(t.__ord for t in order)
+        for t, pos in zip(order, positions):
+            t.__ord = pos
 
     @property
     def id(self) -> Union[int, str]:
@@ -711,56 +1703,135 @@ class Task:
         :param parent: new parent
         """
 
-        if self.__wbs is None:
-            # Check parent changed
-            if parent is not None and (self.parent is None or id(self.parent) != id(parent)):
+        if parent is not None and parent is not self.__parent:
+            if self.__wbs is None:
                 # Check no ID duplicates
-                if _has_id_intersection(parent, [self]):
+                if _has_id_intersection(parent.__tree_registry(), self.__subtree_registry()):
                     raise RuntimeError("Task subtree ids intersects with parent tree ids")
-        else:
-            if parent is not None and parent.__wbs != self.__wbs:
+            elif parent.__wbs != self.__wbs:
                 raise RuntimeError("Parent must be from same WBS")
 
         if parent is not None:
-            if parent in self.all_children:
+            if parent is self or self.__is_ancestor_of(parent):
                 raise RuntimeError(f"Task {parent.id} is a child of task {self.id}. Can't make child "
                                    f"a parent of its parent")
 
-        if self.__parent is not None and self in self.__parent.__children:
-            self.__parent.__children.remove(self)
+        _journal((self, self.__parent, parent))
+        old_parent = self.__parent
+        same_parent = parent is self.__parent
+        if self.__parent is not None:
+            self.__parent._rollup_changed()
+            if self in self.__parent.__children:
+                self.__parent.__children.remove(self)
+            if self.__wbs is None and not same_parent:
+                self.__split_registry()
+            self.__parent = None
 
         if parent is None:
             if self.__wbs is not None:
                 self.__wbs._root().children.append(self)
-            else:
-                self.__parent = None
 
         else:
+            if self.__wbs is None and parent.__wbs is None and not same_parent:
+                self.__merge_registry(parent)
             self.__parent = parent
             self._attach(parent.__wbs)
-            if parent and self not in parent.__children:
-                parent.__children.append(self)
+            parent.__append_child(self)
+            parent._rollup_changed()
+            if self.__wbs is not None:
+                self.__wbs._parent_changed(self)
+
+        if old_parent is not None and old_parent is not self.__parent and self.__wbs is not None:
+            changes = self.__wbs._changes()
+            if changes is not None:
+                changes.record(self, 'parent', old=_real_parent(old_parent), new=_real_parent(self.__parent))
+
+    @property
+    def rollup(self) -> TaskRollup:
+        """
+        Totals of task subtree: sums of leaves estimates and spent times, minimal start, maximal end
+        and number of leaves. Totals are kept until any task of subtree changes, so repeated calls are O(1)
+        and change of one task recalculates totals of its parents only
+        """
+        if self.__rollup is None:
+            stack = [(self, False)]
+            while stack:
+                t, expanded = stack.pop()
+                if expanded:
+                    t.__rollup = t.__calc_rollup()
+                    # Changes of task must outdate calculated totals
+                    t._watch()
+                    continue
+                stack.append((t, True))
+                if not t.milestone:
+                    stack.extend((ch, False) for ch in t.__children if ch.__rollup is None)
+        return self.__rollup
+
+    def __calc_rollup(self) -> TaskRollup:
+        """Totals of task, totals of its children must be calculated"""
+        if not self.__children or self.milestone:
+            return TaskRollup(
+                self.__estimate if self.__estimate is not None else 0,
+                self.__spent if self.__spent is not None else 0,
+                self.start,
+                self.end,
+                1
+            )
+        rollups = [ch.__rollup for ch in self.__children]
+        starts = [r.start for r in rollups if r.start is not None]
+        ends = [r.end for r in rollups if r.end is not None]
+        return TaskRollup(
+            sum([r.estimate for r in rollups]),
+            sum([r.spent for r in rollups]),
+            min(starts) if starts else None,
+            max(ends) if ends else None,
+            sum([r.leaves for r in rollups])
+        )
+
+    def _rollup_changed(self, all_parents: bool = False):
+        """
+        Marks totals of task and its parents outdated
+        :param all_parents: don't stop at task with outdated totals. Used when totals of parents may be
+            not outdated, i.e. after tasks links are restored
+        """
+        t = self
+        while t is not None and (all_parents or t.__rollup is not None):
+            t.__rollup = None
+            t = t.__parent
 
     @property
     def all_parents(self) -> _ImmutableTaskList:
         """List of all parent tasks in hierarchy"""
         return _ImmutableTaskList(self.__get_all_parents())
 
-    def __get_all_parents(self) -> List['Task']:
-        def get_parent(t):
-            if t is not None and t.id != EMPTY_TASK_ID:
-                yield t
-                yield from get_parent(t.parent)
-
-        return [t for t in get_parent(self.__parent)]
+    # noinspection PyProtectedMember
+    def __is_ancestor_of(self, task: 'Task') -> bool:
+        """Checks task is a child of this task on any level of hierarchy"""
+        if self.__wbs is not None and task.__wbs is self.__wbs:
+            res = self.__wbs._is_ancestor(self, task)
+            if res is not None:
+                return res
+        t = task.__parent
+        while t is not None and t.id != EMPTY_TASK_ID:
+            if t is self:
+                return True
+            t = t.__parent
+        return False
 
-    def __set_children(self, lst):
-        self.__children = lst
+    def __get_all_parents(self) -> List['Task']:
+        res = []
+        t = self.__parent
+        while t is not None and t.id != EMPTY_TASK_ID:
+            res.append(t)
+            t = t.__parent
+        return res
 
     @property
     def children(self) -> _ChildrenList:
         """List of direct children tasks"""
-        return _ChildrenList(self, self.__children, self.__set_children)
+        if self.__children_view is None:
+            self.__children_view = _ChildrenList(self)
+        return self.__children_view
 
     @children.setter
     def children(self, value: Union['Task', Iterable['Task']]):
@@ -768,34 +1839,58 @@ class Task:
         value = _to_list(value)
         _check_no_nones_in_list(value, 'children')
 
+        old_children = set([id(v) for v in self.__children])
+        new_children = [v for v in value if id(v) not in old_children]
+
         if self.__wbs is None:
             # If self.__wbs is None, all children wbs must be None
-            if len([v for v in value if v.__wbs is not None]) > 0:
+            if len([v for v in new_children if v.__wbs is not None]) > 0:
                 raise RuntimeError('Children tasks must be from same WBS as parent task')
-
-            # Check no ids intersection
-            if _has_id_intersection(self, value):
-                raise RuntimeError("Task tree ids intersects with children ids")
-
         else:
             # Is self.__wbs is not None, children wbs must be none or equals to self.__wbs
-            if len([v for v in value if v.__wbs is not None and v.__wbs != self.__wbs]) > 0:
+            if len([v for v in new_children if v.__wbs is not None and v.__wbs != self.__wbs]) > 0:
                 raise RuntimeError('Children tasks must be from same WBS as parent task')
 
-            if _has_id_intersection(self, value):
-                raise RuntimeError(f"Id intersection detected")
+        # Check no ids intersection. Tasks moved inside WBS can't bring new ids
+        incoming = {}
+        for v in new_children:
+            if v.__wbs is None:
+                subtree = v.__subtree_registry()
+                if _has_id_intersection(incoming, subtree):
+                    raise RuntimeError("Id intersection detected")
+                incoming.update(subtree)
+        if _has_id_intersection(self.__tree_registry(), incoming):
+            if self.__wbs is None:
+                raise RuntimeError("Task tree ids intersects with children ids")
+            raise RuntimeError("Id intersection detected")
 
-        for ch in value:
-            if self in ch.all_children:
+        for ch in new_children:
+            if ch.__is_ancestor_of(self):
                 raise RuntimeError(f"Task {self.id} is a child of {ch.id}. Can't make child a parent of its parent")
 
-        for v in self.__children:
-            v.__parent = None
-
-        self.__children.clear()
-
+        kept = set([id(v) for v in value])
+        current = [v for v in self.__children]
+        _journal([self] + current)
+        self.__children = _NO_TASKS
+        for v in current:
+            if id(v) not in kept:
+                if v.__wbs is None:
+                    v.__split_registry()
+                v.__parent = None
+                v._detach()
+
+        added = set()
         for v in value:
-            v.parent = self
+            if id(v) in added:
+                continue
+            added.add(id(v))
+            if id(v) in old_children:
+                self.__append_child(v)
+            else:
+                v.parent = self
+
+        self._rollup_changed()
+        self._structure_changed()
 
     @property
     def all_children(self) -> _ImmutableTaskList:
@@ -803,17 +1898,14 @@ class Task:
         return _ImmutableTaskList(self.__get_all_children())
 
     def __get_all_children(self):
-        def get_children(t):
-            for ch in t.__children:
-                yield ch
-                yield from get_children(ch)
-
-        return [t for t in get_children(self)]
+        return list(_iter_subtree(self))
 
     @property
     def predecessors(self) -> _PredecessorsList:
         """List of direct predecessors"""
-        return _PredecessorsList(self, self.__predecessors)
+        if self.__predecessors_view is None:
+            self.__predecessors_view = _PredecessorsList(self)
+        return self.__predecessors_view
 
     @predecessors.setter
     def predecessors(self, value: Union['Task', Iterable['Task']]):
@@ -824,42 +1916,117 @@ class Task:
         value = _to_list(value)
         _check_no_nones_in_list(value, 'predecessors')
 
-        parents = self.all_parents
-        for v in value:
-            if v in parents:
-                raise RuntimeError("Can't set parent as predecessor")
+        batch = _journal([self, *self.__predecessors, *value])
+        if batch is not None:
+            batch.links += [(v, self, True) for v in value]
+        else:
+            for v in value:
+                if v.__is_ancestor_of(self):
+                    raise RuntimeError("Can't set parent as predecessor")
 
-        for v in value:
-            if self in v.all_predecessors:
-                raise RuntimeError(f"{self.id} exists in {v.id} predecessors. Cyclic dependency")
+            for v in value:
+                if v not in self.__predecessors and not Task.__order_link(v, self):
+                    raise RuntimeError(f"{self.id} exists in {v.id} predecessors. Cyclic dependency")
 
+        old = list(self.__predecessors)
         for v in self.__predecessors:
             if self in v.__successors:
                 v.__successors.remove(self)
 
-        self.__predecessors = [v for v in value]
+        self.__predecessors = _task_links(_unique_objects(value)) if value else _NO_TASKS
 
         for v in value:
             if self not in v.__successors:
-                v.__successors.append(self)
+                v.__append_successor(self)
+
+        if _links_changed([self, *old, *value]):
+            old_ids = set(id(v) for v in old)
+            new_ids = set(id(v) for v in self.__predecessors)
+            for v in old:
+                if id(v) not in new_ids:
+                    _record_link(v, self, False)
+            for v in self.__predecessors:
+                if id(v) not in old_ids:
+                    _record_link(v, self, True)
+
+    def _add_predecessors(self, tasks: List['Task']):
+        """Appends new predecessors without rebuilding predecessors list"""
+        _check_no_nones_in_list(tasks, 'predecessors')
+        tasks = [v for v in _unique_objects(tasks) if v not in self.__predecessors]
+
+        batch = _journal([self, *self.__predecessors, *tasks])
+        if batch is not None:
+            batch.links += [(v, self, True) for v in tasks]
+        else:
+            for v in tasks:
+                if v.__is_ancestor_of(self):
+                    raise RuntimeError("Can't set parent as predecessor")
+
+            for v in tasks:
+                if not Task.__order_link(v, self):
+                    raise RuntimeError(f"{self.id} exists in {v.id} predecessors. Cyclic dependency")
+
+        self.__move_to_successors_end()
+        for v in tasks:
+            self.__append_predecessor(v)
+            if self not in v.__successors:
+                v.__append_successor(self)
+
+        if self.__predecessors and _links_changed([self, *self.__predecessors]):
+            for v in tasks:
+                _record_link(v, self, True)
 
     @property
     def all_predecessors(self) -> _ImmutableTaskList:
         """List of all predecessors: direct predecessors, predecessors of direct predecessors etc."""
         return _ImmutableTaskList(self.__get_all_predecessors())
 
-    def __get_all_predecessors(self):
-        def get_predecessor(t):
-            for pr in t.predecessors:
-                yield pr
-                yield from get_predecessor(pr)
-        # TODO поиск предшественников не оптимальный, много дублей, надо оптимизировать
-        return _unique_tasks(get_predecessor(self))
+    def __get_all_predecessors(self) -> List['Task']:
+        return list(self.__closure(False)[0])
+
+    # noinspection PyProtectedMember
+    def __closure(self, successors: bool):
+        """
+        Returns all tasks reachable from this task by predecessor (or successor) links in depth-first order
+        and set of their object ids. Result is memoized at WBS until links or tasks of WBS change,
+        if all reachable tasks are in WBS of this task
+        """
+        cache = self.__wbs._closures() if self.__wbs is not None else None
+        if cache is not None:
+            res = cache.get(self, successors)
+            if res is not None:
+                return res
+
+        tasks = []
+        visited = set()
+        stack = list(reversed(self.__successors if successors else self.__predecessors))
+        while stack:
+            t = stack.pop()
+            if id(t) in visited:
+                continue
+            visited.add(id(t))
+            tasks.append(t)
+            stack.extend(reversed(t.__successors if successors else t.__predecessors))
+
+        res = (tuple(_unique_tasks(tasks)), frozenset(visited))
+        if cache is not None and all(t.__wbs is self.__wbs for t in tasks):
+            cache.put(self, successors, res)
+        return res
+
+    def depends_on(self, task: 'Task') -> bool:
+        """
+        Checks if this task depends on another task, i.e. task is one of direct or indirect predecessors
+        :param task: task
+        :return: True if task is in all_predecessors
+        """
+        return id(task) in self.__closure(False)[1]
 
     @property
     def successors(self) -> _SuccessorsList:
         """List of direct successors"""
-        return _SuccessorsList(self, self.__successors)
+        if self.__successors_view is None:
+            self.__successors_view = _SuccessorsList(self)
+        return self.__successors_view
 
     @successors.setter
     def successors(self, value: Union['Task', Iterable['Task']]):
@@ -870,56 +2037,95 @@ class Task:
         value = _to_list(value)
         _check_no_nones_in_list(value, 'successors')
 
-        parents = self.all_parents
-        for v in value:
-            if v in parents:
-                raise RuntimeError("Can't set parent as successor")
+        batch = _journal([self, *self.__successors, *value])
+        if batch is not None:
+            batch.links += [(self, v, False) for v in value]
+        else:
+            for v in value:
+                if v.__is_ancestor_of(self):
+                    raise RuntimeError("Can't set parent as successor")
 
-        for v in value:
-            if self in v.all_successors:
-                raise RuntimeError(f"{self.id} exists in {v.id} successors. Cyclic dependency")
+            for v in value:
+                if v not in self.__successors and not Task.__order_link(self, v):
+                    raise RuntimeError(f"{self.id} exists in {v.id} successors. Cyclic dependency")
 
+        old = list(self.__successors)
         for v in self.__successors:
             if self in v.__predecessors:
                 v.__predecessors.remove(self)
 
-        self.__successors = [v for v in value]
+        self.__successors = _task_links(_unique_objects(value)) if value else _NO_TASKS
 
         for v in value:
             if self not in v.__predecessors:
-                v.__predecessors.append(self)
+                v.__append_predecessor(self)
+
+        if _links_changed([self, *old, *value]):
+            old_ids = set(id(v) for v in old)
+            new_ids = set(id(v) for v in self.__successors)
+            for v in old:
+                if id(v) not in new_ids:
+                    _record_link(self, v, False)
+            for v in self.__successors:
+                if id(v) not in old_ids:
+                    _record_link(self, v, True)
+
+    def _add_successors(self, tasks: List['Task']):
+        """Appends new successors without rebuilding successors list"""
+        _check_no_nones_in_list(tasks, 'successors')
+        tasks = [v for v in _unique_objects(tasks) if v not in self.__successors]
+
+        batch = _journal([self, *self.__successors, *tasks])
+        if batch is not None:
+            batch.links += [(self, v, False) for v in tasks]
+        else:
+            for v in tasks:
+                if v.__is_ancestor_of(self):
+                    raise RuntimeError("Can't set parent as successor")
+
+            for v in tasks:
+                if not Task.__order_link(self, v):
+                    raise RuntimeError(f"{self.id} exists in {v.id} successors. Cyclic dependency")
+
+        self.__move_to_predecessors_end()
+        for v in tasks:
+            self.__append_successor(v)
+            if self not in v.__predecessors:
+                v.__append_predecessor(self)
+
+        if self.__successors and _links_changed([self, *self.__successors]):
+            for v in tasks:
+                _record_link(self, v, True)
 
     @property
     def all_successors(self) -> _ImmutableTaskList:
         """List of all successors: direct successors, successors of direct successors, etc."""
         return _ImmutableTaskList(self.__get_all_successors())
 
-    def __get_all_successors(self):
-        def get_successor(t):
-            for pr in t.successors:
-                yield pr
-                yield from get_successor(pr)
-
-        # TODO поиск последователей не оптимальный, много дублей, надо оптимизировать
-        return _unique_tasks(get_successor(self))
+    def __get_all_successors(self) -> List['Task']:
+        return list(self.__closure(True)[0])
 
     def to_dict(self) -> dict:
         d = {
             'id': self.id
         }
 
-        for k in self.__dict__.keys():
+        for k in _TASK_FIELDS:
+            d[k] = self.__getattribute__(k)
+        for k, v in _custom_attributes(self).items():
             if not k.startswith('_'):
-                d[k] = self.__getattribute__(k)
+                d[k] = v
         return d
 
     def clone(self, **kwargs) -> 'Task':
         """Creates copy of this task without parent/children/successors/predecessors"""
         cloned = Task(id=self.id, estimate=self.estimate, spent=self.spent)
 
-        for k in self.__dict__.keys():
+        for k in _TASK_FIELDS:
+            cloned.__setattr__(k, self.__getattribute__(k))
+        for k, v in _custom_attributes(self).items():
             if not k.startswith('_'):
-                cloned.__setattr__(k, self.__getattribute__(k))
+                cloned.__setattr__(k, v)
 
         for k, v in kwargs.items():
             cloned.__setattr__(k, v)
@@ -928,17 +2134,22 @@ class Task:
 
     def __floordiv__(self, other: Union['Task', Iterable['Task']]):
         """Synonym for children.append(other) and childred += other"""
-        self.children += other
+        tasks = _to_list(other)
+        if len(tasks) == 1:
+            if tasks[0].__parent is not self:
+                tasks[0].parent = self
+        else:
+            self.children += tasks
         return other
 
     def __lshift__(self, other: Union['Task', Iterable['Task']]):
         """Synonym for predecessors.append(other) and predecessors += other"""
-        self.predecessors += other
+        self._add_predecessors(_to_list(other))
         return other
 
     def __rshift__(self, other: Union['Task', Iterable['Task']]):
         """Synonym for successors.append(other) или successors += other"""
-        self.successors += other
+        self._add_successors(_to_list(other))
         return other
 
     def __str__(self) -> str:
@@ -967,3 +2178,24 @@ class Task:
         }
         """
         return print(_Repr.repr([self], fields, children, theme))
+
+
+
+# Watched subclasses of task classes and task classes by their watched subclasses, see Task._watch
+_WATCHED_CLASSES: Dict[type, type] = {}
+_UNWATCHED_CLASSES: Dict[type, type] = {}
+
+
+# noinspection PyProtectedMember
+def _watched_class(cls: type) -> type:
+    res = _WATCHED_CLASSES.get(cls)
+    if res is None:
+        res = type('_Watched' + cls.__name__, (cls,), {
+            '__slots__': (),
+            '__module__': cls.__module__,
+            '__setattr__': Task._watched_setattr,
+            '__delattr__': Task._watched_delattr
+        })
+        _WATCHED_CLASSES[cls] = res
+        _UNWATCHED_CLASSES[res] = cls
+    return res
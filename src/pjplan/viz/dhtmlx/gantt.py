@@ -75,7 +75,7 @@ class DhtmlxGantt:
 
         bar_styles = {}
         for t in self.wbs.tasks:
-            if 'gantt_bar_style' in t.__dict__:
+            if hasattr(t, 'gantt_bar_style'):
                 bar_styles.setdefault(str(t.gantt_bar_style), (t.gantt_bar_style, []))[1].append(t.id)
 
         res = ''
@@ -134,14 +134,14 @@ class DhtmlxGantt:
                     'resource': t.resource,
                     'estimate': t.estimate,
                     'spent': t.spent,
-                    'open': t.gantt_open if 'gantt_open' in t.__dict__ else 'true',
-                    'parent': t.parent.id if t.parent and t.parent in self.wbs.tasks else 0,
+                    'open': getattr(t, 'gantt_open', 'true'),
+                    'parent': t.parent.id if t.parent and t.parent in self.wbs else 0,
                     'progress': progress,
                     'css_class': task_classes.get(t.id)
                 }
 
-                for k, v in t.__dict__.items():
-                    if k not in data_val and not k.startswith('_Task'):
+                for k, v in t.to_dict().items():
+                    if k not in data_val:
                         data_val[k] = str(v)
 
                 data.append(data_val)
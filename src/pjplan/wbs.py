@@ -1,8 +1,154 @@
+from bisect import bisect_left, bisect_right
+from collections import deque
 from datetime import datetime
-from typing import Optional, Union, Iterable, Callable, Any, Dict
+from typing import Optional, Union, Iterable, Iterator, Callable, Any, Dict, List, Sequence, Tuple
 
 from pjplan.alg.critical_path import CriticalPathCalculator
-from pjplan.task import Task, EMPTY_TASK_ID, _ChildrenList, _ImmutableTaskList, _to_list, _Repr
+from pjplan.alg.interval_tree import IntervalTree
+from pjplan.task import Task, EMPTY_TASK_ID, _ChildrenList, _ImmutableTaskList, _to_list, _Repr, _ClosureCache, \
+    _iter_subtree, _collect_subtree, TaskQuery, _parse_filter, _task_attribute_getter, _Batch, \
+    _ChangeJournal, TaskChange
+
+# Marks tasks with unhashable attribute values in index. Such tasks are candidates for every lookup
+_UNHASHABLE = object()
+
+
+class _AttributeIndex:
+    """
+    Index of WBS tasks by attribute value.
+    Hash part serves equality, _in_ and _is_none_ filters, sorted values serve _lt_, _le_, _gt_, _ge_ filters
+    """
+
+    def __init__(self, name: str):
+        self.__get = _task_attribute_getter(name)
+        self.__buckets: Dict[Any, Dict[int, Task]] = {}
+        self.__values: Dict[int, Any] = {}
+        self.__unhashable: Dict[int, Task] = {}
+        # Sorted not None values, built on demand. False if values are not comparable
+        self.__sorted: Union[None, bool, List[Any]] = None
+
+    def add(self, task: Task):
+        value = self.__get(task)
+        key = id(task)
+        try:
+            bucket = self.__buckets.get(value)
+        except TypeError:
+            self.__unhashable[key] = task
+            self.__values[key] = _UNHASHABLE
+            return
+        if bucket is None:
+            bucket = self.__buckets[value] = {}
+            self.__sorted = None
+        bucket[key] = task
+        self.__values[key] = value
+
+    def remove(self, task: Task):
+        key = id(task)
+        if key not in self.__values:
+            return
+        value = self.__values.pop(key)
+        if value is _UNHASHABLE:
+            del self.__unhashable[key]
+            return
+        bucket = self.__buckets[value]
+        del bucket[key]
+        if not bucket:
+            del self.__buckets[value]
+            self.__sorted = None
+
+    def update(self, task: Task):
+        self.remove(task)
+        self.add(task)
+
+    def __sorted_values(self) -> Optional[List[Any]]:
+        if self.__sorted is None:
+            try:
+                self.__sorted = sorted(v for v in self.__buckets.keys() if v is not None)
+            except TypeError:
+                self.__sorted = False
+        return self.__sorted if self.__sorted is not False else None
+
+    def candidates(self, op: Optional[str], value: Any) -> Optional[Dict[int, Task]]:
+        """
+        Tasks which may match filter
+        :param op: filter operator suffix, None for equality
+        :param value: filter value
+        :return: tasks by id(task) or None if index can't serve filter
+        """
+        if op is None or op == '_is_none_':
+            keys = [None if op else value]
+        elif op == '_in_':
+            if type(value) not in (list, tuple, set, frozenset):
+                return None
+            keys = value
+        elif op in ('_lt_', '_le_', '_gt_', '_ge_'):
+            values = self.__sorted_values()
+            if values is None or value is None:
+                return None
+            try:
+                if op == '_lt_':
+                    keys = values[:bisect_left(values, value)]
+                elif op == '_le_':
+                    keys = values[:bisect_right(values, value)]
+                elif op == '_gt_':
+                    keys = values[bisect_right(values, value):]
+                else:
+                    keys = values[bisect_left(values, value):]
+            except TypeError:
+                return None
+        else:
+            return None
+
+        res = {}
+        try:
+            for k in keys:
+                bucket = self.__buckets.get(k)
+                if bucket:
+                    res.update(bucket)
+        except TypeError:
+            return None
+        res.update(self.__unhashable)
+        return res
+
+
+class _WBSTaskList(_ImmutableTaskList):
+    """List of all WBS tasks. Searches use WBS indexes while list is up-to-date with WBS structure"""
+
+    __slots__ = ('__wbs', '__version')
+
+    def __init__(self, wbs: 'WBS', _list: List[Task], version: int):
+        super().__init__(_list)
+        self.__wbs = wbs
+        self.__version = version
+
+    # noinspection PyProtectedMember
+    def __call__(
+            self,
+            key: Optional[Callable[['Task'], bool]] = None,
+            **kwargs
+    ) -> Union[Optional['Task'], '_ImmutableTaskList']:
+        if (key is None and kwargs) or isinstance(key, TaskQuery):
+            query = key if key is not None else TaskQuery.compile(**kwargs)
+            if self.__version == self.__wbs._version():
+                tasks = self.__wbs._search(query)
+                if tasks is not None:
+                    return _ImmutableTaskList(tasks)
+            return _ImmutableTaskList(query.filter(self._list))
+        return super().__call__(key, **kwargs)
+
+    # noinspection PyProtectedMember
+    def active_between(self, start: datetime, end: datetime) -> _ImmutableTaskList:
+        """
+        Tasks active in period: task.start <= end and task.end >= start. Uses WBS interval index
+        :param start: period start
+        :param end: period end
+        :return: list of tasks
+        """
+        if self.__version == self.__wbs._version():
+            tasks = self.__wbs._active_between(start, end)
+            if tasks is not None:
+                return _ImmutableTaskList(tasks)
+        return super().active_between(start, end)
 
 
 class WBS:
@@ -15,15 +161,504 @@ class WBS:
         :param tasks: list of tasks. New WBS will contain clones of this tasks
         :param kwargs: any additional WBS arguments
         """
+        self.__tasks_by_id: Dict[Any, Task] = {}
+        # Tasks by dense index, see Task._idx. Removed task is replaced with the last one
+        self.__tasks_by_idx: List[Task] = []
+        self.__indexes: Dict[str, _AttributeIndex] = {}
+        # Version of tasks hierarchy, changed on every structure change. Tasks order is cached for version
+        self.__version = 0
+        self.__tasks: Optional[List[Task]] = None
+        self.__positions: Optional[Dict[int, int]] = None
+        # Nested sets: subtree of task at position i occupies positions i..__subtree_ends[i] in tasks list
+        self.__subtree_ends: Optional[List[int]] = None
+        # Interval index over task dates, rebuilt on first query after structure or dates change
+        self.__intervals: Union[None, bool, IntervalTree] = None
+        self.__irregular_intervals: List[Task] = []
+        self.__closures = _ClosureCache()
+        # Versions of links and task dates, changed on every change of links or start or end of WBS task
+        self.__links_version = 0
+        self.__dates_version = 0
+        # Tasks sorted in topological order, reset on every change of tasks hierarchy or links
+        self.__topological_order: Optional[List[Task]] = None
+        # Results of graph algorithms, valid for graph version they were calculated for, see _cached
+        self.__graph_cache: Dict[Any, Any] = {}
+        self.__graph_cache_version: Optional[Tuple[int, int, int]] = None
+        # Journal of changes, None until track_changes() is called
+        self.__changes: Optional[_ChangeJournal] = None
+        # Batch of changes, None outside of batch, see batch()
+        self.__batch: Optional[_Batch] = None
+        # True if tasks must report changes of public attributes, see Task._watch. Set by first index,
+        # batch, change journal, interval index or cached result and reset when they are dropped,
+        # so attribute assignment keeps native speed while they are not used
+        self._watching = False
         self.__root = Task(EMPTY_TASK_ID, **kwargs)
         self.__root._attach(self)
 
         if tasks:
             self.__root.children = [v.clone() for v in tasks]
 
+    @staticmethod
+    def from_records(records: Iterable[Dict[str, Any]], **kwargs) -> 'WBS':
+        """
+        Builds WBS from task records in one pass, see WBSBuilder
+        :param records: dicts with Task arguments, 'parent_id' and 'predecessor_ids'
+        :param kwargs: WBS arguments
+        :return: new WBS
+        :raises RuntimeError: with list of all errors found in records
+        """
+        builder = WBSBuilder()
+        for r in records:
+            r = dict(r)
+            parent_id = r.pop('parent_id', None)
+            predecessor_ids = r.pop('predecessor_ids', None)
+            builder.add(Task(**r), parent_id, predecessor_ids)
+        return builder.build(**kwargs)
+
     def _root(self):
         return self.__root
 
+    def _registry(self) -> Dict[Any, Task]:
+        return self.__tasks_by_id
+
+    def _tasks_by_idx(self) -> List[Task]:
+        """Tasks by dense index, see Task._idx"""
+        return self.__tasks_by_idx
+
+    def _closures(self) -> _ClosureCache:
+        return self.__closures
+
+    def _changes(self) -> Optional[_ChangeJournal]:
+        return self.__changes
+
+    def _batch(self) -> Optional[_Batch]:
+        """Active batch of WBS, None outside of batch"""
+        return self.__batch
+
+    def _set_batch(self, batch: Optional[_Batch]):
+        self.__batch = batch
+        if batch is not None:
+            self.__watch()
+        else:
+            self.__unwatch()
+
+    # noinspection PyProtectedMember
+    def __watch(self):
+        """Makes all tasks of WBS report changes of public attributes, see Task._watch"""
+        if not self._watching:
+            self._watching = True
+            self.__root._watch()
+            for t in self.__tasks_by_idx:
+                t._watch()
+
+    # noinspection PyProtectedMember
+    def __unwatch(self):
+        """Switches tasks back to native attribute assignment, if nothing depends on their changes"""
+        if self._watching and not self.__indexes and self.__changes is None and self.__batch is None \
+                and self.__intervals is None and not self.__graph_cache:
+            self._watching = False
+            self.__root._unwatch()
+            for t in self.__tasks_by_idx:
+                t._unwatch()
+
+    def _graph_version(self) -> Tuple[int, int, int]:
+        """Version of tasks hierarchy, links and task dates"""
+        return self.__version, self.__links_version, self.__dates_version
+
+    def _links_changed(self):
+        self.__links_version += 1
+        self.__closures.invalidate()
+        self.__topological_order = None
+
+    def _cached(self, key: Any) -> Any:
+        """
+        Result of graph algorithm saved by _cache, if tasks hierarchy, links and dates did not change since then
+        :param key: algorithm key
+        :return: result or None
+        """
+        version = self._graph_version()
+        if self.__graph_cache_version != version:
+            self.__graph_cache = {}
+            self.__graph_cache_version = version
+        return self.__graph_cache.get(key)
+
+    def _cache(self, key: Any, value: Any):
+        """
+        Saves result of graph algorithm calculated for current graph version, see _cached
+        :param key: algorithm key
+        :param value: result
+        """
+        self.__watch()
+        if self.__graph_cache_version != self._graph_version():
+            self.__graph_cache = {}
+            self.__graph_cache_version = self._graph_version()
+        self.__graph_cache[key] = value
+
+    def __save_registry(self):
+        if self.__batch is not None:
+            self.__batch.save_registry(self, self.__tasks_by_id)
+
+    def _register(self, task: Task):
+        if task is not self.__root:
+            self.__save_registry()
+            self.__tasks_by_id[task.id] = task
+            if self._watching:
+                task._watch()
+            task._set_idx(len(self.__tasks_by_idx))
+            self.__tasks_by_idx.append(task)
+            for index in self.__indexes.values():
+                index.add(task)
+            self._structure_changed()
+            if self.__changes is not None:
+                self.__changes.record(task, 'add')
+
+    def _register_all(self, tasks: List[Task]):
+        """Registers tasks which are already linked to this WBS"""
+        self.__save_registry()
+        self.__tasks_by_id.update((t.id, t) for t in tasks)
+        for i, t in enumerate(tasks, len(self.__tasks_by_idx)):
+            t._set_idx(i)
+            if self._watching:
+                t._watch()
+        self.__tasks_by_idx.extend(tasks)
+        for index in self.__indexes.values():
+            for t in tasks:
+                index.add(t)
+        self._structure_changed()
+        if self.__changes is not None:
+            for t in tasks:
+                self.__changes.record(t, 'add')
+
+    def _unregister(self, task: Task):
+        if self.__tasks_by_id.get(task.id) is task:
+            self.__save_registry()
+            del self.__tasks_by_id[task.id]
+            last = self.__tasks_by_idx.pop()
+            if last is not task:
+                self.__tasks_by_idx[task._idx] = last
+                last._set_idx(task._idx)
+            for index in self.__indexes.values():
+                index.remove(task)
+            if self._watching:
+                task._unwatch()
+            self._structure_changed()
+            if self.__changes is not None:
+                self.__changes.record(task, 'remove')
+
+    def _restore_registry(self, registry: Dict[Any, Task]):
+        """Restores registry saved by batch, indexes must be rebuilt after"""
+        self.__tasks_by_id = registry
+
+    def _rebuild_indexes(self):
+        self.__tasks_by_idx = list(self.__tasks_by_id.values())
+        for i, t in enumerate(self.__tasks_by_idx):
+            t._set_idx(i)
+            if self._watching:
+                t._watch()
+        for attribute in list(self.__indexes.keys()):
+            index = _AttributeIndex(attribute)
+            for t in self.__tasks_by_id.values():
+                index.add(t)
+            self.__indexes[attribute] = index
+        self._structure_changed()
+
+    def _version(self) -> int:
+        return self.__version
+
+    def _structure_changed(self):
+        self.__version += 1
+        self.__closures.invalidate()
+        self.__tasks = None
+        self.__positions = None
+        self.__subtree_ends = None
+        self.__intervals = None
+        self.__topological_order = None
+
+    def _parent_changed(self, task: Task):
+        index = self.__indexes.get('parent_id')
+        if index is not None and task is not self.__root:
+            index.update(task)
+        self._structure_changed()
+
+    def _attribute_changed(self, task: Task, name: str):
+        if name == 'start' or name == 'end':
+            self.__intervals = None
+            self.__dates_version += 1
+        index = self.__indexes.get(name)
+        if index is not None and task is not self.__root:
+            index.update(task)
+
+    def __all_tasks(self) -> List[Task]:
+        if self.__tasks is None:
+            self.__tasks = list(_iter_subtree(self.__root))
+        return self.__tasks
+
+    def _search(self, query: TaskQuery) -> Optional[List[Task]]:
+        """
+        Searches tasks using indexes
+        :param query: query
+        :return: matched tasks in WBS order or None if no index can serve query
+        """
+        candidates = None
+        for k, v in query._filters().items():
+            name, op, _ = _parse_filter(k)
+            if name == 'id' and op in (None, '_in_') and 'id' not in self.__indexes:
+                found = self.__id_candidates(v if op else [v])
+            else:
+                index = self.__indexes.get(name)
+                found = index.candidates(op, v) if index is not None else None
+            if found is not None and (candidates is None or len(found) < len(candidates)):
+                candidates = found
+
+        if candidates is None:
+            return None
+
+        return query.filter(self.__in_wbs_order(candidates.values()))
+
+    def __task_positions(self) -> Dict[int, int]:
+        if self.__positions is None:
+            self.__positions = {id(t): i for i, t in enumerate(self.__all_tasks())}
+        return self.__positions
+
+    def __in_wbs_order(self, tasks: Iterable[Task]) -> List[Task]:
+        positions = self.__task_positions()
+        return sorted(tasks, key=lambda t: positions[id(t)])
+
+    # noinspection PyProtectedMember
+    def __nested_sets(self) -> List[int]:
+        if self.__subtree_ends is None:
+            tasks = self.__all_tasks()
+            positions = self.__task_positions()
+            ends = list(range(len(tasks)))
+            # Children are after parent in tasks list, so their subtrees are known when parent is visited
+            for i in range(len(tasks) - 1, -1, -1):
+                children = tasks[i]._children_links()
+                if children:
+                    ends[i] = ends[positions[id(children[-1])]]
+            self.__subtree_ends = ends
+        return self.__subtree_ends
+
+    def __position(self, task: Task) -> int:
+        if task not in self:
+            raise RuntimeError(f"Task {task.id} is not in WBS")
+        return self.__task_positions()[id(task)]
+
+    def _is_ancestor(self, parent: Task, task: Task) -> Optional[bool]:
+        """
+        Checks ancestry using nested sets if they are built for current structure
+        :return: check result or None if nested sets are not built
+        """
+        if self.__subtree_ends is None or parent is self.__root:
+            return None
+        positions = self.__positions
+        i, j = positions.get(id(parent)), positions.get(id(task))
+        if i is None or j is None:
+            return False
+        return i < j <= self.__subtree_ends[i]
+
+    def is_ancestor(self, parent: Task, task: Task) -> bool:
+        """
+        Checks task is a child of parent on any level of hierarchy
+        :param parent: supposed parent task
+        :param task: task
+        :return: True if parent is ancestor of task
+        """
+        i, j = self.__position(parent), self.__position(task)
+        return i < j <= self.__nested_sets()[i]
+
+    def subtree_size(self, task: Task) -> int:
+        """
+        Number of tasks in subtree, including task itself
+        :param task: task
+        :return: subtree size
+        """
+        i = self.__position(task)
+        return self.__nested_sets()[i] - i + 1
+
+    def subtree_tasks(self, task: Task) -> _ImmutableTaskList:
+        """
+        All children of task in WBS order. Same as task.all_children, but is a slice of cached tasks list
+        :param task: task
+        :return: list of tasks
+        """
+        i = self.__position(task)
+        return _ImmutableTaskList(self.__all_tasks()[i + 1:self.__nested_sets()[i] + 1])
+
+    def _active_between(self, start: datetime, end: datetime) -> Optional[List[Task]]:
+        """
+        Searches tasks active in period using interval index
+        :return: tasks in WBS order or None if index can't be used
+        """
+        if self.__intervals is None:
+            self.__watch()
+            intervals = []
+            self.__irregular_intervals = []
+            for t in self.__all_tasks():
+                if t.start is None or t.end is None:
+                    continue
+                if t.start <= t.end:
+                    intervals.append((t.start, t.end, t))
+                else:
+                    self.__irregular_intervals.append(t)
+            try:
+                self.__intervals = IntervalTree(intervals)
+            except TypeError:
+                self.__intervals = False
+
+        if self.__intervals is False:
+            return None
+
+        try:
+            if end < start:
+                return None
+            tasks = self.__intervals.overlap(start, end)
+            tasks += [t for t in self.__irregular_intervals if t.start <= end and t.end >= start]
+        except TypeError:
+            return None
+        return self.__in_wbs_order(tasks)
+
+    def __id_candidates(self, ids: Any) -> Optional[Dict[int, Task]]:
+        if type(ids) not in (list, tuple, set, frozenset):
+            return None
+        res = {}
+        try:
+            for i in ids:
+                t = self.__tasks_by_id.get(i)
+                if t is not None:
+                    res[id(t)] = t
+        except TypeError:
+            return None
+        return res
+
+    def create_index(self, attribute: str):
+        """
+        Creates index of tasks by attribute, used by tasks searches: wbs.tasks(attribute=...).
+        Index serves equality, _in_, _is_none_, _lt_, _le_, _gt_ and _ge_ filters
+        and is kept up-to-date on task attributes changes
+        :param attribute: task attribute name: resource, parent_id, milestone, any custom attribute
+        """
+        if attribute in self.__indexes:
+            return
+        self.__watch()
+        index = _AttributeIndex(attribute)
+        for t in self.__tasks_by_id.values():
+            index.add(t)
+        self.__indexes[attribute] = index
+
+    # noinspection PyProtectedMember
+    def dispose(self):
+        """
+        Unlinks all tasks of WBS from each other and from WBS. Tasks are linked in both directions, so dropped WBS
+        is freed by garbage collector only. After dispose WBS and its tasks are freed by reference counting
+        as soon as they are dropped. Links to tasks of other WBS are removed.
+        WBS and its tasks must not be used after dispose
+        """
+        if self.__batch is not None:
+            raise RuntimeError("Can't dispose WBS inside batch")
+        tasks = [self.__root]
+        tasks.extend(_iter_subtree(self.__root))
+        disposed = {id(t): t for t in tasks}
+        for t in tasks:
+            t._dispose(disposed)
+        self.__tasks_by_id = {}
+        self.__tasks_by_idx = []
+        self.__indexes = {}
+        self.__closures = _ClosureCache()
+        self.__irregular_intervals = []
+        self.__graph_cache = {}
+        self.__changes = None
+        self._structure_changed()
+
+    def track_changes(self) -> 'WBS':
+        """
+        Starts journal of task changes: added and removed tasks, changed attributes, parents and links.
+        Every change gets next version number, see change_version and changes_since.
+        Tracking adds small overhead to every change of WBS tasks until stop_tracking_changes or dispose is called
+        :return: self
+        """
+        if self.__changes is None:
+            self.__watch()
+            self.__changes = _ChangeJournal(self)
+        return self
+
+    def stop_tracking_changes(self):
+        """
+        Stops journal of task changes started by track_changes. Recorded changes and subscribers are dropped,
+        changes_since raises RuntimeError until tracking is started again
+        """
+        if self.__changes is not None:
+            self.__changes.subscribers.clear()
+            self.__changes = None
+            self.__unwatch()
+
+    @property
+    def change_version(self) -> int:
+        """Version of the last tracked change, 0 if no changes tracked"""
+        return self.__changes.version if self.__changes is not None else 0
+
+    def changes_since(self, version: int) -> List[TaskChange]:
+        """
+        Changes made after version, in order they were made
+        :param version: version returned by change_version earlier
+        :return: list of changes
+        :raises RuntimeError: if changes are not tracked
+        """
+        if self.__changes is None:
+            raise RuntimeError("WBS changes are not tracked, call track_changes() first")
+        return self.__changes.since(version)
+
+    def clear_changes(self, version: int = None):
+        """
+        Drops journal changes which are not needed anymore. Versions of next changes are not affected
+        :param version: drop changes up to this version, all changes if None
+        """
+        if self.__changes is not None:
+            self.__changes.clear(self.__changes.version if version is None else version)
+
+    def subscribe(self, callback: Callable[[List[TaskChange]], None]):
+        """
+        Adds callback called with list of changes after every change of tasks. Changes made inside batch()
+        are passed to callback once on exit from batch, changes of rolled back batch are not passed.
+        Starts tracking of changes
+        :param callback: callback
+        """
+        self.track_changes()
+        self.__changes.subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[List[TaskChange]], None]):
+        """
+        Removes callback added by subscribe
+        :param callback: callback
+        """
+        if self.__changes is not None and callback in self.__changes.subscribers:
+            self.__changes.subscribers.remove(callback)
+
+    def batch(self) -> '_WBSBatch':
+        """
+        Context manager grouping changes of tasks. Checks of new predecessor/successor links are deferred
+        until the end of block and done once for all links. If checks fail or block raises an exception,
+        all changes made inside the block are rolled back.
+
+            with wbs.batch():
+                for t in tasks:
+                    t.predecessors = ...
+
+        Batch collects changes of tasks of this WBS only. Tasks of other WBS can't be changed together with tasks
+        of this WBS inside batch, batches of one WBS can't be nested. Entering and leaving batch of WBS without
+        indexes or change journal visits every task, so tasks report attribute changes inside batch only.
+
+        :return: context manager
+        :raises RuntimeError: on exit, if new links are invalid
+        """
+        return _WBSBatch(self)
+
+    def drop_index(self, attribute: str):
+        """
+        Drops index of tasks by attribute
+        :param attribute: task attribute name
+        """
+        if self.__indexes.pop(attribute, None) is not None:
+            self.__unwatch()
+
     @property
     def roots(self) -> _ChildrenList:
         """List of all root tasks in WBS"""
@@ -36,7 +671,20 @@ class WBS:
     @property
     def tasks(self) -> _ImmutableTaskList:
         """List of all tasks in WBS"""
-        return self.__root.all_children
+        return _WBSTaskList(self, self.__all_tasks(), self.__version)
+
+    def iter_tasks(self, order: str = 'pre', prune: Callable[[Task], bool] = None) -> Iterator[Task]:
+        """
+        Iterates all tasks in WBS without recursion
+        :param order: 'pre' - parent before its children (same as tasks), 'post' - children before parent,
+            'bfs' - level by level
+        :param prune: children of tasks matching this predicate are skipped
+        :return: iterator over tasks
+        """
+        if order == 'pre' and prune is None:
+            # Cached list is replaced, not modified, on structure change, so iteration is safe
+            return iter(self.__all_tasks())
+        return _iter_subtree(self.__root, order, prune)
 
     @property
     def start(self) -> Optional[datetime]:
@@ -54,19 +702,6 @@ class WBS:
             return max(ends)
         return None
 
-    def __remove(self, task_to_remove: Task, current: Task):
-        if task_to_remove is None:
-            return False
-
-        if current.children.remove(task_to_remove):
-            return True
-
-        for ch in current.children:
-            if self.__remove(task_to_remove, ch):
-                return True
-
-        return False
-
     def remove(self, task: Task) -> bool:
         """
         Remove task from WBS
@@ -75,7 +710,11 @@ class WBS:
         if not isinstance(task, Task):
             raise RuntimeError(f'{type(task)} is not Task')
 
-        return self.__remove(task, self.__root)
+        if task not in self:
+            return False
+
+        parent = task.parent if task.parent is not None else self.__root
+        return parent.children.remove(task)
 
     def remove_all(self, key: Optional[Callable[['Task'], bool]] = None, **kwargs):
         """
@@ -90,16 +729,25 @@ class WBS:
             return _ImmutableTaskList([])
 
         for t in tasks_to_delete:
-            self.__remove(t, self.__root)
+            self.remove(t)
 
         return tasks_to_delete
 
     def __getitem__(self, task_id: Any):
         try:
-            return next((t for t in self.__root.all_children if t.id == task_id))
-        except StopIteration:
+            return self.__tasks_by_id[task_id]
+        except KeyError:
             raise RuntimeError(f"Task with id={task_id} not found")
 
+    def __contains__(self, item: Union[Task, Any]) -> bool:
+        """
+        Check task or task id exists in WBS
+        :param item: task or task id
+        """
+        if isinstance(item, Task):
+            return self.__tasks_by_id.get(item.id) is item
+        return item in self.__tasks_by_id
+
     def __floordiv__(self, other: Union['Task', Iterable['Task']]):
         return self.__root // other
 
@@ -109,41 +757,61 @@ class WBS:
     def __exit__(self, exc_type, exc_val, exc_tb):
         pass
 
-    def __clone_tasks(self, roots: Iterable[Task]) -> Dict[int, Task]:
-        all_tasks_list = []
+    # noinspection PyProtectedMember
+    def __clone(self, roots: Iterable[Task], following_links_last: bool = False) -> 'WBS':
+        """
+        Copies tasks subtrees in one pass. Source graph is valid, so links are set directly without checks
+        and topological order of copies follows order of source tasks
+        :param roots: roots of copied subtrees
+        :param following_links_last: move links to tasks following the task in WBS order to the end of lists
+        """
+        roots = list({id(r): r for r in roots}.values())
+        root_ids = set(id(r) for r in roots)
+        all_tasks = {}
         for r in roots:
-            all_tasks_list.append(r)
-            all_tasks_list += [t for t in r.all_children]
-
-        all_tasks = {task.id: task for task in all_tasks_list}
-
-        cloned_tasks = {task.id: task.clone() for task in all_tasks.values()}
+            for t in _collect_subtree(r):
+                all_tasks[id(t)] = t
+        tasks = list(all_tasks.values())
+        positions = {k: i for i, k in enumerate(all_tasks.keys())}
+        cloned_tasks = {k: t.clone() for k, t in all_tasks.items()}
+        clones = set(id(c) for c in cloned_tasks.values())
 
         # Some tasks in WBS can have predecessors or successors outside WBS (i.e. from another project).
-        # This predecessors/successors should not be copied.
-        for t in all_tasks.values():
-            for pr in t.predecessors:
-                if pr.wbs != self:
-                    cloned_tasks.setdefault(pr.id, pr)
-            for sc in t.successors:
-                if sc.wbs != self:
-                    cloned_tasks.setdefault(sc.id, sc)
-
-        for t in all_tasks.values():
-            c = cloned_tasks[t.id]
-            c.parent = cloned_tasks.get(all_tasks[t.id].parent.id) if all_tasks[t.id].parent else None
-            c.children = [cloned_tasks[ch.id] for ch in all_tasks[t.id].children]
-            c.predecessors = [cloned_tasks[ch.id] for ch in all_tasks[t.id].predecessors if ch.id in cloned_tasks]
-            c.successors = [cloned_tasks[ch.id] for ch in all_tasks[t.id].successors if ch.id in cloned_tasks]
-
-        return cloned_tasks
-
-    def __clone(self, roots: Iterable[Task]) -> 'WBS':
-
-        cloned_tasks = self.__clone_tasks(roots)
+        # This predecessors/successors should not be copied, copies are linked to them.
+        # Links to tasks of this WBS outside of subtree are dropped, other links keep their order
+        def linked(task_position: int, links: Sequence[Task]) -> List[Task]:
+            if not links:
+                return []
+            res = [v for v in links if id(v) in positions or v.wbs is not self]
+            if following_links_last:
+                following = [v for v in res if positions.get(id(v), -1) > task_position]
+                following.sort(key=lambda v: positions[id(v)])
+                res = [v for v in res if positions.get(id(v), -1) < task_position] + following
+            return [cloned_tasks[id(v)] if id(v) in positions else v for v in res]
 
         cloned_project = WBS()
-        cloned_project.roots = [cloned_tasks[r.id] for r in roots]
+        root = cloned_project._root()
+        orders = sorted(c._ord for c in cloned_tasks.values())
+        order_of = {id(t): pos for t, pos in zip(sorted(tasks, key=lambda t: t._ord), orders)}
+        external_links = []
+        for i, t in enumerate(tasks):
+            c = cloned_tasks[id(t)]
+            predecessors = linked(i, t._predecessors_links())
+            successors = linked(i, t._successors_links())
+            external_links += [(v, c, False) for v in predecessors if id(v) not in clones]
+            external_links += [(v, c, True) for v in successors if id(v) not in clones]
+            c._set_links(
+                cloned_project,
+                root if id(t) in root_ids else cloned_tasks[id(t.parent)],
+                [cloned_tasks[id(ch)] for ch in t._children_links() if id(ch) not in root_ids],
+                predecessors,
+                successors,
+                order_of[id(t)]
+            )
+        root._set_links(cloned_project, None, [cloned_tasks[id(r)] for r in roots], [], [], root._ord)
+        cloned_project._register_all(list(cloned_tasks.values()))
+        for v, c, successor in external_links:
+            v._link_external(c, successor)
 
         for k in self.__dict__.keys():
             if not k.startswith('_'):
@@ -152,19 +820,52 @@ class WBS:
         return cloned_project
 
     def clone(self) -> 'WBS':
-        """Returns copy of this WBS."""
+        """
+        Returns copy of this WBS. All tasks are copied at once, tasks are not shared with this WBS.
+        Children, predecessors and successors of copied tasks keep order of source lists,
+        links to tasks outside this WBS are kept and linked tasks get links to copies appended
+        :return: new WBS
+        """
         return self.__clone(self.roots)
 
+    def _schedule_copy(self) -> 'WBS':
+        """
+        Copy of WBS for schedulers. Unlike clone(), link lists don't keep source order:
+        links to tasks following the task in WBS order go last, in WBS order.
+        Schedulers visit linked tasks in this order
+        """
+        return self.__clone(self.roots, True)
+
     def subtree(self, roots: Union[Task, Iterable[Task]]) -> 'WBS':
         """
         Returns new WBS, contains subtree of this WBS with all children
         and successors/predecessors inside this subtree or outside WBS.
+        Tasks are copied as in clone(), links keep order of source lists.
 
         :param roots: root tasks for new WBS
         :return: new WBS
         """
         return self.__clone(_to_list(roots))
 
+    def topological_order(self) -> _ImmutableTaskList:
+        """
+        Returns all tasks of WBS ordered by predecessor/successor links: each task follows all its predecessors.
+        Order is maintained incrementally while tasks are linked, tasks are sorted by it on first call
+        after tasks hierarchy or links change, later calls return the same order
+        :return: list of tasks in topological order
+        """
+        if self.__topological_order is None:
+            self.__topological_order = sorted(self.__all_tasks(), key=lambda t: t._ord)
+        return _ImmutableTaskList(self.__topological_order)
+
+    def to_frame(self) -> 'TaskFrame':
+        """
+        Converts WBS to columnar TaskFrame. Requires numpy
+        :return: frame
+        """
+        from pjplan.frame import TaskFrame
+        return TaskFrame.from_wbs(self)
+
     def critical_path(self) -> _ImmutableTaskList:
         """
         Calculate critical path based on tasks dependencies, estimates and spent times.
@@ -190,3 +891,214 @@ class WBS:
         }
         """
         return print(_Repr.repr(self.roots, fields, children, theme))
+
+
+class _WBSBatch:
+    """Context manager returned by WBS.batch()"""
+
+    def __init__(self, wbs: WBS):
+        self.__wbs = wbs
+        self.__batch: Optional[_Batch] = None
+
+    # noinspection PyProtectedMember
+    def __enter__(self) -> '_WBSBatch':
+        wbs = self.__wbs
+        if wbs._batch() is not None:
+            raise RuntimeError("Batch of WBS is already active")
+        self.__batch = _Batch()
+        wbs._set_batch(self.__batch)
+        return self
+
+    # noinspection PyProtectedMember
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        batch = self.__batch
+        if batch is None:
+            return False
+        self.__batch = None
+        if exc_type is not None:
+            self.__rollback(batch)
+            return False
+        self.__wbs._set_batch(None)
+        try:
+            Task._commit_links(batch.links)
+        except RuntimeError:
+            self.__rollback(batch)
+            raise
+        batch.notify()
+        return False
+
+    # noinspection PyProtectedMember
+    def __rollback(self, batch: _Batch):
+        # Batch stays active while rolled back, so changes made by rollback are dropped from journals
+        self.__wbs._set_batch(batch)
+        try:
+            batch.rollback()
+        finally:
+            self.__wbs._set_batch(None)
+
+
+class WBSBuilder:
+    """
+    Builds WBS from new tasks with known parent and predecessor ids.
+    Links are set directly, whole graph is validated once in O(n + e) and all errors are reported together
+    """
+
+    def __init__(self):
+        self.__tasks: List[Task] = []
+        self.__parent_ids: List[Any] = []
+        self.__predecessor_ids: List[Iterable[Any]] = []
+
+    def add(self, task: Task, parent_id: Any = None, predecessor_ids: Iterable[Any] = None) -> Task:
+        """
+        Adds task to WBS being built
+        :param task: new task without links
+        :param parent_id: id of parent task, None for root task
+        :param predecessor_ids: ids of predecessor tasks
+        :return: task
+        """
+        self.__tasks.append(task)
+        self.__parent_ids.append(parent_id)
+        self.__predecessor_ids.append(predecessor_ids if predecessor_ids is not None else [])
+        return task
+
+    def __len__(self) -> int:
+        return len(self.__tasks)
+
+    # noinspection PyProtectedMember
+    def build(self, **kwargs) -> WBS:
+        """
+        Validates tasks graph and builds WBS
+        :param kwargs: WBS arguments
+        :return: new WBS
+        :raises RuntimeError: with list of all found errors (duplicate ids, links to unknown tasks, links between
+            parent and child, cyclic parents or dependencies)
+        """
+        tasks = self.__tasks
+        n = len(tasks)
+        errors = []
+
+        by_id: Dict[Any, int] = {}
+        for i, t in enumerate(tasks):
+            if t.wbs is not None or t.parent is not None or t._children_links() or t._predecessors_links() \
+                    or t._successors_links():
+                errors.append(f"Task {t.id} already has links")
+            if t.id in by_id:
+                errors.append(f"Duplicate task id {t.id}")
+            else:
+                by_id[t.id] = i
+
+        # Hierarchy. Links are kept in sparse dicts by task position, most tasks have few links
+        parents = [-1] * n
+        children: Dict[int, List[int]] = {}
+        for i, parent_id in enumerate(self.__parent_ids):
+            if parent_id is None:
+                continue
+            p = by_id.get(parent_id)
+            if p is None:
+                errors.append(f"Task {tasks[i].id}: parent {parent_id} not found")
+            else:
+                parents[i] = p
+                children.setdefault(p, []).append(i)
+
+        # Nested sets: subtree of task i is (enter[i], leave[i]]. Tasks not reachable from roots have cyclic parents
+        enter, leave = [-1] * n, [-1] * n
+        counter = 0
+        for r in range(n):
+            if parents[r] >= 0:
+                continue
+            stack = [(r, False)]
+            while stack:
+                i, done = stack.pop()
+                if done:
+                    leave[i] = counter
+                    continue
+                enter[i] = counter
+                counter += 1
+                stack.append((i, True))
+                if i in children:
+                    stack.extend((ch, False) for ch in reversed(children[i]))
+        unreachable = [tasks[i].id for i in range(n) if enter[i] < 0]
+        if unreachable:
+            errors.append(f"Cyclic parents of tasks {unreachable}")
+
+        def is_ancestor(a: int, b: int) -> bool:
+            return enter[a] >= 0 and enter[b] >= 0 and enter[a] < enter[b] < leave[a]
+
+        # Dependencies
+        predecessors: Dict[int, List[int]] = {}
+        successors: Dict[int, List[int]] = {}
+        for i, predecessor_ids in enumerate(self.__predecessor_ids):
+            if not predecessor_ids:
+                continue
+            seen = set()
+            for predecessor_id in predecessor_ids:
+                p = by_id.get(predecessor_id)
+                if p is None:
+                    errors.append(f"Task {tasks[i].id}: predecessor {predecessor_id} not found")
+                elif p in seen:
+                    continue
+                elif is_ancestor(p, i):
+                    errors.append(f"Task {tasks[i].id}: parent {predecessor_id} can't be predecessor")
+                elif is_ancestor(i, p):
+                    errors.append(f"Task {tasks[i].id}: child {predecessor_id} can't be predecessor")
+                else:
+                    seen.add(p)
+                    predecessors.setdefault(i, []).append(p)
+                    successors.setdefault(p, []).append(i)
+
+        # Kahn's algorithm, gives topological order of tasks
+        in_degree = [0] * n
+        for i, p in predecessors.items():
+            in_degree[i] = len(p)
+        queue = deque(i for i in range(n) if in_degree[i] == 0)
+        order = []
+        while queue:
+            i = queue.popleft()
+            order.append(i)
+            for s in successors.get(i, ()):
+                in_degree[s] -= 1
+                if in_degree[s] == 0:
+                    queue.append(s)
+        if len(order) < n:
+            errors.append(f"Cyclic dependency between tasks {self.__cycled(in_degree, predecessors, successors)}")
+
+        if errors:
+            raise RuntimeError("WBS validation failed:\n" + "\n".join(errors))
+
+        wbs = WBS(**kwargs)
+        root = wbs._root()
+        positions = sorted(t._ord for t in tasks)
+        orders = [0] * n
+        for pos, i in zip(positions, order):
+            orders[i] = pos
+        no_links = ()
+        for i, t in enumerate(tasks):
+            t._set_links(
+                wbs,
+                tasks[parents[i]] if parents[i] >= 0 else root,
+                [tasks[ch] for ch in children[i]] if i in children else no_links,
+                [tasks[p] for p in predecessors[i]] if i in predecessors else no_links,
+                [tasks[s] for s in successors[i]] if i in successors else no_links,
+                orders[i]
+            )
+        roots = [tasks[i] for i in range(n) if parents[i] < 0]
+        root._set_links(wbs, None, roots, [], [], root._ord)
+        wbs._register_all(tasks)
+        return wbs
+
+    def __cycled(self, in_degree: List[int], predecessors: Dict[int, List[int]],
+                 successors: Dict[int, List[int]]) -> List[Any]:
+        """Ids of tasks left after Kahn's algorithm, without tasks which only follow cycles"""
+        left = [i for i in range(len(in_degree)) if in_degree[i] > 0]
+        left_set = set(left)
+        out_degree = {i: sum(1 for s in successors.get(i, ()) if s in left_set) for i in left}
+        queue = deque(i for i in left if out_degree[i] == 0)
+        while queue:
+            i = queue.popleft()
+            left_set.discard(i)
+            for p in predecessors.get(i, ()):
+                if p in out_degree:
+                    out_degree[p] -= 1
+                    if out_degree[p] == 0:
+                        queue.append(p)
+        return [self.__tasks[i].id for i in left if i in left_set]
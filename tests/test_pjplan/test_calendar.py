@@ -1,7 +1,8 @@
 import unittest
-from datetime import datetime
+import math
+from datetime import datetime, timedelta
 
-from pjplan import WeeklyCalendar
+from pjplan import WeeklyCalendar, DirectCalendar, FixedCalendar, Resource
 
 
 class TestWeeklyCalendar(unittest.TestCase):
@@ -44,3 +45,164 @@ class TestWeeklyCalendar(unittest.TestCase):
         self.assertEqual(5, cal.get_available_units(datetime(2023, 4, 7)))
         self.assertEqual(0, cal.get_available_units(datetime(2023, 4, 8)))
         self.assertEqual(0, cal.get_available_units(datetime(2023, 4, 9)))
+
+
+class TestAvailableUnitsRange(unittest.TestCase):
+
+    def assertRangeEqual(self, cal, start, end):
+        units = cal.get_available_units_range(start, end).tolist()
+        self.assertEqual((end - start).days + 1, len(units))
+        for i, u in enumerate(units):
+            expected = cal.get_available_units(start + timedelta(days=i))
+            if expected is None:
+                self.assertTrue(math.isnan(u))
+            else:
+                self.assertEqual(expected, u)
+
+    def test_calendars(self):
+        weekly = WeeklyCalendar(days=[0, 1, 2, 3, 4], units_per_day=8,
+                                start=datetime(2023, 4, 4, 12), end=datetime(2023, 6, 1))
+        holidays = DirectCalendar({datetime(2023, 4, 5): 8, datetime(2023, 5, 1): 4})
+        fixed = FixedCalendar(2.5, start=datetime(2023, 4, 10), end=datetime(2023, 5, 10, 6))
+        start, end = datetime(2023, 3, 20), datetime(2023, 6, 10)
+
+        for cal in [weekly, holidays, fixed, weekly - holidays, weekly + fixed, (weekly | fixed) * 2,
+                    (weekly + 1) / (fixed + 0.5), (holidays | weekly) - fixed,
+                    (weekly - holidays).apply(lambda u: u / 2 if u is not None else None),
+                    (fixed + 1).apply(math.sqrt)]:
+            self.assertRangeEqual(cal, start, end)
+
+        self.assertRaises(RuntimeError, lambda: weekly.get_available_units_range(end, start))
+
+    def test_vectorized_func(self):
+        import numpy as np
+
+        cal = WeeklyCalendar(days=[0, 1, 2, 3, 4], units_per_day=8, start=datetime(2023, 4, 5))
+        cal = cal.apply(np.sqrt, vectorized=True)
+
+        self.assertIsNone(cal.get_available_units(datetime(2023, 4, 4)))
+        self.assertEqual(math.sqrt(8), cal.get_available_units(datetime(2023, 4, 6)))
+        self.assertRangeEqual(cal, datetime(2023, 4, 1), datetime(2023, 5, 1))
+
+    def test_disjunction_days(self):
+        """Как и get_available_units, следующий календарь дизъюнкции вычисляется только для дней без часов"""
+        d = datetime(2023, 4, 5)
+        cal = FixedCalendar(8) | (FixedCalendar(8) / DirectCalendar({d: 0}))
+        self.assertRangeEqual(cal, d - timedelta(days=10), d + timedelta(days=10))
+        self.assertEqual([8], Resource('r', cal).get_available_units_range(d, d).tolist())
+        self.assertRaises(ZeroDivisionError,
+                          lambda: (FixedCalendar(8) / DirectCalendar({d: 0})).get_available_units_range(d, d))
+
+        calls = []
+        weekly = WeeklyCalendar(days=[0, 1, 2, 3, 4], units_per_day=8)
+        cal = weekly | weekly.apply(lambda u: calls.append(u) or 1)
+        self.assertEqual([8, 8, 8, 8, 8, 1, 1],
+                         cal.get_available_units_range(datetime(2023, 4, 3), datetime(2023, 4, 9)).tolist())
+        self.assertEqual([0, 0], calls)
+
+
+# noinspection PyProtectedMember
+class TestOptimize(unittest.TestCase):
+
+    def assertSameUnits(self, cal, optimized):
+        d = datetime(2023, 3, 25)
+        while d < datetime(2023, 5, 10):
+            for date in [d, d.replace(hour=13)]:
+                expected, units = cal.get_available_units(date), optimized.get_available_units(date)
+                self.assertEqual(expected, units)
+                self.assertIs(type(expected), type(units))
+            d += timedelta(days=1)
+
+    def test_fold_fixed(self):
+        cal = (FixedCalendar(1) + FixedCalendar(2.5)) * FixedCalendar(2) / FixedCalendar(7)
+        optimized = cal.optimize()
+
+        self.assertIsInstance(optimized, FixedCalendar)
+        self.assertSameUnits(cal, optimized)
+
+    def test_disjunction(self):
+        weekly = WeeklyCalendar(days=[0, 1, 2, 3, 4], units_per_day=8)
+        extra = DirectCalendar({datetime(2023, 4, 8): 4, datetime(2023, 4, 9): 0})
+        cal = FixedCalendar(0) | (DirectCalendar({datetime(2023, 4, 9): 2}) | extra) | DirectCalendar() | weekly
+        optimized = cal.optimize()
+
+        calendars = optimized._WorkCalendarDisjunction__calendars
+        self.assertEqual([DirectCalendar, WeeklyCalendar], [type(c) for c in calendars])
+        self.assertEqual([datetime(2023, 4, 9), datetime(2023, 4, 8)], calendars[0].dates)
+        self.assertSameUnits(cal, optimized)
+
+    def test_chains(self):
+        weekly = WeeklyCalendar(days=[0, 1, 2, 3, 4], units_per_day=8, end=datetime(2023, 5, 1, 12))
+        holidays = DirectCalendar({datetime(2023, 4, 5): 8, datetime(2023, 4, 6): 10})
+        vacation = DirectCalendar({datetime(2023, 4, 6): 1, datetime(2023, 4, 12): 3})
+        extra = DirectCalendar({datetime(2023, 4, 6): 4, datetime(2023, 4, 12): 1.5})
+
+        for cal in [weekly + 1 + extra + FixedCalendar(0.1), weekly - holidays - vacation - extra,
+                    holidays - vacation - weekly, (weekly | extra) * 0.5 * 3, weekly / 2 / 3,
+                    (weekly - holidays - vacation).apply(lambda u: u * 2 if u is not None else None)]:
+            self.assertSameUnits(cal, cal.optimize())
+
+        optimized = (weekly - holidays - vacation - extra).optimize()
+        self.assertEqual(4, len(optimized._WorkCalendarSub__calendars))
+
+
+# noinspection PyProtectedMember
+class TestCompiledCalendar(unittest.TestCase):
+
+    def test_compile(self):
+        weekly = WeeklyCalendar(days=[0, 1, 2, 3, 4], units_per_day=8)
+        holidays = DirectCalendar({datetime(2023, 4, 5): 8})
+        cal = ((weekly - holidays) | DirectCalendar({datetime(2023, 4, 8): 4})) + FixedCalendar(1)
+        compiled = cal.compile(datetime(2023, 4, 3), datetime(2023, 4, 30))
+
+        d = datetime(2023, 3, 20)
+        while d < datetime(2023, 5, 10):
+            self.assertEqual(cal.get_available_units(d), compiled.get_available_units(d))
+            self.assertEqual(cal.get_available_units(d), compiled.get_available_units(d.replace(hour=15)))
+            d += timedelta(days=1)
+
+        self.assertEqual(9 + 9 + 1 + 9 + 9 + 5 + 1, compiled.units_between(datetime(2023, 4, 3), datetime(2023, 4, 10)))
+        self.assertEqual(0, compiled.units_between(datetime(2023, 4, 5), datetime(2023, 4, 5)))
+        self.assertEqual(datetime(2023, 4, 3), compiled.date_after_units(datetime(2023, 4, 3), 0))
+        self.assertEqual(datetime(2023, 4, 4, 8), compiled.date_after_units(datetime(2023, 4, 3), 12))
+        self.assertEqual(datetime(2023, 4, 7), compiled.date_after_units(datetime(2023, 4, 3), 28))
+        self.assertEqual(datetime(2023, 4, 10), compiled.nearest_available_day(datetime(2023, 4, 10, 12), 1))
+        self.assertRaises(RuntimeError, lambda: compiled.date_after_units(datetime(2023, 4, 3), 1000))
+        self.assertRaises(RuntimeError, lambda: compiled.units_between(datetime(2023, 4, 1), datetime(2023, 4, 5)))
+
+    def test_units_type(self):
+        cal = WeeklyCalendar(days=[0, 1, 2, 3, 4], units_per_day=8) | FixedCalendar(0.5)
+        compiled = cal.compile(datetime(2023, 4, 3), datetime(2023, 4, 9))
+
+        self.assertEqual([8, 8, 8, 8, 8, 0.5, 0.5], compiled._values())
+        self.assertEqual([int] * 5 + [float] * 2, [type(v) for v in compiled._values()])
+        self.assertIs(int, type(Resource('r', cal).get_available_units(datetime(2023, 4, 3))))
+
+    def test_resource(self):
+        holidays = DirectCalendar({datetime(2023, 4, 5): 8})
+        resource = Resource('r', WeeklyCalendar(days=[0, 1, 2, 3, 4], units_per_day=8) - holidays)
+
+        self.assertEqual(0, resource.get_available_units(datetime(2023, 4, 5, 10)))
+        self.assertEqual(8, resource.get_available_units(datetime(2023, 4, 6)))
+        self.assertEqual(datetime(2023, 4, 6, 10), resource.get_nearest_availability_date(datetime(2023, 4, 5, 10), 1))
+        self.assertEqual(datetime(2023, 4, 10), resource.get_nearest_availability_date(datetime(2023, 4, 8), 1))
+        self.assertEqual(datetime(2023, 4, 5), resource.get_nearest_availability_date(datetime(2023, 4, 6), -1))
+        self.assertEqual(8, resource.get_available_units(datetime(2030, 1, 1)))
+
+        # Changed calendar is compiled again
+        holidays.set_units({datetime(2023, 4, 6): 2})
+        self.assertEqual(6, resource.get_available_units(datetime(2023, 4, 6)))
+        resource.calendar = FixedCalendar(3)
+        self.assertEqual(3, resource.get_available_units(datetime(2023, 4, 5)))
+
+    def test_resource_subclass(self):
+        class HalfDayResource(Resource):
+            def get_available_units(self, date, task=None):
+                return 0 if date.day % 2 else super().get_available_units(date, task) / 2
+
+        resource = HalfDayResource('r', WeeklyCalendar(days=[0, 1, 2, 3, 4], units_per_day=8))
+
+        self.assertEqual(datetime(2023, 4, 4), resource.get_nearest_availability_date(datetime(2023, 4, 3), 1))
+        self.assertEqual(datetime(2023, 4, 7), resource.get_nearest_availability_date(datetime(2023, 4, 9), -1))
+        self.assertEqual([0, 4, 0, 4, 0, 0, 0],
+                         resource.get_available_units_range(datetime(2023, 4, 3), datetime(2023, 4, 9)).tolist())
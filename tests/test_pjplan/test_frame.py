@@ -0,0 +1,78 @@
+from datetime import datetime
+from unittest import TestCase, skipIf
+
+from pjplan import WBS, Task, TaskFrame
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@skipIf(numpy is None, "numpy is not installed")
+class TestTaskFrame(TestCase):
+
+    @staticmethod
+    def __wbs():
+        wbs = WBS()
+        root = wbs // Task(1, 'Root', resource='dev')
+        t2 = root // Task(2, 'Child 2', resource='qa', estimate=8, spent=2, start=datetime(2025, 1, 1))
+        t3 = root // Task(('a', 3), 'Child 3', estimate=4, end=datetime(2025, 2, 1))
+        t4 = wbs // Task(4, 'Task 4', resource='dev', estimate=10, milestone=True)
+        t2 >> t3 >> t4
+        return wbs
+
+    def test_from_wbs(self):
+        frame = self.__wbs().to_frame()
+
+        self.assertEqual(4, len(frame))
+        self.assertEqual([1, 2, ('a', 3), 4], list(frame.id))
+        self.assertEqual([-1, 0, 0, -1], frame.parent.tolist())
+        self.assertEqual(['dev', 'qa'], frame.resources)
+        self.assertEqual([0, 1, -1, 0], frame.resource.tolist())
+        self.assertEqual([False, False, False, True], frame.milestone.tolist())
+        self.assertEqual([0, 0, 0, 1, 2], frame.pred_ptr.tolist())
+        self.assertEqual([1, 2], frame.pred_idx.tolist())
+
+    def test_to_wbs(self):
+        wbs = self.__wbs()
+        restored = TaskFrame.from_wbs(wbs).to_wbs()
+
+        self.assertEqual([t.id for t in wbs.tasks], [t.id for t in restored.tasks])
+        for t in wbs.tasks:
+            r = restored[t.id]
+            self.assertEqual(t.to_dict(), r.to_dict())
+            self.assertEqual(t.estimate, r.estimate)
+            self.assertEqual(t.spent, r.spent)
+            self.assertEqual([p.id for p in t.predecessors], [p.id for p in r.predecessors])
+            self.assertEqual(t.parent.id if t.parent else None, r.parent.id if r.parent else None)
+
+    def test_filter(self):
+        wbs = self.__wbs()
+        frame = wbs.to_frame()
+
+        for kwargs in [
+            dict(estimate_gt_=5),
+            dict(estimate_le_=8, resource='dev'),
+            dict(resource_in_=['qa', None]),
+            dict(resource_is_none_=True),
+            dict(name_like_='Child'),
+            dict(name_not_like_='3'),
+            dict(start_lt_=datetime(2025, 1, 2)),
+            dict(parent_id=1),
+            dict(milestone=True),
+        ]:
+            self.assertEqual([t.id for t in wbs.tasks(**kwargs)], [t.id for t in frame.tasks(wbs, **kwargs)],
+                             kwargs)
+
+    def test_rollup(self):
+        frame = self.__wbs().to_frame()
+
+        self.assertEqual([12, 8, 4, 10], frame.rollup('estimate').tolist())
+        self.assertEqual([2, 2, None, None], [None if numpy.isnan(v) else v for v in frame.rollup('spent')])
+        self.assertEqual(numpy.datetime64('2025-02-01'), frame.rollup('end', 'max')[0])
+        self.assertEqual(numpy.datetime64('2025-01-01'), frame.rollup('start', 'min')[0])
+        self.assertTrue(numpy.isnat(frame.rollup('start', 'min')[3]))
+
+        with self.assertRaises(RuntimeError):
+            frame.rollup('start')
@@ -74,3 +74,153 @@ class TestForwardScheduler(TestCase):
 
         self.assertEqual(datetime(2026, 1, 1), s[2].start)
         self.assertEqual(datetime(2026, 1, 2), s[1].start)
+
+    def test_long_chain(self):
+        p = WBS()
+        tasks = [p // Task(i, estimate=4) for i in range(1500)]
+        for i in range(len(tasks) - 1):
+            tasks[i + 1] >> tasks[i]
+
+        s = pl.ForwardScheduler(start=datetime(2100, 1, 1)).calc(p).schedule
+
+        self.assertEqual(datetime(2100, 1, 1), s[1499].start)
+        for i in range(len(tasks) - 1):
+            self.assertLessEqual(s[i + 1].end, s[i].start)
+
+    def test_child_successor_cycle(self):
+        p = WBS()
+        p // Task(1) // Task(3)
+        p // Task(2)
+        p[1] >> p[2] >> p[3]
+
+        with self.assertRaises(RuntimeError) as e:
+            pl.ForwardScheduler(start=datetime(2100, 1, 1)).calc(p)
+        self.assertEqual("Cyclic dependency between tasks and their children: 1 --> 3 --> 2 --> 1", str(e.exception))
+
+    # noinspection PyProtectedMember
+    def test_validation_cache(self):
+        from pjplan.schedule import _PassOrder
+
+        other = WBS()
+        external = other // Task(10, 'ext')
+        p = WBS()
+        p // Task(1, estimate=8) // Task(2, estimate=8)
+        p // Task(3, "3", estimate=8)
+        p[3] << p[1]
+        scheduler = pl.ForwardScheduler(start=datetime(2100, 1, 1))
+
+        s1 = scheduler.calc(p).schedule
+        order = p._cached((_PassOrder, True))
+        self.assertIsNotNone(order)
+        s2 = scheduler.calc(p).schedule
+        self.assertIs(order, p._cached((_PassOrder, True)))
+        self.assertEqual([(t.id, t.start, t.end) for t in s1.tasks], [(t.id, t.start, t.end) for t in s2.tasks])
+
+        p[3] << external
+        with self.assertRaises(RuntimeError) as e:
+            scheduler.calc(p)
+        self.assertEqual("Task 3 (3) has predecessor 10 (ext) w/o dates and outside wbs", str(e.exception))
+
+        external.start = external.end = datetime(2020, 1, 1)
+        order = p._cached((_PassOrder, True))
+        scheduler.calc(p)
+        self.assertIs(order, p._cached((_PassOrder, True)))
+
+        p[2].end = datetime(2200, 1, 1)
+        with self.assertRaises(RuntimeError) as e:
+            scheduler.calc(p)
+        self.assertEqual("Task 2 has end date in future. Can't schedule this task.", str(e.exception))
+
+
+class TestBackwardScheduler(TestCase):
+
+    def test_long_chain(self):
+        p = WBS()
+        tasks = [p // Task(i, estimate=4) for i in range(1500)]
+        for i in range(len(tasks) - 1):
+            tasks[i] >> tasks[i + 1]
+
+        s = pl.BackwardScheduler(end=datetime(2100, 1, 1)).calc(p).schedule
+
+        self.assertEqual(datetime(2100, 1, 1), s[1499].end)
+        for i in range(len(tasks) - 1):
+            self.assertGreaterEqual(s[i + 1].start, s[i].end)
+
+    def test_link_order(self):
+        """
+        Связь, добавленная через <<, переносит задачу в конец последователей всех ее предшественников.
+        От этого порядка зависит порядок расчета задач
+        """
+        p = WBS()
+        p // Task(1, estimate=12.5)
+        p // Task(2, estimate=8, resource='B')
+        p // Task(3)
+        p // Task(4, estimate=30, resource='A')
+        p[4] >> p[1]
+        p[4] >> p[2]
+        p[1] << p[3]
+
+        self.assertEqual([2, 1], [t.id for t in p[4].successors])
+
+        s = pl.BackwardScheduler(end=datetime(2031, 12, 6)).calc(p)
+
+        self.assertEqual(
+            [(datetime(2031, 12, 4, 10, 30), datetime(2031, 12, 6)), (datetime(2031, 12, 5), datetime(2031, 12, 6)),
+             (datetime(2031, 12, 4), datetime(2031, 12, 4)), (datetime(2031, 11, 28, 6), datetime(2031, 12, 4))],
+            [(t.start, t.end) for t in s.schedule.tasks]
+        )
+        self.assertEqual(
+            [(2, datetime(2031, 12, 5)), (1, datetime(2031, 12, 5)), (1, datetime(2031, 12, 4)),
+             (4, datetime(2031, 12, 3)), (4, datetime(2031, 12, 2)), (4, datetime(2031, 12, 1)),
+             (4, datetime(2031, 11, 28))],
+            [(r.task.id, r.date) for r in s.resource_usage.rows()]
+        )
+
+
+# noinspection PyProtectedMember
+class TestResourceUsage(TestCase):
+
+    def test_reserved(self):
+        from pjplan.schedule import _ResourceUsage
+
+        r1, r2 = pl.Resource('r1'), pl.Resource('r2')
+        t1, t2 = Task(1), Task(2)
+
+        usage = _ResourceUsage()
+        usage.reserve(r1, datetime(2026, 1, 1, 10), t1, 3)
+        usage.reserve(r1, datetime(2026, 1, 1), t2, 2)
+        usage.reserve(r1, datetime(2026, 1, 1), t1, 1)
+        usage.reserve(r2, datetime(2026, 1, 1), t1, 4)
+
+        self.assertEqual(6, usage.reserved(r1, datetime(2026, 1, 1, 15)))
+        self.assertEqual(4, usage.reserved(r1, datetime(2026, 1, 1), t1))
+        self.assertEqual(2, usage.reserved(r1, datetime(2026, 1, 1), t2))
+        self.assertEqual(4, usage.reserved(r2, datetime(2026, 1, 1)))
+        self.assertEqual(0, usage.reserved(r2, datetime(2026, 1, 2)))
+        self.assertEqual(4, len(usage.rows))
+
+    def test_rows(self):
+        """Часы в строках отчета имеют тот же тип, что и часы календаря ресурса"""
+        p = WBS()
+        p // Task(1, estimate=12, resource='r1')
+        p // Task(2, estimate=5, resource='r2')
+        resources = [pl.Resource('r1', pl.WeeklyCalendar(days=[0, 1, 2, 3, 4], units_per_day=8)),
+                     pl.Resource('r2', pl.FixedCalendar(2.5))]
+
+        s = pl.ForwardScheduler(start=datetime(2030, 1, 4), resources=resources).calc(p)
+
+        self.assertEqual(
+            [('r1', datetime(2030, 1, 4), 1, 8, int), ('r1', datetime(2030, 1, 7), 1, 4, int),
+             ('r2', datetime(2030, 1, 4), 2, 2.5, float), ('r2', datetime(2030, 1, 5), 2, 2.5, float)],
+            [(r.resource.name, r.date, r.task.id, r.units, type(r.units)) for r in s.resource_usage.rows()]
+        )
+
+    def test_active_on(self):
+        p = WBS()
+        p // Task(1, "1", estimate=8, resource='r1')
+        p // Task(2, "2", estimate=8, resource='r1')
+
+        s = pl.ForwardScheduler(start=datetime(2022, 1, 3)).calc(p)
+
+        self.assertEqual([s.schedule[1]], s.active_on(s.schedule[1].start))
+        self.assertEqual([s.schedule[2]], s.active_on(s.schedule[2].end))
@@ -1,7 +1,8 @@
+import sys
 from datetime import datetime
 from unittest import TestCase
 
-from pjplan import Task
+from pjplan import Task, TaskQuery, WBS
 # noinspection PyProtectedMember
 from pjplan.task import _ImmutableTaskList
 
@@ -86,10 +87,27 @@ class TaskCreateTestCase(TestCase):
         t2 = Task(2, parent=t1)
         self.assertRaises(RuntimeError, lambda: Task(3, parent=t2, children=[t1]))
 
+    def test_set_parent_self(self):
+        t1 = Task(1)
+        self.assertRaises(RuntimeError, lambda: setattr(t1, 'parent', t1))
+
     def test_create_unique_id_in_subtree(self):
         t1 = Task(1)
         self.assertRaises(RuntimeError, lambda: Task(1, parent=t1))
 
+    def test_deep_hierarchy(self):
+        root = t = Task(0)
+        for i in range(1, sys.getrecursionlimit() + 100):
+            t = t // Task(i)
+
+        self.assertEqual(len(root.all_children), len(t.all_parents))
+        self.assertIs(root, t.all_parents[-1])
+
+        wbs = WBS()
+        wbs // root
+        self.assertIs(t, wbs[t.id])
+        self.assertIn(str(t.id), repr(wbs))
+
 
 class TaskAttributesTestCase(TestCase):
     """Test for task attributes getters/setters"""
@@ -221,6 +239,35 @@ class TaskAttributesTestCase(TestCase):
         except RuntimeError:
             pass
 
+    def test_move_between_detached_trees(self):
+        t1 = Task(1)
+        t2 = t1 // Task(2)
+        t3 = t2 // Task(3)
+        t10 = Task(10)
+
+        t3.parent = t10
+
+        # Id 3 left tree of t1 and now belongs to tree of t10
+        t1 // Task(3)
+        self.assertRaises(RuntimeError, lambda: t10 // Task(3))
+
+        # Detached subtree with ids of parent tree can't be attached back
+        t2.parent = None
+        t2 // Task(1)
+        self.assertRaises(RuntimeError, lambda: t1.children.append(t2))
+
+    def test_set_children_not_unique_id_atomic(self):
+        t1 = Task(1)
+        t2 = t1 // Task(2)
+
+        try:
+            t1.children += [Task(3), Task(3)]
+            self.fail("RuntimeError expected")
+        except RuntimeError:
+            pass
+
+        self.assertEqual([t2], t1.children)
+
     def test_all_children(self):
         t1 = Task(id=1, name='1')
         t2 = Task(id=2, name='2')
@@ -316,6 +363,56 @@ class TaskAttributesTestCase(TestCase):
         self.assertEqual(2, t3.all_predecessors[0].id)
         self.assertEqual(1, t3.all_predecessors[1].id)
 
+    def test_cyclic_dependency(self):
+        t1 = Task(1)
+        t2 = Task(2, predecessors=[t1])
+        t3 = Task(3, predecessors=[t2])
+
+        self.assertRaises(RuntimeError, lambda: t1 << t3)
+        self.assertRaises(RuntimeError, lambda: t3 >> t1)
+        self.assertRaises(RuntimeError, lambda: t1.predecessors.append(t3))
+        self.assertRaises(RuntimeError, lambda: t1 << t1)
+        self.assertEqual(0, len(t1.predecessors))
+        self.assertEqual(0, len(t3.successors))
+
+    def test_link_against_order(self):
+        t1 = Task(1)
+        t2 = Task(2)
+        t3 = Task(3)
+
+        # Links added against creation order must reorder tasks
+        t2 >> t1
+        t3 >> t2
+
+        self.assertRaises(RuntimeError, lambda: t1 >> t3)
+        self.assertLess(t3._ord, t2._ord)
+        self.assertLess(t2._ord, t1._ord)
+
+
+    def test_rollup(self):
+        d = lambda day: datetime(2025, 1, day)
+        root = Task(1)
+        with root // Task(2) as t2:
+            t3 = t2 // Task(3, estimate=2, spent=1, start=d(3), end=d(5))
+            t4 = t2 // Task(4, estimate=3, start=d(2))
+        t5 = root // Task(5, end=d(10))
+
+        self.assertEqual((5, 1, d(2), d(5), 2), root.children[0].rollup)
+        self.assertEqual((5, 1, d(2), d(10), 3), root.rollup)
+        self.assertEqual((0, 0, None, d(10), 1), t5.rollup)
+
+        t4.estimate = 10
+        t3.end = d(20)
+        self.assertEqual(12, t2.rollup.estimate)
+        self.assertEqual(d(20), root.rollup.end)
+
+        t4.parent = t5
+        self.assertEqual((2, 1, d(3), d(20), 1), t2.rollup)
+        self.assertEqual((10, 0, d(2), None, 1), t5.rollup)
+
+        t2.milestone = True
+        self.assertEqual((10, 0, d(2), None, 2), root.rollup)
+
 
 class TaskOperationsTestCase(TestCase):
 
@@ -336,6 +433,61 @@ class TaskOperationsTestCase(TestCase):
         self.assertEqual(1, d['id'])
         self.assertEqual("name", d['name'])
 
+    # noinspection PyUnresolvedReferences
+    def test_custom_attributes(self):
+        t = Task(1, "name", arg1=1)
+        t.arg2 = 'a'
+
+        self.assertEqual(1, t.arg1)
+        self.assertEqual({'arg1': 1, 'arg2': 'a'}, t.__dict__)
+        self.assertEqual('a', t.to_dict()['arg2'])
+        self.assertEqual(1, t.clone().arg1)
+        self.assertFalse(hasattr(Task(2), 'arg1'))
+
+    def test_no_custom_attributes(self):
+        """Задача без пользовательских атрибутов не получает __dict__ при печати, to_dict и clone"""
+        import gc
+
+        t = Task(1, "name")
+        repr(t)
+        self.assertEqual({'id', 'name', 'resource', 'start', 'end', 'milestone', 'min_start'}, set(t.to_dict()))
+        t.clone()
+        self.assertEqual([], [r for r in gc.get_referents(t) if type(r) is dict])
+
+        t.print_color = None
+        repr(t)
+        self.assertIsNone(t.to_dict()['print_color'])
+
+    def test_cached_views(self):
+        t = Task(1)
+        children, predecessors = t.children, t.predecessors
+
+        t // Task(2)
+        t << Task(3)
+
+        self.assertIs(children, t.children)
+        self.assertIs(predecessors, t.predecessors)
+        self.assertEqual([2], [ch.id for ch in children])
+        self.assertEqual([3], [p.id for p in predecessors])
+
+    def test_large_fan_out(self):
+        hub = Task(0)
+        tasks = [Task(i) for i in range(1, 201)]
+        hub >> tasks
+        for t in tasks[::2]:
+            hub.successors.remove(t)
+
+        self.assertEqual(tasks[1::2], hub.successors)
+        self.assertEqual(tasks[1], hub.successors[0])
+        self.assertEqual(1, hub.successors.index(tasks[3]))
+        self.assertTrue(tasks[1] in hub.successors)
+        self.assertFalse(tasks[0] in hub.successors)
+        self.assertEqual([], tasks[0].predecessors)
+        self.assertEqual([hub], tasks[1].predecessors)
+
+        hub.successors = tasks[:3] + tasks[:3]
+        self.assertEqual(tasks[:3], hub.successors)
+
 
 # noinspection PyUnresolvedReferences
 class ImmutableListTestCase(TestCase):
@@ -391,6 +543,22 @@ class ImmutableListTestCase(TestCase):
 
         self.assertEqual([t2, t3], lst(resource_like_="R*"))
 
+    def test_search_query(self):
+        t1 = Task(1, name="MVP 1", resource="Dev", estimate=10)
+        t2 = Task(2, name="MVP 2", resource="Dev", estimate=4)
+        t3 = Task(3, resource="QA", estimate=12, tag=[1])
+
+        lst = _ImmutableTaskList([t1, t2, t3])
+        q = TaskQuery(resource='Dev', estimate_gt_=8)
+
+        self.assertEqual([t1], lst(q))
+        self.assertTrue(q(t1))
+        self.assertFalse(q(t3))
+        self.assertEqual([t1, t3], lst(estimate_gt_=8))
+        self.assertEqual([t2], lst(name_like_="2$", resource_in_={"Dev", "QA"}))
+        self.assertEqual([t3], lst(tag_in_=[[1], [2]]))
+        self.assertEqual([t1, t2], lst(tag_is_none_=True))
+
     def test_search_not_like(self):
         t1 = Task(1)
         t2 = Task(2, name="1 MVP 3123123")
@@ -455,3 +623,19 @@ class ChildrenListTestCase(TestCase):
         self.assertEqual(2, t1.children[0].id)
         self.assertEqual(3, t1.children[1].id)
 
+
+    def test_children_move(self):
+        t = Task(0)
+        children = [t // Task(i) for i in range(1, 101)]
+
+        t.children.move([children[0], children[1]], before=children[50])
+        self.assertEqual(children[2:50] + children[:2] + children[50:], t.children)
+
+        t.children.move([children[98], children[97]], after=children[0])
+        self.assertEqual([1, 98, 99, 2], [ch.id for ch in t.children[48:52]])
+        self.assertRaises(RuntimeError, lambda: t.children.move(children[5], before=children[5]))
+        self.assertEqual(100, len(t.children))
+
+        t.children.reorder([100, 3])
+        self.assertEqual([100, 3, 4], [ch.id for ch in t.children[:3]])
+        self.assertRaises(RuntimeError, lambda: t.children.reorder([101]))
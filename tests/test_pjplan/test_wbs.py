@@ -1,3 +1,5 @@
+import gc
+import weakref
 from datetime import datetime
 from unittest import TestCase
 
@@ -70,6 +72,90 @@ class TestWBS(TestCase):
         self.assertIsNotNone(prj2[2])
         self.assertIsNotNone(prj2[3])
 
+    def test_clone_links(self):
+        external = Task('e')
+        with WBS() as wbs:
+            with wbs // Task(1) as t1:
+                t2 = t1 // Task(2)
+            t3 = wbs // Task(3)
+            t3 >> t2
+            t2 >> external
+            t1 >> t3
+
+        prj = wbs.clone()
+
+        self.assertEqual([1, 2, 3], [t.id for t in prj.tasks])
+        self.assertEqual([prj[1]], prj[3].predecessors)
+        self.assertEqual([prj[3]], prj[2].predecessors)
+        self.assertEqual([external], prj[2].successors)
+        self.assertEqual([wbs[2], prj[2]], external.predecessors)
+        self.assertEqual([1, 3, 2], [t.id for t in prj.topological_order()])
+        self.assertLess(prj[2]._ord, external._ord)
+
+        prj[2].successors = []
+        self.assertEqual([external], wbs[2].successors)
+        self.assertEqual([wbs[2]], external.predecessors)
+
+        sub = wbs.subtree([t1, t2])
+        self.assertEqual([1, 2], [t.id for t in sub.roots])
+        self.assertEqual([], sub[1].children)
+        self.assertEqual([], sub[2].predecessors)
+
+    def test_clone_links_order(self):
+        external = Task('e')
+        wbs = WBS()
+        tasks = [wbs // Task(i) for i in range(1, 6)]
+        tasks[2] >> [tasks[4], tasks[1], external, tasks[3]]
+        tasks[1] << tasks[0]
+        tasks[4] << [tasks[3], tasks[0]]
+        tasks[2] << tasks[0]
+
+        prj = wbs.clone()
+
+        for t in wbs.tasks:
+            self.assertEqual([v.id for v in t.predecessors], [v.id for v in prj[t.id].predecessors])
+            self.assertEqual([v.id for v in t.successors], [v.id for v in prj[t.id].successors])
+        self.assertEqual(['e', 4, 2, 5], [v.id for v in prj[3].successors])
+
+        # noinspection PyProtectedMember
+        copy = wbs._schedule_copy()
+        self.assertEqual(['e', 2, 4, 5], [v.id for v in copy[3].successors])
+        self.assertEqual([3, 4, 1], [v.id for v in copy[5].predecessors])
+
+    def test_dispose(self):
+        external = Task('e')
+        wbs = WBS()
+        with wbs // Task(1) as t1:
+            t2 = t1 // Task(2)
+        t1 >> wbs // Task(3) >> external
+        wbs.create_index('name')
+        self.assertEqual(3, len(t2.parent.children[0].wbs.tasks))
+
+        refs = [weakref.ref(wbs), weakref.ref(t1), weakref.ref(t2)]
+        gc.disable()
+        try:
+            wbs.dispose()
+            self.assertIsNone(t2.parent)
+            self.assertEqual([], external.predecessors)
+            del wbs, t1, t2
+            self.assertEqual([None, None, None], [r() for r in refs])
+        finally:
+            gc.enable()
+
+    def test_task_indexes(self):
+        wbs = WBS()
+        for i in range(5):
+            wbs // Task(i)
+        wbs[2] // Task(5)
+        wbs.remove(wbs[1])
+        wbs[3].parent = wbs[5]
+        Task(6, parent=wbs[0])
+
+        self.assertEqual(6, len(wbs._tasks_by_idx()))
+        self.assertEqual([0, 1, 2, 3, 4, 5], sorted(t._idx for t in wbs.tasks))
+        for t in wbs.tasks:
+            self.assertIs(t, wbs._tasks_by_idx()[t._idx])
+
     def test_append(self):
         prj = WBS()
         prj // Task(1)
@@ -215,6 +301,54 @@ class TestWBS(TestCase):
         self.assertTrue(prj.remove(prj[2]))
         self.assertEqual(1, len(prj.tasks))
 
+    def test_get_by_id_after_remove(self):
+        with WBS() as prj:
+            with prj // Task(1) as t1:
+                t1 // Task(2)
+                t1 // Task(3)
+            prj // Task(4)
+
+        prj.remove(prj[1])
+
+        self.assertRaises(RuntimeError, lambda: prj[1])
+        self.assertRaises(RuntimeError, lambda: prj[2])
+        self.assertEqual(4, prj[4].id)
+
+        prj.remove_all(id=4)
+        self.assertRaises(RuntimeError, lambda: prj[4])
+        self.assertEqual(0, len(prj.tasks))
+
+    def test_get_by_id_after_move(self):
+        with WBS() as prj:
+            t1 = prj // Task(1)
+            t2 = prj // Task(2)
+            t3 = t1 // Task(3)
+
+        t3.parent = t2
+        t1.children += [Task(4)]
+        prj.roots = [t2]
+
+        self.assertEqual(t2, prj[2])
+        self.assertEqual(t3, prj[3])
+        self.assertRaises(RuntimeError, lambda: prj[1])
+        self.assertRaises(RuntimeError, lambda: prj[4])
+
+    def test_contains(self):
+        prj = WBS()
+        t1 = prj // Task(1)
+
+        self.assertTrue(1 in prj)
+        self.assertTrue(t1 in prj)
+        self.assertFalse(2 in prj)
+        self.assertFalse(Task(1) in prj)
+
+        prj.remove(t1)
+        self.assertFalse(t1 in prj)
+        self.assertIsNone(t1.wbs)
+
+        prj // t1
+        self.assertTrue(t1 in prj)
+
     def test_detached_2(self):
         with WBS() as prj0:
             t1 = prj0 // Task(2)
@@ -293,6 +427,409 @@ class TestWBS(TestCase):
         self.assertEqual(subtree, subtree[6].predecessors[0].wbs)
         self.assertEqual(subtree, subtree[7].predecessors[0].wbs)
 
+    def test_topological_order(self):
+        with WBS() as wbs:
+            t1 = wbs // Task(1)
+            with wbs // Task(2) as t2:
+                t3 = t2 // Task(3)
+            t4 = wbs // Task(4)
+
+        t4 >> t3
+        t3 >> t1
+        t1 >> t2
+
+        self.assertEqual([t4, t3, t1, t2], wbs.topological_order())
+
+    def test_topological_order_cache(self):
+        with WBS() as wbs:
+            t1 = wbs // Task(1)
+            t2 = wbs // Task(2)
+        order = wbs.topological_order()
+        self.assertEqual([t1, t2], order)
+
+        t1.name = 'name'
+        t2.start = datetime(2024, 1, 1)
+        self.assertIs(order._list, wbs.topological_order()._list)
+
+        t2 >> t1
+        self.assertEqual([t2, t1], wbs.topological_order())
+        t1.predecessors = []
+        t3 = wbs // Task(3)
+        t3 >> t2
+        order = list(wbs.topological_order())
+        self.assertEqual({t1, t2, t3}, set(order))
+        self.assertLess(order.index(t3), order.index(t2))
+        wbs.remove(t3)
+        self.assertEqual({t1, t2}, set(wbs.topological_order()))
+
+    def test_all_predecessors_cache_invalidation(self):
+        with WBS() as wbs:
+            t1 = wbs // Task(1)
+            t2 = wbs // Task(2, predecessors=[t1])
+            t3 = wbs // Task(3, predecessors=[t2])
+
+        self.assertEqual([t2, t1], t3.all_predecessors)
+        self.assertTrue(t3.depends_on(t1))
+        self.assertFalse(t1.depends_on(t3))
+
+        t2.predecessors.remove(t1)
+
+        self.assertEqual([t2], t3.all_predecessors)
+        self.assertEqual([], t1.all_successors)
+        self.assertFalse(t3.depends_on(t1))
+
+    def test_all_predecessors_cache_other_wbs(self):
+        wbs1, wbs2 = WBS(), WBS()
+        t1 = wbs1 // Task(1)
+        t2 = wbs1 // Task(2, predecessors=[t1])
+        t3 = wbs2 // Task(3)
+        t4 = wbs2 // Task(4)
+        external = Task(5)
+
+        self.assertEqual([t1], t2.all_predecessors)
+        t4 << t3
+        self.assertIsNotNone(wbs1._closures().get(t2, False))
+
+        t1 << t4
+        self.assertEqual([t1, t4, t3], t2.all_predecessors)
+        t3 << external
+        self.assertEqual([t1, t4, t3, external], t2.all_predecessors)
+        t4.predecessors.remove(t3)
+        self.assertEqual([t1, t4], t2.all_predecessors)
+
+
+    # noinspection PyUnresolvedReferences
+    def test_index(self):
+        with WBS() as wbs:
+            t1 = wbs // Task(1, resource='Dev', estimate=8)
+            t2 = t1 // Task(2, resource='QA', estimate=2, tag='a')
+            t3 = wbs // Task(3, resource='Dev', estimate=5)
+
+        wbs.create_index('resource')
+        wbs.create_index('estimate')
+        wbs.create_index('parent_id')
+        wbs.create_index('tag')
+
+        self.assertEqual([t1, t3], wbs.tasks(resource='Dev'))
+        self.assertEqual([t2, t3], wbs.tasks(estimate_lt_=6))
+        self.assertEqual([t2], wbs.tasks(parent_id=1))
+        self.assertEqual([t1, t3], wbs.tasks(tag_is_none_=True))
+
+        t2.resource = 'Dev'
+        t3.tag = 'a'
+        t3.parent = t1
+        wbs.tasks(id_in_=[1, 2]).estimate = 1
+        self.assertEqual([t1, t2, t3], wbs.tasks(resource='Dev'))
+        self.assertEqual([t2, t3], wbs.tasks(tag='a'))
+        self.assertEqual([t2, t3], wbs.tasks(parent_id=1))
+        self.assertEqual([t1, t2], wbs.tasks(estimate_le_=1))
+
+        del t3.tag
+        wbs.remove(t2)
+        self.assertEqual([t1, t3], wbs.tasks(resource_in_=['Dev']))
+        self.assertEqual([], wbs.tasks(tag='a'))
+
+        t4 = t1 // Task(4, resource='Dev')
+        t1.children.move(t4, before=t3)
+        self.assertEqual([t1, t4, t3], wbs.tasks(resource='Dev'))
+
+    def test_watching(self):
+        wbs1, wbs2 = WBS(), WBS()
+        t1 = wbs1 // Task(1, resource='Dev')
+        t2 = wbs2 // Task(2, resource='Dev')
+
+        wbs1.create_index('resource')
+        self.assertTrue(wbs1._watching)
+        self.assertFalse(wbs2._watching)
+
+        t1.resource = 'QA'
+        t2.resource = 'QA'
+        self.assertEqual([t1], wbs1.tasks(resource='QA'))
+        self.assertEqual([t2], wbs2.tasks(resource='QA'))
+
+        t3 = t2 // Task(3, estimate=1)
+        self.assertEqual(1, t2.rollup.estimate)
+        t3.estimate = 2
+        self.assertEqual(2, t2.rollup.estimate)
+        self.assertFalse(wbs2._watching)
+
+        self.assertIsNot(Task, type(t1))
+        self.assertIs(Task, type(wbs2 // Task(4)))
+        t5 = wbs1 // Task(5)
+        self.assertIsNot(Task, type(t5))
+        wbs1.remove(t5)
+        self.assertIs(Task, type(t5))
+
+        wbs1.drop_index('resource')
+        self.assertFalse(wbs1._watching)
+        self.assertIs(Task, type(t1))
+
+        with wbs1.batch():
+            self.assertIsNot(Task, type(t1))
+            t1.resource = 'Dev'
+        self.assertIs(Task, type(t1))
+
+    def test_iter_tasks(self):
+        with WBS() as wbs:
+            with wbs // Task(1) as t1:
+                t1 // Task(2) // Task(3)
+                t1 // Task(4)
+            wbs // Task(5)
+
+        self.assertEqual([1, 2, 3, 4, 5], [t.id for t in wbs.iter_tasks()])
+        self.assertEqual([3, 2, 4, 1, 5], [t.id for t in wbs.iter_tasks('post')])
+        self.assertEqual([1, 5, 2, 4, 3], [t.id for t in wbs.iter_tasks('bfs')])
+        self.assertEqual([1, 2, 4, 5], [t.id for t in wbs.iter_tasks(prune=lambda t: t.id == 2)])
+        self.assertEqual([2, 4, 1, 5], [t.id for t in wbs.iter_tasks('post', prune=lambda t: t.id == 2)])
+        self.assertRaises(RuntimeError, lambda: list(wbs.iter_tasks('dfs')))
+
+    def test_ancestry(self):
+        with WBS() as wbs:
+            t1 = wbs // Task(1)
+            t2 = t1 // Task(2)
+            t3 = t2 // Task(3)
+            t4 = t1 // Task(4)
+            t5 = wbs // Task(5)
+
+        self.assertTrue(wbs.is_ancestor(t1, t3))
+        self.assertFalse(wbs.is_ancestor(t3, t1))
+        self.assertFalse(wbs.is_ancestor(t1, t1))
+        self.assertFalse(wbs.is_ancestor(t4, t3))
+        self.assertEqual(4, wbs.subtree_size(t1))
+        self.assertEqual([t2, t3, t4], wbs.subtree_tasks(t1))
+        self.assertEqual([], wbs.subtree_tasks(t5))
+        self.assertRaises(RuntimeError, lambda: setattr(t1, 'parent', t3))
+        self.assertRaises(RuntimeError, lambda: t3 >> t1)
+        self.assertRaises(RuntimeError, lambda: wbs.is_ancestor(t1, Task(6)))
+
+        t2.parent = t5
+        self.assertFalse(wbs.is_ancestor(t1, t3))
+        self.assertTrue(wbs.is_ancestor(t5, t3))
+        self.assertEqual([t2, t3], wbs.subtree_tasks(t5))
+        self.assertEqual(2, wbs.subtree_size(t1))
+
+    def test_from_records(self):
+        wbs = WBS.from_records([
+            dict(id=1, name='Root'),
+            dict(id=2, name='Child', parent_id=1, estimate=8, tag='a'),
+            dict(id=3, parent_id=1, predecessor_ids=[2]),
+            dict(id=4, predecessor_ids=[3, 2, 3]),
+        ])
+
+        self.assertEqual([1, 2, 3, 4], [t.id for t in wbs.tasks])
+        self.assertEqual([wbs[2], wbs[3]], wbs[1].children)
+        self.assertEqual(8, wbs[2].estimate)
+        self.assertEqual('a', wbs[2].tag)
+        self.assertEqual([wbs[3], wbs[2]], wbs[4].predecessors)
+        self.assertEqual([wbs[3], wbs[4]], wbs[2].successors)
+        self.assertEqual([1, 2, 3, 4], [t.id for t in wbs.topological_order()])
+        self.assertRaises(RuntimeError, lambda: wbs[4] >> wbs[2])
+
+    def test_from_records_errors(self):
+        with self.assertRaises(RuntimeError) as e:
+            WBS.from_records([
+                dict(id=1),
+                dict(id=1),
+                dict(id=2, parent_id=5),
+                dict(id=3, parent_id=4),
+                dict(id=4, parent_id=3),
+                dict(id=6, predecessor_ids=[7]),
+                dict(id=7, predecessor_ids=[6]),
+                dict(id=8, parent_id=9, predecessor_ids=[9]),
+                dict(id=9, predecessor_ids=[8, 10]),
+                dict(id=10, predecessor_ids=[]),
+                dict(id=11, predecessor_ids=[7]),
+            ])
+
+        errors = str(e.exception).split('\n')[1:]
+        self.assertEqual([
+            'Duplicate task id 1',
+            'Task 2: parent 5 not found',
+            'Cyclic parents of tasks [3, 4]',
+            'Task 8: parent 9 can\'t be predecessor',
+            'Task 9: child 8 can\'t be predecessor',
+            'Cyclic dependency between tasks [6, 7]',
+        ], errors)
+
+    def test_active_between(self):
+        d = lambda day: datetime(2025, 1, day)
+        with WBS() as wbs:
+            t1 = wbs // Task(1, start=d(1), end=d(10))
+            t2 = t1 // Task(2, start=d(1), end=d(3))
+            t3 = t1 // Task(3, start=d(5), end=d(10))
+            wbs // Task(4, start=d(2))
+            t5 = wbs // Task(5, start=d(12), end=d(12))
+
+        self.assertEqual([t1, t2], wbs.tasks.active_between(d(2), d(4)))
+        self.assertEqual([t1, t3], wbs.tasks.active_between(d(10), d(11)))
+        self.assertEqual([t5], wbs.tasks.active_between(d(12), d(20)))
+        self.assertEqual([], wbs.tasks.active_between(d(13), d(20)))
+
+        t2.end = d(6)
+        t5.start = d(4)
+        self.assertEqual([t1, t2, t3, t5], wbs.tasks.active_between(d(5), d(5)))
+
+        t3.parent = None
+        self.assertEqual([t1, t2, t5, t3], wbs.tasks.active_between(d(5), d(5)))
+        self.assertEqual([t1, t2, t5, t3], wbs.tasks(start_le_=d(5), end_ge_=d(5)))
+
+
+    def test_batch(self):
+        wbs = WBS()
+        tasks = [wbs // Task(i) for i in range(5)]
+
+        with wbs.batch():
+            for i in range(4):
+                tasks[i + 1] >> tasks[i]
+            tasks[0].name = 'last'
+
+        for i in range(4):
+            self.assertEqual([tasks[i + 1]], tasks[i].predecessors)
+            self.assertLess(tasks[i + 1]._ord, tasks[i]._ord)
+        self.assertEqual('last', tasks[0].name)
+
+    def test_batch_rollback(self):
+        wbs = WBS()
+        wbs.create_index('resource')
+        t1 = wbs // Task(1, resource='a')
+        t2 = wbs // Task(2)
+        t3 = t2 // Task(3)
+        t1 >> t2
+
+        with self.assertRaises(RuntimeError):
+            with wbs.batch():
+                t1.resource = 'b'
+                t1.custom = 1
+                t3.parent = t1
+                wbs // Task(4)
+                t3 >> t1
+                t2 >> t3
+        self._check_rolled_back(wbs)
+
+        with self.assertRaises(KeyError):
+            with wbs.batch():
+                t1.resource = 'b'
+                wbs.remove(t2)
+                raise KeyError()
+        self._check_rolled_back(wbs)
+
+        with self.assertRaises(RuntimeError) as e:
+            with wbs.batch():
+                t3 >> t2
+        self.assertEqual("Task 3: can't set parent 2 as successor", str(e.exception))
+        self._check_rolled_back(wbs)
+
+    def test_batch_other_wbs(self):
+        wbs1, wbs2 = WBS(), WBS()
+        t1 = wbs1 // Task(1)
+        t2 = wbs1 // Task(2)
+        t3 = wbs2 // Task(3)
+        t4 = wbs2 // Task(4)
+
+        with self.assertRaises(KeyError):
+            with wbs1.batch():
+                t1 >> t2
+                t3 >> t4
+                t3.name = 'a'
+                raise KeyError()
+        self.assertEqual([], t1.successors)
+        self.assertEqual([t4], t3.successors)
+        self.assertEqual('a', t3.name)
+
+        with wbs1.batch():
+            with self.assertRaises(RuntimeError):
+                with wbs1.batch():
+                    pass
+            with self.assertRaises(RuntimeError):
+                t1 >> t3
+            with wbs2.batch():
+                t4.name = 'b'
+            self.assertEqual('b', t4.name)
+        self.assertEqual([], t1.successors)
+
+    def _check_rolled_back(self, wbs):
+        t1, t2, t3 = wbs[1], wbs[2], wbs[3]
+        self.assertEqual([1, 2, 3], [t.id for t in wbs.tasks])
+        self.assertEqual([t1, t2], wbs.roots)
+        self.assertEqual(t2, t3.parent)
+        self.assertEqual([t2], t1.successors)
+        self.assertEqual([], t3.successors)
+        self.assertEqual('a', t1.resource)
+        self.assertFalse(hasattr(t1, 'custom'))
+        self.assertEqual([t1], wbs.tasks(resource='a'))
+        self.assertEqual([], wbs.tasks(resource='b'))
+
+    def test_changes(self):
+        wbs = WBS()
+        t1 = wbs // Task(1)
+        t2 = wbs // Task(2)
+        self.assertEqual(0, wbs.change_version)
+        with self.assertRaises(RuntimeError):
+            wbs.changes_since(0)
+
+        notified = []
+        wbs.subscribe(notified.append)
+        t3 = t1 // Task(3)
+        t3.estimate = 5
+        t1 >> t2
+        t3.parent = t2
+        t2.predecessors = []
+
+        changes = wbs.changes_since(0)
+        self.assertEqual([1, 2, 3, 4, 5], [c.version for c in changes])
+        self.assertEqual(['add', 'attribute', 'link', 'parent', 'unlink'], [c.kind for c in changes])
+        self.assertEqual((t3, 'estimate', None, 5), changes[1][2:])
+        self.assertEqual((t2, None, None, t1), changes[2][2:])
+        self.assertEqual((t3, None, t1, t2), changes[3][2:])
+        self.assertEqual((t2, None, t1, None), changes[4][2:])
+        self.assertEqual([[c] for c in changes], notified)
+
+        with self.assertRaises(RuntimeError):
+            with wbs.batch():
+                t1.name = 'a'
+                wbs.remove(t3)
+                t2 >> t1
+                t1 >> t2
+        self.assertEqual(5, len(notified))
+        self.assertEqual([], wbs.changes_since(5))
+
+        with wbs.batch():
+            t1.name = 'a'
+            t1 >> t2
+        self.assertEqual(6, len(notified))
+        self.assertEqual(['attribute', 'link'], [c.kind for c in notified[-1]])
+        self.assertEqual(notified[-1], wbs.changes_since(5))
+        self.assertLess(5, notified[-1][0].version)
+
+        wbs.clear_changes()
+        self.assertEqual([], wbs.changes_since(0))
+        wbs.unsubscribe(notified.append)
+        t1.name = 'b'
+        self.assertEqual(6, len(notified))
+        self.assertEqual(1, len(wbs.changes_since(0)))
+
+    def test_changes_other_wbs(self):
+        wbs1, wbs2 = WBS(), WBS()
+        t1 = wbs1 // Task(1)
+        t2 = wbs2 // Task(2)
+        t3 = wbs2 // Task(3)
+        wbs1.track_changes()
+
+        t2 >> t3
+        t2 >> t1
+        self.assertEqual(['link'], [c.kind for c in wbs1.changes_since(0)])
+        self.assertEqual((t1, None, None, t2), wbs1.changes_since(0)[0][2:])
+
+        notified = []
+        wbs1.subscribe(notified.append)
+        wbs1.stop_tracking_changes()
+        t1.name = 'a'
+        t1.predecessors = []
+        self.assertEqual(0, wbs1.change_version)
+        self.assertEqual([], notified)
+        with self.assertRaises(RuntimeError):
+            wbs1.changes_since(0)
+
 
 class CriticalPathTestCase(TestCase):
 
@@ -334,3 +871,4 @@ class CriticalPathTestCase(TestCase):
         self.assertTrue(wbs[2] not in path)
         self.assertTrue(wbs[1] in path)
         self.assertTrue(wbs[3] in path)
+